@@ -0,0 +1,133 @@
+# benchmarks/bench_gitignore.py
+#
+# 深くネストし、数百の .gitignore を含む合成ツリーで --gitignore の走査を計測するベンチマーク。
+# 比較対象として、枝刈りせずに全ファイルを列挙し、祖先の .gitignore のルールを
+# 1行ずつ照合する素朴な実装も計測する。
+#
+#   PYTHONPATH=src python benchmarks/bench_gitignore.py --depth 4 --fanout 5
+
+import argparse
+import os
+import re
+import shutil
+import tempfile
+import time
+
+from codeaggregator.finder import iter_files
+from codeaggregator.gitignore import GitIgnore, parse_line, translate
+
+RULES = [
+    '*.log', '*.tmp', '!keep.log', 'build/', '/dist', 'node_modules/', '**/cache/**',
+    'gen_*.py', '*.o', '!important.o', 'docs/**/*.pdf', '.env',
+]
+
+
+def make_tree(root, depth, fanout, files_per_dir):
+    """
+    depth 階層、各ディレクトリに fanout 個のサブディレクトリを持つツリーを作成します。
+    すべてのディレクトリに .gitignore を置き、一部は除外されるディレクトリを含みます。
+    """
+    count = 0
+    rule_files = 0
+    stack = [(root, 0)]
+    while stack:
+        path, level = stack.pop()
+        with open(os.path.join(path, '.gitignore'), 'w') as f:
+            f.write('\n'.join(RULES[level % 3:] + [f'local_{level}_*.py']) + '\n')
+        rule_files += 1
+        for i in range(files_per_dir):
+            ext = ['py', 'log', 'tmp', 'o', 'txt'][i % 5]
+            with open(os.path.join(path, f'file{i}.{ext}'), 'w') as f:
+                f.write('x\n')
+            count += 1
+        if level >= depth:
+            continue
+        for name in ['node_modules', 'build']:
+            ignored = os.path.join(path, name)
+            os.makedirs(ignored)
+            for i in range(files_per_dir * 2):
+                with open(os.path.join(ignored, f'dep{i}.js'), 'w') as f:
+                    f.write('x\n')
+                count += 1
+        for i in range(fanout):
+            sub = os.path.join(path, f'd{i}')
+            os.makedirs(sub)
+            stack.append((sub, level + 1))
+    return count, rule_files
+
+
+def naive_walk(root):
+    """
+    枝刈りせずに全ファイルを列挙し、祖先の .gitignore のルールを1行ずつ照合します。
+    """
+    rules_by_dir = {}
+    result = []
+    for dirpath, dirs, files in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        rel_dir = '' if rel_dir == '.' else rel_dir.replace(os.sep, '/') + '/'
+        rules = []
+        if '.gitignore' in files:
+            with open(os.path.join(dirpath, '.gitignore')) as f:
+                for line in f:
+                    rule = parse_line(line)
+                    if rule:
+                        pattern, negate, dir_only, anchored = rule
+                        body = translate(pattern)
+                        if not anchored:
+                            body = '(?:.*/)?' + body
+                        rules.append((re.compile(body + r'\Z'), negate, dir_only))
+        rules_by_dir[rel_dir] = rules
+        for file in files:
+            if file.startswith('.'):
+                continue
+            rel = rel_dir + file
+            ignored = False
+            # 祖先ディレクトリを浅い順にたどり、最後に一致したルールを採用する
+            parts = rel.split('/')
+            for depth in range(len(parts)):
+                prefix = '/'.join(parts[:depth]) + '/' if depth else ''
+                for regex, negate, dir_only in rules_by_dir.get(prefix, ()):
+                    for target_depth in range(depth + 1, len(parts) + 1):
+                        target = '/'.join(parts[:target_depth])
+                        is_dir = target_depth < len(parts)
+                        if dir_only and not is_dir:
+                            continue
+                        if regex.match(target[len(prefix):]):
+                            ignored = not negate
+            if not ignored:
+                result.append(rel)
+    return result
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {elapsed * 1000:10.1f} ms  files={len(result)}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='--gitignore 走査のベンチマーク')
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--fanout', type=int, default=4)
+    parser.add_argument('--files-per-dir', type=int, default=10)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='bench_gitignore_')
+    try:
+        count, rule_files = make_tree(root, args.depth, args.fanout, args.files_per_dir)
+        print(f"files={count} rule_files={rule_files} depth={args.depth} fanout={args.fanout}")
+
+        timed('walk (no gitignore)', lambda: list(iter_files(root)))
+        timed('naive per-file rules', lambda: naive_walk(root))
+        timed('gitignore (cold)', lambda: list(iter_files(root, gitignore=True)))
+        warm = GitIgnore(root)
+        list(iter_files(root, gitignore=warm))
+        timed('gitignore (warm cache)', lambda: list(iter_files(root, gitignore=warm)))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
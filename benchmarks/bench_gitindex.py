@@ -0,0 +1,129 @@
+# benchmarks/bench_gitindex.py
+#
+# 合成リポジトリで --git-tracked (.git/index の解析) とディレクトリ走査 (iter_files) を比較するベンチマーク。
+# インデックスは git を使わずにこのスクリプトで直接書き出すため、git がなくても実行できる。
+# --untracked を指定すると、インデックスに登録しないファイル (node_modules/ など) も作成する。
+#
+#   PYTHONPATH=src python benchmarks/bench_gitindex.py --files 100000
+
+import argparse
+import os
+import shutil
+import struct
+import tempfile
+import time
+
+from codeaggregator.finder import iter_files, filter_paths
+from codeaggregator.gitindex import read_index
+
+ENTRY = struct.Struct('>10I20sH')
+
+
+def make_tree(root, files, per_dir):
+    """
+    per_dir 個ずつファイルを置いたディレクトリを2階層に並べ、相対パスのリストを返します。
+    """
+    paths = []
+    for i in range(files):
+        d = i // per_dir
+        rel_dir = f'pkg{d // 32:03d}/mod{d % 32:02d}'
+        if i % per_dir == 0:
+            os.makedirs(os.path.join(root, rel_dir), exist_ok=True)
+        rel = f'{rel_dir}/file{i % per_dir:03d}.py'
+        with open(os.path.join(root, rel), 'w') as f:
+            f.write('x\n')
+        paths.append(rel)
+    return sorted(paths)
+
+
+def make_untracked(root, files, per_dir):
+    """
+    インデックスに登録しないファイルを node_modules/ 配下に作成します。
+    """
+    for i in range(files):
+        rel_dir = os.path.join('node_modules', f'dep{i // per_dir:04d}')
+        if i % per_dir == 0:
+            os.makedirs(os.path.join(root, rel_dir))
+        with open(os.path.join(root, rel_dir, f'index{i % per_dir:03d}.js'), 'w') as f:
+            f.write('x\n')
+
+
+def encode_varint(value):
+    out = bytearray([value & 0x7F])
+    value >>= 7
+    while value:
+        value -= 1
+        out.insert(0, 0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(out)
+
+
+def write_index(root, paths, version):
+    """
+    paths を登録したバージョン version (2 または 4) のインデックスを .git/index に書き出します。
+    """
+    os.makedirs(os.path.join(root, '.git'), exist_ok=True)
+    chunks = [b'DIRC', struct.pack('>II', version, len(paths))]
+    previous = b''
+    for path in paths:
+        name = path.encode('utf-8')
+        st = os.stat(os.path.join(root, path))
+        entry = ENTRY.pack(0, 0, int(st.st_mtime), 0, st.st_dev & 0xFFFFFFFF, st.st_ino & 0xFFFFFFFF,
+                           0o100644, 0, 0, st.st_size, b'\0' * 20, min(len(name), 0xFFF))
+        if version == 4:
+            common = 0
+            while common < min(len(name), len(previous)) and name[common] == previous[common]:
+                common += 1
+            chunks.append(entry + encode_varint(len(previous) - common) + name[common:] + b'\0')
+            previous = name
+        else:
+            length = ENTRY.size + len(name)
+            chunks.append(entry + name + b'\0' * (((length + 8) & ~7) - length))
+    # 末尾のチェックサムは解析に使わないので 0 で埋める
+    chunks.append(b'\0' * 20)
+    with open(os.path.join(root, '.git', 'index'), 'wb') as f:
+        f.write(b''.join(chunks))
+
+
+def timed(label, func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<24} {best * 1000:10.1f} ms  files={len(result)}")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='--git-tracked のベンチマーク')
+    parser.add_argument('--files', type=int, default=100000)
+    parser.add_argument('--untracked', type=int, default=0)
+    parser.add_argument('--per-dir', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='bench_gitindex_')
+    try:
+        paths = make_tree(root, args.files, args.per_dir)
+        make_untracked(root, args.untracked, args.per_dir)
+        print(f"files={len(paths)} untracked={args.untracked} per_dir={args.per_dir}")
+
+        timed('walk (iter_files)', lambda: list(iter_files(root)), args.repeat)
+        if args.untracked:
+            timed('walk -I node_modules', lambda: list(iter_files(root, ignore_patterns=['node_modules'])),
+                  args.repeat)
+        for version in (2, 4):
+            write_index(root, paths, version)
+            print(f"index v{version}: {os.path.getsize(os.path.join(root, '.git', 'index'))} bytes")
+            timed(f'git index v{version}', lambda: list(filter_paths(
+                root, (entry.path for entry in read_index(root)))), args.repeat)
+            timed(f'git index v{version} -P *.py', lambda: list(filter_paths(
+                root, (entry.path for entry in read_index(root)), patterns=['*.py'])), args.repeat)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# benchmarks/bench_grep.py
+#
+# 合成したコーパスで --grep の候補の絞り込みを計測するベンチマーク。
+# 索引なし (すべて読み込んで照合)、索引の作成、作成済みの索引での検索、一部のファイルを変更した後の検索を比較し、
+# すべての場合で同じファイルが一致することも確認する。
+#
+#   PYTHONPATH=src python benchmarks/bench_grep.py --files 20000 --file-size 4096 --hit-rate 0.005
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from codeaggregator.finder import iter_files
+from codeaggregator.trigram import ContentFilter, TrigramIndex, index_path
+
+NEEDLE = 'PaymentGatewayClient'
+
+
+def make_corpus(root, files, file_size, hit_rate, seed):
+    """
+    識別子をランダムに並べたファイルを files 個作成し、hit_rate の割合のファイルに NEEDLE を含めます。
+    """
+    rng = random.Random(seed)
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz_') for _ in range(rng.randint(3, 10)))
+             for _ in range(5000)]
+    per_dir = 200
+    paths = []
+    for i in range(files):
+        directory = os.path.join(root, f'pkg{i // per_dir}')
+        if i % per_dir == 0:
+            os.makedirs(directory)
+        lines = []
+        size = 0
+        while size < file_size:
+            line = f"    {rng.choice(words)} = {rng.choice(words)}({rng.choice(words)}, {rng.randint(0, 999)})"
+            lines.append(line)
+            size += len(line) + 1
+        if rng.random() < hit_rate:
+            lines.insert(rng.randrange(len(lines)), f"    client = {NEEDLE}()")
+        path = os.path.join(directory, f'module{i}.py')
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        paths.append(path)
+    # 直前に更新されたファイルは索引に保存されないため、更新時刻を過去にする
+    for path in paths:
+        os.utime(path, (1000000000, 1000000000))
+    return paths
+
+
+def run(root, regex, index):
+    content_filter = ContentFilter(regex, index)
+    start = time.perf_counter()
+    files = list(content_filter.filter(iter_files(root), root))
+    return time.perf_counter() - start, files, content_filter
+
+
+def main():
+    parser = argparse.ArgumentParser(description='--grep のトライグラム索引のベンチマーク')
+    parser.add_argument('--files', type=int, default=20000)
+    parser.add_argument('--file-size', type=int, default=4096, help='1ファイルあたりのおおよそのバイト数')
+    parser.add_argument('--hit-rate', type=float, default=0.005, help='NEEDLE を含むファイルの割合')
+    parser.add_argument('--changed', type=float, default=0.01, help='索引の作成後に変更するファイルの割合')
+    parser.add_argument('--regex', default=rf'{NEEDLE}\(\)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='bench_grep_')
+    try:
+        paths = make_corpus(root, args.files, args.file_size, args.hit_rate, args.seed)
+        corpus_bytes = sum(os.path.getsize(path) for path in paths)
+        print(f"files={len(paths)} corpus={corpus_bytes / 1e6:.1f} MB regex={args.regex!r}")
+        # ディレクトリとファイルのキャッシュを温めてから計測する
+        run(root, args.regex, None)
+
+        def report(label, elapsed, files, content_filter, baseline=None):
+            same = '' if baseline is None else ('  same matches' if files == baseline else '  MATCHES DIFFER')
+            print(f"{label:<14} {elapsed * 1000:10.1f} ms  matched={len(files)} read={content_filter.reads} "
+                  f"skipped by index={content_filter.narrowed}{same}")
+
+        elapsed, baseline, content_filter = run(root, args.regex, None)
+        report('no index', elapsed, baseline, content_filter)
+
+        index = TrigramIndex(index_path(root))
+        elapsed, files, content_filter = run(root, args.regex, index)
+        start = time.perf_counter()
+        index.save()
+        elapsed += time.perf_counter() - start
+        report('build index', elapsed, files, content_filter, baseline)
+        print(f"{'':<14} index={os.path.getsize(index_path(root)) / 1e6:.2f} MB")
+
+        # 索引の読み込みも含めて計測する
+        start = time.perf_counter()
+        index = TrigramIndex(index_path(root))
+        _, files, content_filter = run(root, args.regex, index)
+        report('warm index', time.perf_counter() - start, files, content_filter, baseline)
+
+        rng = random.Random(args.seed + 1)
+        for path in rng.sample(paths, int(len(paths) * args.changed)):
+            with open(path, 'a') as f:
+                f.write('# changed\n')
+            os.utime(path, (1000000100, 1000000100))
+        start = time.perf_counter()
+        index = TrigramIndex(index_path(root))
+        _, files, content_filter = run(root, args.regex, index)
+        index.save()
+        report(f'{args.changed:.0%} changed', time.perf_counter() - start, files, content_filter, baseline)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# benchmarks/bench_patterns.py
+#
+# 従来の fnmatch ループと PatternSet によるパターン照合を比較するマイクロベンチマーク。
+#
+#   PYTHONPATH=src python benchmarks/bench_patterns.py --paths 200000 --patterns 30
+
+import argparse
+import fnmatch
+import random
+import time
+
+from codeaggregator.patterns import PatternSet
+
+EXTENSIONS = ['py', 'js', 'ts', 'md', 'txt', 'json', 'c', 'h', 'cpp', 'go', 'rs', 'java']
+DIR_NAMES = ['src', 'lib', 'tests', 'docs', 'pkg', 'internal', 'vendor', 'build', 'app', 'util']
+
+
+def make_paths(count, seed=0):
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        depth = rng.randint(1, 6)
+        parts = [rng.choice(DIR_NAMES) for _ in range(depth)]
+        parts.append(f"file{i}.{rng.choice(EXTENSIONS)}")
+        paths.append('/'.join(parts))
+    return paths
+
+
+def make_patterns(count):
+    base = [
+        '.*', 'node_modules', '__pycache__', 'dist', 'build', '*.pyc', '*.min.js', '*.map',
+        '*.lock', '*.log', '*.tmp', '*.o', '*.so', '*.a', '*.class', '*.jar', '*.png',
+        '*.jpg', '*.gif', '*.pdf', '*.zip', '*.tar.gz', 'vendor/*', '*_pb2.py', '*.generated.*',
+        'coverage', '.tox', '.venv', 'target', '*.[oa]', '*~', '*.sw?',
+    ]
+    patterns = list(base)
+    i = 0
+    while len(patterns) < count:
+        patterns.append(f"*.gen{i}")
+        i += 1
+    return patterns[:count]
+
+
+def bench(label, func, paths, repeat):
+    best = None
+    matched = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        matched = sum(1 for p in paths if func(p))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<10} {best * 1000:10.1f} ms  {len(paths) / best:14,.0f} paths/s  matched={matched}")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='パターン照合のマイクロベンチマーク')
+    parser.add_argument('--paths', type=int, default=200000)
+    parser.add_argument('--patterns', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    paths = make_paths(args.paths)
+    patterns = make_patterns(args.patterns)
+
+    start = time.perf_counter()
+    matcher = PatternSet(patterns)
+    compile_ms = (time.perf_counter() - start) * 1000
+    print(f"paths={len(paths)} patterns={len(patterns)} compile={compile_ms:.2f} ms")
+
+    legacy = bench('fnmatch', lambda p: any(fnmatch.fnmatch(p, pat) for pat in patterns), paths, args.repeat)
+    compiled = bench('PatternSet', matcher.match, paths, args.repeat)
+    print(f"speedup    {legacy / compiled:10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
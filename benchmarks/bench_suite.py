@@ -0,0 +1,294 @@
+# benchmarks/bench_suite.py
+#
+# 合成ツリーで find_files / パターン照合 / output_files をそれぞれ計測し、結果を JSON に保存するベンチマーク。
+# 各フェーズは子プロセスで実行し、フェーズごとのピーク RSS を記録する。
+# compare で2つの結果ファイルを比較し、しきい値を超えて遅く (大きく) なった項目を報告する。
+#
+#   PYTHONPATH=src python benchmarks/bench_suite.py run --files 20000 --json before.json
+#   PYTHONPATH=src python benchmarks/bench_suite.py run --files 20000 --json after.json
+#   python benchmarks/bench_suite.py compare before.json after.json --threshold 0.1
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PHASES = ('find', 'patterns', 'output')
+SIZE_DISTRIBUTIONS = ('fixed', 'uniform', 'lognormal')
+
+# 比較する指標と、値が大きいほど悪いかどうか
+METRICS = {
+    'seconds': True,
+    'files_per_s': False,
+    'mb_per_s': False,
+    'peak_rss_kb': True,
+}
+
+# ファイルサイズの上限 (lognormal の外れ値を抑える)
+MAX_FILE_SIZE = 16 * 1024 * 1024
+
+LINE = b'    value = compute(index, offset) + 1  # synthetic line\n'
+REAL_IGNORES = ['node_modules', 'build', '*.log', '*.tmp', '__pycache__', '*.pyc']
+IGNORED_DIR = 'node_modules'
+
+
+def ignore_patterns(count):
+    """
+    count 個の除外パターンを返します。先頭は実際にツリー内のファイルに一致するパターンです。
+    """
+    patterns = REAL_IGNORES[:count]
+    i = 0
+    while len(patterns) < count:
+        patterns.append(f'*.gen{i}')
+        i += 1
+    return patterns
+
+
+def file_size(rng, dist, mean):
+    if dist == 'fixed':
+        size = mean
+    elif dist == 'uniform':
+        size = rng.randint(0, 2 * mean)
+    else:
+        sigma = 1.0
+        size = int(rng.lognormvariate(math.log(max(mean, 1)) - sigma * sigma / 2, sigma))
+    return min(size, MAX_FILE_SIZE)
+
+
+def make_dirs(root, depth, fanout):
+    """depth 階層、各ディレクトリに fanout 個のサブディレクトリを持つツリーを作り、全ディレクトリを返します。"""
+    dirs = [root]
+    level = [root]
+    for d in range(depth):
+        next_level = []
+        for parent in level:
+            for i in range(fanout):
+                path = os.path.join(parent, f'd{d}_{i}')
+                os.makedirs(path)
+                next_level.append(path)
+        dirs.extend(next_level)
+        level = next_level
+    return dirs
+
+
+def make_tree(root, spec):
+    """
+    spec (run の引数) に従って合成ツリーを作成します。同じ seed からは同じツリーができます。
+    """
+    rng = random.Random(spec['seed'])
+    dirs = make_dirs(root, spec['depth'], spec['fanout'])
+    ignored_dirs = []
+    for path in dirs[::max(len(dirs) // 8, 1)]:
+        ignored = os.path.join(path, IGNORED_DIR, 'pkg')
+        os.makedirs(ignored)
+        ignored_dirs.append(ignored)
+
+    extensions = ['py', 'js', 'md', 'txt', 'json', 'c', 'log', 'tmp']
+    total_bytes = 0
+    for i in range(spec['files']):
+        if ignored_dirs and rng.random() < spec['ignored_ratio']:
+            directory = ignored_dirs[i % len(ignored_dirs)]
+        else:
+            directory = dirs[i % len(dirs)]
+        size = file_size(rng, spec['size_dist'], spec['mean_size'])
+        if rng.random() < spec['binary_ratio']:
+            name = f'blob{i}.bin'
+            data = b'\0' + rng.randbytes(max(size - 1, 0))
+        else:
+            name = f'file{i}.{extensions[i % len(extensions)]}'
+            data = (LINE * (size // len(LINE) + 1))[:size]
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(data)
+        total_bytes += size
+    return {'dirs': len(dirs) + len(ignored_dirs) * 2, 'bytes': total_bytes}
+
+
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS はバイト単位、Linux は KiB 単位
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run_phase(phase, tree, patterns, repeat):
+    """
+    1つのフェーズを repeat 回実行し、計測結果を返します (子プロセスで呼ばれます)。
+    """
+    from codeaggregator.finder import find_files
+    from codeaggregator.patterns import PatternSet
+    from codeaggregator.output import output_files
+
+    files = find_files(tree, ignore_patterns=patterns) if phase != 'find' else None
+    times = []
+    count = 0
+    data_bytes = 0
+    for _ in range(repeat):
+        if phase == 'find':
+            start = time.perf_counter()
+            result = find_files(tree, ignore_patterns=patterns)
+            times.append(time.perf_counter() - start)
+            count = len(result)
+        elif phase == 'patterns':
+            rel_paths = [os.path.relpath(file, tree) for file in files] * 4
+            matcher = PatternSet(['.*'] + patterns)
+            start = time.perf_counter()
+            matched = sum(1 for p in rel_paths if matcher.match(p))
+            times.append(time.perf_counter() - start)
+            count = len(rel_paths)
+            data_bytes = matched
+        else:
+            out = os.path.join(tempfile.gettempdir(), f'bench_suite_{os.getpid()}.txt')
+            start = time.perf_counter()
+            output_files(files, out)
+            times.append(time.perf_counter() - start)
+            count = len(files)
+            data_bytes = os.path.getsize(out)
+            os.remove(out)
+
+    best = min(times)
+    result = {
+        'seconds': best,
+        'median_seconds': statistics.median(times),
+        'files': count,
+        'files_per_s': count / best if best else 0.0,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+    if phase == 'output':
+        result['bytes'] = data_bytes
+        result['mb_per_s'] = data_bytes / best / 1e6 if best else 0.0
+    elif phase == 'patterns':
+        result['matched'] = data_bytes
+    return result
+
+
+def command_run(args):
+    spec = {
+        'files': args.files, 'depth': args.depth, 'fanout': args.fanout, 'size_dist': args.size_dist,
+        'mean_size': args.mean_size, 'binary_ratio': args.binary_ratio, 'ignored_ratio': args.ignored_ratio,
+        'ignore_patterns': args.ignore_patterns, 'seed': args.seed,
+    }
+    patterns = ignore_patterns(args.ignore_patterns)
+    root = tempfile.mkdtemp(prefix='bench_suite_')
+    try:
+        start = time.perf_counter()
+        tree = make_tree(root, spec)
+        print(f"tree: files={args.files} dirs={tree['dirs']} bytes={tree['bytes']} "
+              f"({time.perf_counter() - start:.1f}s to generate)")
+
+        results = {}
+        for phase in args.phases:
+            child = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '_phase', phase, root,
+                 json.dumps(patterns), str(args.repeat)],
+                check=True, capture_output=True, text=True,
+            )
+            results[phase] = json.loads(child.stdout)
+            r = results[phase]
+            line = f"{phase:<9} {r['seconds'] * 1000:10.1f} ms  {r['files_per_s']:12,.0f} files/s"
+            if 'mb_per_s' in r:
+                line += f"  {r['mb_per_s']:8.1f} MB/s"
+            print(f"{line}  peak RSS {r['peak_rss_kb'] / 1024:.1f} MiB")
+    finally:
+        shutil.rmtree(root)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'spec': spec,
+            'tree': tree,
+        },
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json}")
+
+
+def compare(base, new, threshold):
+    """
+    2つの結果を比較し、(フェーズ, 指標, 基準値, 新しい値, 変化率, 悪化したか) のリストを返します。
+
+    変化率は「悪くなった割合」で、正の値が悪化、負の値が改善です。
+    """
+    rows = []
+    for phase, base_result in base['results'].items():
+        new_result = new['results'].get(phase)
+        if new_result is None:
+            continue
+        for metric, higher_is_worse in METRICS.items():
+            if metric not in base_result or metric not in new_result or not base_result[metric]:
+                continue
+            before, after = base_result[metric], new_result[metric]
+            change = (after - before) / before
+            if not higher_is_worse:
+                change = -change
+            rows.append((phase, metric, before, after, change, change > threshold))
+    return rows
+
+
+def command_compare(args):
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.new, encoding='utf-8') as f:
+        new = json.load(f)
+    if base['meta'].get('spec') != new['meta'].get('spec'):
+        print("warning: the two results were measured on different trees", file=sys.stderr)
+
+    regressions = 0
+    for phase, metric, before, after, change, regressed in compare(base, new, args.threshold):
+        flag = 'REGRESSION' if regressed else ''
+        print(f"{phase:<9} {metric:<13} {before:14.4f} -> {after:14.4f}  {change * 100:+7.1f}%  {flag}")
+        regressions += regressed
+    if regressions:
+        print(f"{regressions} regression(s) above {args.threshold * 100:.0f}%")
+        sys.exit(1)
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '_phase':
+        phase, tree, patterns, repeat = sys.argv[2:6]
+        print(json.dumps(run_phase(phase, tree, json.loads(patterns), int(repeat))))
+        return
+
+    parser = argparse.ArgumentParser(description='finder/output のベンチマークスイート')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help='合成ツリーを作成して計測する')
+    run.add_argument('--files', type=int, default=20000)
+    run.add_argument('--depth', type=int, default=3)
+    run.add_argument('--fanout', type=int, default=6)
+    run.add_argument('--size-dist', choices=SIZE_DISTRIBUTIONS, default='lognormal')
+    run.add_argument('--mean-size', type=int, default=4096, help='ファイルサイズの平均 (バイト)')
+    run.add_argument('--binary-ratio', type=float, default=0.05)
+    run.add_argument('--ignored-ratio', type=float, default=0.2, help='node_modules に置くファイルの割合')
+    run.add_argument('--ignore-patterns', type=int, default=6, help='除外パターンの数')
+    run.add_argument('--phases', nargs='+', choices=PHASES, default=list(PHASES))
+    run.add_argument('--repeat', type=int, default=3)
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--json', help='結果を保存する JSON ファイル')
+
+    cmp = sub.add_parser('compare', help='2つの結果ファイルを比較する')
+    cmp.add_argument('base')
+    cmp.add_argument('new')
+    cmp.add_argument('--threshold', type=float, default=0.1, help='悪化とみなす変化率 (デフォルト: 0.1 = 10%%)')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        command_run(args)
+    else:
+        command_compare(args)
+
+
+if __name__ == '__main__':
+    main()
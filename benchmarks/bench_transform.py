@@ -0,0 +1,89 @@
+# benchmarks/bench_transform.py
+#
+# 合成した Python/C のファイルを --transform で出力し、変換に使うプロセス数ごとの時間と減らしたバイト数を計測するベンチマーク。
+# すべてのプロセス数で、1プロセスの場合と同じ出力になることも確認する。
+#
+#   PYTHONPATH=src python benchmarks/bench_transform.py --files 2000 --jobs 1,2,4
+
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from codeaggregator.finder import iter_files
+from codeaggregator.output import output_files
+from codeaggregator.transform import Transformer
+
+LICENSE = ''.join(f"# Licensed under the Example License, line {i}.\n" for i in range(12))
+
+PYTHON_BODY = '''
+
+class Handler{n}:
+    """Handler number {n}."""
+
+    def run(self, value):  # 値を処理する
+        # 途中のコメント
+        total = value * {n}
+
+
+        return total
+'''
+
+C_BODY = '''
+/* Handler number {n}. */
+int handler{n}(int value) {{  // 値を処理する
+    const char *name = "handler://{n}";
+
+
+    return value * {n};
+}}
+'''
+
+
+def make_corpus(root, files, repeat):
+    for i in range(files):
+        if i % 2:
+            content = LICENSE.replace('#', '//') + ''.join(C_BODY.format(n=n) for n in range(repeat))
+            name = f'mod{i}.c'
+        else:
+            content = LICENSE + ''.join(PYTHON_BODY.format(n=n) for n in range(repeat))
+            name = f'mod{i}.py'
+        with open(os.path.join(root, name), 'w') as f:
+            f.write(content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='--transform のプロセスプールのベンチマーク')
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=20, help='1ファイルあたりのクラス/関数の数')
+    parser.add_argument('--jobs', default='1,2,4', help='計測するプロセス数 (カンマ区切り)')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='bench_transform_')
+    try:
+        make_corpus(root, args.files, args.repeat)
+        files = list(iter_files(root))
+        size = sum(os.path.getsize(file) for file in files)
+        print(f"files={len(files)} corpus={size / 1e6:.1f} MB cpus={os.cpu_count()}")
+        baseline = None
+        base_elapsed = None
+        for jobs in [int(j) for j in args.jobs.split(',')]:
+            transformer = Transformer(jobs=jobs)
+            buf = io.BytesIO()
+            start = time.perf_counter()
+            output_files(files, buf, transformer=transformer)
+            elapsed = time.perf_counter() - start
+            if baseline is None:
+                baseline, base_elapsed = buf.getvalue(), elapsed
+            same = 'same output' if buf.getvalue() == baseline else 'OUTPUT DIFFERS'
+            print(f"jobs={jobs:<3} {elapsed * 1000:10.1f} ms  x{base_elapsed / elapsed:5.2f}  {same}")
+        for line in transformer.summary():
+            print(line)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# benchmarks/bench_walk.py
+#
+# ディレクトリの一覧 (os.scandir) に人工的な待ち時間を加え、ネットワークファイルシステムを模した環境で
+# --walk-threads のスレッド数ごとの走査時間を計測するベンチマーク。
+# すべてのスレッド数で、1スレッドの場合と同じ順序のファイルリストが返ることも確認する。
+#
+#   PYTHONPATH=src python benchmarks/bench_walk.py --depth 3 --fanout 6 --latency-ms 2
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from codeaggregator import finder
+from codeaggregator.finder import iter_files
+
+
+def make_tree(root, depth, fanout, files_per_dir):
+    """
+    depth 階層、各ディレクトリに fanout 個のサブディレクトリと除外されるディレクトリを持つツリーを作成します。
+    """
+    dirs = 0
+    stack = [(root, 0)]
+    while stack:
+        path, level = stack.pop()
+        dirs += 1
+        for i in range(files_per_dir):
+            with open(os.path.join(path, f'file{i}.py'), 'w') as f:
+                f.write('x\n')
+        if level >= depth:
+            continue
+        os.makedirs(os.path.join(path, 'node_modules', 'dep'))
+        for i in range(fanout):
+            sub = os.path.join(path, f'd{i}')
+            os.makedirs(sub)
+            stack.append((sub, level + 1))
+    return dirs
+
+
+def with_latency(latency):
+    """
+    os.scandir の呼び出しごとに latency 秒待つよう finder の os を差し替えます。
+    待ち時間は I/O と同じく GIL を解放します。
+    """
+    scandir = os.scandir
+
+    def slow_scandir(path):
+        time.sleep(latency)
+        return scandir(path)
+
+    finder.os.scandir = slow_scandir
+    return lambda: setattr(finder.os, 'scandir', scandir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='--walk-threads の走査のベンチマーク')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--fanout', type=int, default=6)
+    parser.add_argument('--files-per-dir', type=int, default=5)
+    parser.add_argument('--latency-ms', type=float, default=2.0, help='os.scandir 1回あたりの待ち時間')
+    parser.add_argument('--threads', default='1,2,4,8,16', help='計測するスレッド数 (カンマ区切り)')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='bench_walk_')
+    try:
+        dirs = make_tree(root, args.depth, args.fanout, args.files_per_dir)
+        print(f"dirs={dirs} latency={args.latency_ms} ms per scandir")
+        # ディレクトリのキャッシュを温めてから計測する
+        list(iter_files(root))
+        restore = with_latency(args.latency_ms / 1000)
+        try:
+            baseline = None
+            base_elapsed = None
+            for threads in [int(t) for t in args.threads.split(',')]:
+                start = time.perf_counter()
+                files = list(iter_files(root, ignore_patterns=['node_modules/'], threads=threads))
+                elapsed = time.perf_counter() - start
+                if baseline is None:
+                    baseline, base_elapsed = files, elapsed
+                same = 'same order' if files == baseline else 'ORDER DIFFERS'
+                print(f"threads={threads:<3} {elapsed * 1000:10.1f} ms  x{base_elapsed / elapsed:5.2f}  "
+                      f"files={len(files)} {same}")
+        finally:
+            restore()
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
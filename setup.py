@@ -13,7 +13,7 @@ setup(
     package_dir={'': 'src'},
     entry_points={
         'console_scripts': [
-            'code-aggregator=codeaggregator.cli:main',
+            'code-aggregator=codeaggregator.client:main',
         ],
     },
     install_requires=[
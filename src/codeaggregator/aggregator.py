@@ -0,0 +1,332 @@
+# aggregator.py
+
+import os
+import logging
+from codeaggregator.finder import build_matchers, iter_files, iter_fromfile, filter_paths, log_found
+from codeaggregator.gitignore import GitIgnore
+from codeaggregator.gitindex import read_index
+from codeaggregator.output import StreamWriter, iter_write, output_files, load_file
+from codeaggregator.cache import MemoryCache, list_key, CACHE_DIR_NAME
+from codeaggregator.tokens import TokenBudget, order_files, stat_size
+from codeaggregator.dedupe import Deduper
+from codeaggregator.classify import FileClassifier
+from codeaggregator.archive import ArchiveSource, is_archive
+from codeaggregator.formats import make_format
+from codeaggregator.trigram import ContentFilter
+from codeaggregator.transform import Transformer
+
+logger = logging.getLogger(__name__)
+
+
+class FileRecord:
+    """
+    Aggregator が出力段階で扱った1ファイルの情報です。
+
+    Attributes:
+        path (str): 検索対象のディレクトリ (またはアーカイブ) からの相対パス。
+        size (int or None): 読み込んだ時点のファイルサイズ。stat できなかった場合は None。
+        mtime (float or None): 読み込んだ時点の更新時刻 (UNIX 時刻)。
+        status (str): 'included'、'duplicate'、'omitted' (予算により省略)、'missing'、'error'、
+            'binary' または 'oversized'。
+        offset (int or None): 出力内で見出しが始まる位置 (バイト)。書き込まなかったファイルは None。
+        length (int or None): 見出しを含めて書き込んだバイト数。書き込まなかったファイルは None。
+    """
+
+    __slots__ = ('path', 'size', 'mtime', 'status', 'offset', 'length')
+
+    def __init__(self, path, size, mtime, status, offset=None, length=None):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.status = status
+        self.offset = offset
+        self.length = length
+
+    def __repr__(self):
+        return (f"FileRecord(path={self.path!r}, size={self.size!r}, mtime={self.mtime!r}, status={self.status!r}, "
+                f"offset={self.offset!r}, length={self.length!r})")
+
+
+class AggregateResult:
+    """
+    Aggregator.render の結果です。
+
+    Attributes:
+        records (list): 出力段階で扱った順の FileRecord のリスト。
+        budget (TokenBudget or None): トークン数の上限を指定した場合の予算 (summary で省略したファイルを確認できます)。
+        dedupe (Deduper or None): 重複の置き換えを指定した場合の Deduper。
+        error (Exception or None): アーカイブが途中で読めなくなった場合の理由。
+        transformer (Transformer or None): 変換を指定した場合の Transformer (変換ごとに減らしたバイト数を確認できます)。
+    """
+
+    __slots__ = ('records', 'budget', 'dedupe', 'error', 'transformer')
+
+    def __init__(self, records, budget=None, dedupe=None, error=None, transformer=None):
+        self.records = records
+        self.budget = budget
+        self.dedupe = dedupe
+        self.error = error
+        self.transformer = transformer
+
+
+class Aggregator:
+    """
+    パターンや読み込み方法の設定を一度だけコンパイルし、複数回の集約に使い回す API です。
+
+    1つのインスタンスで、異なるディレクトリ (またはアーカイブ) を何度でも集約できます。
+    パターンのコンパイルはインスタンスの作成時に一度だけ行い、.gitignore のルールはディレクトリごとに保持して
+    変更されたファイルだけを読み直します。cache に MemoryCache を渡すと、呼び出しをまたいで
+    変更のないファイルの読み込みも省きます。
+
+    Args:
+        patterns (list, optional): インクルードするファイルパターンのリスト。デフォルトは None（すべてのファイル）。
+        ignore_patterns (list, optional): 除外するファイル/ディレクトリパターンのリスト。デフォルトは None。
+        include_hidden (bool, optional): 先頭に '.' が付くファイルやフォルダを含めるかどうか。デフォルトは False。
+        gitignore (bool, optional): .gitignore のルールを適用するかどうか。デフォルトは False。
+        max_file_size (int, optional): これより大きいファイルは読み込まない (バイト)。デフォルトは None（上限なし）。
+        include_binary (bool, optional): バイナリファイルも読み込むかどうか。デフォルトは False。
+        excerpter (Excerpter, optional): 大きなファイルの先頭/末尾だけを出力する場合に指定します。
+        jobs (int, optional): 読み込みに使うスレッド数。デフォルトは 1。
+        walk_threads (int, optional): ディレクトリの走査に使うスレッド数。デフォルトは 1。
+        dedupe (bool, optional): 内容が同じファイルを最初のファイルへの参照に置き換えるかどうか。デフォルトは False。
+        max_tokens (int, optional): 出力全体のトークン数 (概算) の上限。デフォルトは None（上限なし）。
+        budget_mode (str, optional): 上限を超えるファイルの扱い ('skip'、'truncate'、'stop')。デフォルトは 'skip'。
+        budget_priority (str, optional): 上限がある場合の優先順位 ('order'、'path'、'smallest')。デフォルトは 'order'。
+        cache (AggregateCache, optional): 呼び出しごとに cache を指定しない場合に使うキャッシュ。デフォルトは None。
+        output_format (str, optional): 出力形式 ('text'、'jsonl'、'indexed')。デフォルトは 'text'。
+        grep (str or re.Pattern, optional): 内容がこの正規表現に一致するファイルだけを対象にします。
+            アーカイブには指定できません。デフォルトは None。
+        transforms (list, optional): 書き込む前に本文へ適用する変換の名前 ('python'、'c'、'whitespace') のリスト。
+            デフォルトは None（変換しない）。
+        transform_jobs (int, optional): 変換に使うプロセス数。デフォルトは None（CPU 数）。
+    """
+
+    def __init__(self, patterns=None, ignore_patterns=None, include_hidden=False, gitignore=False,
+                 max_file_size=None, include_binary=False, excerpter=None, jobs=1, walk_threads=1, dedupe=False,
+                 max_tokens=None, budget_mode='skip', budget_priority='order', cache=None, output_format='text',
+                 grep=None, transforms=None, transform_jobs=None):
+        self.patterns = patterns
+        self.ignore_patterns = ignore_patterns
+        self.include_hidden = include_hidden
+        self.gitignore = gitignore
+        self.excerpter = excerpter
+        self.jobs = jobs
+        self.walk_threads = walk_threads
+        self.dedupe = dedupe
+        self.max_tokens = max_tokens
+        self.budget_mode = budget_mode
+        self.budget_priority = budget_priority
+        self.cache = cache
+        self.output_format = output_format
+        self.grep = grep
+        self.transforms = transforms
+        self.transform_jobs = transform_jobs
+        self.classifier = FileClassifier(max_file_size, include_binary)
+        # 以前のバージョンが作成したキャッシュディレクトリは、-a 指定時も対象に含めない
+        self.matchers = build_matchers(patterns, list(ignore_patterns or []) + [CACHE_DIR_NAME], include_hidden)
+        # (絶対パス, 指定されたパス) -> GitIgnore
+        self._gitignores = {}
+
+    def _gitignore_for(self, root):
+        if not self.gitignore:
+            return False
+        key = (os.path.abspath(root), root)
+        gitignore = self._gitignores.get(key)
+        if gitignore is None:
+            gitignore = self._gitignores[key] = GitIgnore(root)
+        else:
+            # コンパイル済みのルールは残し、ディレクトリごとの引き継ぎ状態だけを作り直す
+            gitignore.clear()
+        return gitignore
+
+    def walker(self, root, stats=None):
+        """
+        root を走査する関数を返します。関数は on_dir コールバックを受け取り、ファイルパスのイテラブルを返します。
+        """
+        gitignore = self._gitignore_for(root)
+
+        def walk(on_dir=None):
+            return iter_files(root, include_hidden=self.include_hidden, gitignore=gitignore, on_dir=on_dir,
+                              stats=stats, threads=self.walk_threads, matchers=self.matchers)
+        return walk
+
+    def select(self, root, fromfile=None, null=False, git_tracked=False, cache=None, stats=None, index=None,
+               content_filter=None):
+        """
+        root の対象のファイルパスを返します。ファイルパスは読み込みながら返すイテラブルです。
+
+        Args:
+            root (str): 検索対象のディレクトリ、またはアーカイブのパス。
+            fromfile (str, optional): 走査する代わりに読み取るファイルリスト ("." は標準入力)。
+            null (bool, optional): ファイルリストを NUL 区切りで読み取るかどうか。
+            git_tracked (bool, optional): .git/index に登録されているファイルだけを対象にするかどうか。
+            cache (AggregateCache, optional): ファイルリストをキャッシュする場合に指定します (走査する場合のみ)。
+            stats (RunStats, optional): 走査の時間やスキップしたファイル数を記録する場合に指定します。
+            index (TrigramIndex, optional): grep の候補の絞り込みに使うトライグラム索引。
+            content_filter (ContentFilter, optional): grep の照合に使うフィルタ。デフォルトは None（index から作成する）。
+
+        Returns:
+            tuple: (ファイルパスのイテラブル, ファイルパスからサイズを返す関数, ArchiveSource または None)。
+
+        Raises:
+            GitIndexError: git_tracked で .git/index を読み込めない場合。
+            ValueError: grep を指定してアーカイブを集約しようとした場合。
+        """
+        size_of = stat_size
+        source = None
+        if is_archive(root):
+            if self.grep is not None:
+                raise ValueError(f"grep cannot be used with archives: {root}")
+            # アーカイブは展開せず、メンバーを順に読みながら出力する
+            source = ArchiveSource(root, self.classifier, self.excerpter)
+            files = source.iter_files(include_hidden=self.include_hidden, stats=stats, matchers=self.matchers)
+        elif git_tracked:
+            entries = read_index(root)
+            # インデックスに記録されたサイズを使い、並べ替えや振り分けのための stat を省く
+            sizes = {os.path.join(root, entry.path.replace('/', os.sep)): entry.size for entry in entries}
+            size_of = lambda file: sizes.get(file, 0)
+            files = filter_paths(root, (entry.path for entry in entries), include_hidden=self.include_hidden,
+                                 stats=stats, matchers=self.matchers)
+        elif fromfile:
+            files = iter_fromfile(root, fromfile, include_hidden=self.include_hidden,
+                                  gitignore=self._gitignore_for(root), stats=stats, null=null, matchers=self.matchers)
+        else:
+            walk = self.walker(root, stats)
+            if cache is not None:
+                key = list_key(os.path.abspath(root), root, self.patterns, self.ignore_patterns, self.include_hidden,
+                               self.gitignore)
+                rule_names = ('.gitignore',) if self.gitignore else ()
+                rule_files = (os.path.join(root, '.git', 'info', 'exclude'),) if self.gitignore else ()
+                files = cache.iter_files(key, walk, rule_names, rule_files)
+            else:
+                files = walk()
+
+        # 見つかったファイルは -i 指定時にログへ1件ずつ出力する
+        files = log_found(files, root)
+        if self.grep is not None:
+            # 索引で候補を絞り込み、残ったファイルだけを読み込んで正規表現で確認する
+            content_filter = content_filter or self.content_filter(index)
+            files = content_filter.filter(files, root, stats)
+        if stats is not None:
+            files = stats.iter_timed(files)
+        return files, size_of, source
+
+    def content_filter(self, index=None):
+        """
+        grep の照合に使う ContentFilter を返します。grep を指定していない場合は None を返します。
+        """
+        if self.grep is None:
+            return None
+        return ContentFilter(self.grep, index, self.classifier)
+
+    def loader(self, cache=None, source=None, content_filter=None, on_stat=None):
+        """
+        ファイルパスを受け取り、出力する本文を返す関数を返します。
+
+        content_filter を指定した場合、照合のために読み込んだ内容を使い、一致したファイルを読み直しません。
+        on_stat を指定した場合、読み込む前の判定に使った stat 結果を (ファイルパス, stat) で渡します
+        (アーカイブのメンバーは stat しないため呼び出しません)。
+        """
+        if source is not None:
+            return source.load
+        loader = cache.load if cache is not None else load_file
+        if self.excerpter:
+            loader = self.excerpter.wrap(loader)
+        # 変更のないファイルは、キャッシュに保持したバイナリの判定を使い先頭部分を読み直さない
+        loader = self.classifier.wrap(loader, cache, on_stat)
+        if content_filter is not None:
+            loader = content_filter.wrap(loader, self.excerpter, cache, on_stat)
+        return loader
+
+    def iter_records(self, root, stream, fromfile=None, null=False, git_tracked=False, cache=None, stats=None,
+                     index=None):
+        """
+        root のファイルを stream (書き込み可能なバイナリストリーム) へ出力しながら、FileRecord を1件ずつ返します。
+
+        引数は select と同じです。出力は output_files でファイルライクオブジェクトへ書き込んだ場合と同じです。
+
+        Yields:
+            FileRecord: 出力段階で扱ったファイルの情報。
+        """
+        files, loader, budget, dedupe, transformer, cache, _, record = self._prepare(root, fromfile, null,
+                                                                                     git_tracked, cache, stats, index)
+        writer = StreamWriter(stream)
+        for file, status, offset, length in iter_write(files, writer, self.jobs, loader, budget, dedupe, stats,
+                                                       make_format(self.output_format), transformer):
+            yield record(file, status, offset, length)
+        writer.flush()
+        self._finish(cache)
+
+    def render(self, root, output=None, fromfile=None, null=False, git_tracked=False, cache=None, stats=None,
+               compress_level=None, index=None):
+        """
+        root のファイルを output へ出力します。出力先の扱いは output_files と同じです。
+
+        Args:
+            root (str): 検索対象のディレクトリ、またはアーカイブのパス。
+            output (str or file-like, optional): 出力先のパス、または書き込み可能なファイルライクオブジェクト。
+                デフォルトは None（標準出力）。
+            compress_level (int, optional): 出力先が .gz/.xz/.bz2 の場合の圧縮レベル。
+            その他の引数は select と同じです。
+
+        Returns:
+            AggregateResult: FileRecord のリストと、予算・重複の置き換え・変換の結果。
+        """
+        files, loader, budget, dedupe, transformer, cache, source, record = self._prepare(root, fromfile, null,
+                                                                                          git_tracked, cache, stats,
+                                                                                          index)
+        records = []
+        output_files(files, output, jobs=self.jobs, budget=budget, dedupe=dedupe, stats=stats, loader=loader,
+                     compress_level=compress_level, fmt=make_format(self.output_format),
+                     on_record=lambda *args: records.append(record(*args)), transformer=transformer)
+        self._finish(cache)
+        return AggregateResult(records, budget, dedupe, source.error if source is not None else None, transformer)
+
+    def _prepare(self, root, fromfile, null, git_tracked, cache, stats, index):
+        if cache is None and self.cache is not None:
+            cache = self.cache
+            if isinstance(cache, MemoryCache):
+                cache.begin()
+        if is_archive(root):
+            cache = None
+        content_filter = self.content_filter(index)
+        files, size_of, source = self.select(root, fromfile, null, git_tracked, cache, stats, index, content_filter)
+
+        budget = None
+        if self.max_tokens is not None:
+            budget = TokenBudget(self.max_tokens, self.budget_mode)
+            files = order_files(files, self.budget_priority, size_of)
+            if source is not None:
+                source.budget = budget
+
+        # 読み込んだ時点の stat を FileRecord に使う (-j 指定時は読み込み用のスレッドから呼ばれる)
+        signatures = {}
+
+        def on_stat(file, st):
+            signatures[file] = (st.st_size, st.st_mtime)
+
+        loader = self.loader(cache, source, content_filter, on_stat)
+        transformer = None
+        if self.transforms is not None:
+            transformer = Transformer(self.transforms, self.transform_jobs)
+        dedupe = None
+        if self.dedupe:
+            # 先に出力したファイルを読み直して比べる場合も、変換した本文どうしで比べる
+            # (読み直しは FileRecord の記録済みのファイルのため、stat は記録しない)
+            reload = self.loader(cache, source)
+            dedupe = Deduper(transformer.wrap(reload) if transformer is not None else reload)
+
+        base = os.path.join(root, '')
+
+        def record(file, status, offset, length):
+            size, mtime = signatures.pop(file, (None, None))
+            path = file[len(base):] if file.startswith(base) else os.path.relpath(file, root)
+            return FileRecord(path, size, mtime, status, offset, length)
+
+        return files, loader, budget, dedupe, transformer, cache, source, record
+
+    def _finish(self, cache):
+        if cache is not None:
+            logger.info(f"Cache hits: {cache.hits}, misses: {cache.misses}")
+            if cache is self.cache:
+                cache.save()
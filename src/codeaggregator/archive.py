@@ -0,0 +1,221 @@
+# archive.py
+
+import io
+import os
+import zipfile
+import tarfile
+import logging
+import threading
+from collections import deque
+from codeaggregator.finder import path_matcher
+from codeaggregator.output import decode_text, ErrorBody
+from codeaggregator.classify import OVERSIZED, BINARY, SNIFF_SIZE, is_binary
+
+logger = logging.getLogger(__name__)
+
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.xz', '.txz', '.tar.bz2', '.tbz2')
+ZIP_SUFFIXES = ('.zip', '.whl', '.jar')
+
+
+class ArchiveError(Exception):
+    """アーカイブが壊れている、または読み込めない場合に送出されます。"""
+
+
+def is_archive(path):
+    """path が対応している形式のアーカイブファイルかどうかを拡張子で判定します。"""
+    return path.lower().endswith(TAR_SUFFIXES + ZIP_SUFFIXES) and os.path.isfile(path)
+
+
+def _member_name(name):
+    # './src/a.py' や '/src/a.py' のような名前を、先頭の区切りを除いた相対パスにそろえる
+    while name.startswith('./'):
+        name = name[2:]
+    return name.lstrip('/')
+
+
+class _MemberReader:
+    """
+    メンバーの内容を先頭から順に読み込みます。read を続けて呼び出すと、前回の続きを返します。
+    """
+
+    def __init__(self, path, open_member, errors):
+        self._path = path
+        self._open = open_member
+        self._errors = errors
+        self._stream = None
+
+    def read(self, size=-1):
+        try:
+            if self._stream is None:
+                self._stream = self._open()
+            return self._stream.read(size)
+        except self._errors as e:
+            raise ArchiveError(f"{self._path}: {e}") from e
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+
+def iter_tar_members(path):
+    """
+    tar アーカイブ (圧縮形式は自動判定) の通常ファイルを、アーカイブ内の順に1件ずつ返します。
+
+    ストリームとして先頭から1回だけ読み、読み終えたメンバーの情報は保持しません。
+    返した read 関数は、次のメンバーへ進む前にだけ呼び出せます。
+
+    Yields:
+        tuple: (相対パス, サイズ, 内容を読み込む関数 read(size=-1))。read は続けて呼び出すと続きを返します。
+    """
+    try:
+        tar = tarfile.open(path, 'r|*')
+    except (OSError, tarfile.TarError) as e:
+        raise ArchiveError(f"{path}: {e}") from e
+    with tar:
+        while True:
+            try:
+                member = tar.next()
+            except (OSError, EOFError, tarfile.TarError) as e:
+                raise ArchiveError(f"{path}: {e}") from e
+            if member is None:
+                return
+            # ストリームモードでも TarFile は読んだメンバーを members に溜めるため、都度捨てる
+            tar.members = []
+            if not member.isfile():
+                continue
+            reader = _MemberReader(path, lambda member=member: tar.extractfile(member),
+                                   (OSError, EOFError, tarfile.TarError))
+            try:
+                yield _member_name(member.name), member.size, reader.read
+            finally:
+                reader.close()
+
+
+def iter_zip_members(path):
+    """
+    zip アーカイブの通常ファイルを、セントラルディレクトリの順に1件ずつ返します。
+
+    zip の形式上、メンバーの一覧 (セントラルディレクトリ) は最初に読み込まれます。
+
+    Yields:
+        tuple: (相対パス, サイズ, 内容を読み込む関数 read(size=-1))。read は続けて呼び出すと続きを返します。
+    """
+    try:
+        zf = zipfile.ZipFile(path)
+    except (OSError, zipfile.BadZipFile) as e:
+        raise ArchiveError(f"{path}: {e}") from e
+    with zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            reader = _MemberReader(path, lambda info=info: zf.open(info),
+                                   (OSError, EOFError, zipfile.BadZipFile, NotImplementedError))
+            try:
+                yield _member_name(info.filename), info.file_size, reader.read
+            finally:
+                reader.close()
+
+
+def iter_members(path):
+    """拡張子に応じて iter_tar_members または iter_zip_members を返します。"""
+    if path.lower().endswith(ZIP_SUFFIXES):
+        return iter_zip_members(path)
+    return iter_tar_members(path)
+
+
+class ArchiveSource:
+    """
+    展開せずにアーカイブのメンバーを出力するための、ファイルパスの列と loader の組です。
+
+    iter_files はメンバーをアーカイブ内の順に走査し、ディレクトリと同じ規則でパターンを適用して、
+    対象のメンバーだけを読み込みます。読み込んだ内容は load に渡されるまでの間だけ保持するため、
+    保持する量は出力側の先読みの件数で抑えられます。バイナリのメンバーは先頭 SNIFF_SIZE バイトだけを読んで判定し、
+    大きすぎるメンバーと予算を使い切った後のメンバー (load を呼ばずに省略される) は内容を読み込みません。
+
+    ファイルパスは、アーカイブのパスとメンバーの相対パスを結合したもの (例: dist.tar.gz/pkg/a.py) です。
+
+    Args:
+        path (str): アーカイブファイルのパス。
+        classifier (FileClassifier, optional): 大きすぎるメンバーとバイナリのメンバーを省略する場合に指定します。
+            大きすぎるメンバーは内容を読み込みません。
+        excerpter (Excerpter, optional): 先頭/末尾だけを出力する場合に指定します。
+        budget (TokenBudget, optional): トークン数の予算。使い切った後のメンバーは読み込みません。
+    """
+
+    def __init__(self, path, classifier=None, excerpter=None, budget=None):
+        self.path = path
+        self.classifier = classifier
+        self.excerpter = excerpter
+        self.budget = budget
+        self.error = None
+        # ファイルパス -> 読み込んだ内容 (同じ名前のメンバーが複数ある tar に備えて deque)
+        self._pending = {}
+        # load は -j 指定時に読み込み用のスレッドから呼ばれる
+        self._lock = threading.Lock()
+
+    def iter_files(self, patterns=None, ignore_patterns=None, include_hidden=False, stats=None, matchers=None):
+        """
+        対象のメンバーのファイルパスを、内容を読み込んだうえで1件ずつ返します。
+
+        アーカイブが壊れている場合は、それまでのメンバーを返して終了し、error に理由を記録します。
+        matchers は finder.path_matcher と同じく、コンパイル済みのパターンを渡す場合に指定します。
+        """
+        match = path_matcher(patterns, ignore_patterns, include_hidden, stats, matchers)
+        base = os.path.join(self.path, '')
+        try:
+            for name, size, read in iter_members(self.path):
+                rel_path = match(name)
+                if rel_path is None:
+                    continue
+                file = base + rel_path
+                if self.budget is not None and self.budget.stopped:
+                    # 予算を使い切った後は budget.watch が load を呼ばずに省略するため、読み込まずに返す
+                    yield file
+                    continue
+                data = self._read(size, read)
+                with self._lock:
+                    self._pending.setdefault(file, deque()).append(data)
+                yield file
+        except ArchiveError as e:
+            logger.error(f"Cannot read archive: {e}")
+            self.error = e
+
+    def _read(self, size, read):
+        # 省略するメンバーは (理由, サイズ) を、それ以外は内容を返す
+        if self.classifier is None:
+            return read()
+        if self.classifier.is_oversized(size):
+            return OVERSIZED, size
+        if self.classifier.include_binary or size == 0:
+            return read()
+        prefix = read(SNIFF_SIZE)
+        if is_binary(prefix, complete=size <= SNIFF_SIZE):
+            return BINARY, size
+        return prefix + read()
+
+    def load(self, file):
+        """
+        iter_files が返したファイルパスの本文を返します。
+        """
+        with self._lock:
+            queue = self._pending.get(file)
+            if not queue:
+                return None
+            data = queue.popleft()
+            if not queue:
+                del self._pending[file]
+
+        if isinstance(data, tuple):
+            # 大きすぎる、またはバイナリのため読み込まなかったメンバー
+            reason, size = data
+            return self.classifier.skipped(file, reason, size)
+        try:
+            if self.excerpter:
+                body = self.excerpter.excerpt_stream(io.BytesIO(data), len(data))
+                if body is not None:
+                    logger.info(f"Excerpted: {file}")
+                    return body
+            return decode_text(data) + "\n"
+        except UnicodeDecodeError as e:
+            return ErrorBody(f"Error reading {file}: {e}\n")
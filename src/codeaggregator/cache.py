@@ -0,0 +1,388 @@
+# cache.py
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from codeaggregator.output import load_file, Passthrough, ErrorBody
+
+logger = logging.getLogger(__name__)
+
+# 以前のバージョンが検索対象ディレクトリの直下に作成していたキャッシュディレクトリの名前 (走査では常に除外する)
+CACHE_DIR_NAME = '.codeaggregator-cache'
+
+# 出力チャンクの合計サイズの上限 (256 MiB)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# 保持するファイルリストの数の上限
+MAX_LISTS = 16
+
+# この回数の実行で使われなかったバイナリ判定の結果は削除する
+MAX_VERDICT_AGE = 16
+
+# この時間内に更新されたファイル/ディレクトリは、同じ時刻のまま再び変更され得るのでキャッシュしない
+RACY_WINDOW_NS = 2 * 1000 * 1000 * 1000
+
+INDEX_NAME = 'index.json'
+INDEX_VERSION = 1
+
+# index.json の files の各要素の位置
+_SIZE, _MTIME, _INO, _CHUNK_SIZE, _USED = range(5)
+
+# index.json の verdicts の各要素の位置 (サイズ, 更新時刻, inode は files と同じ)
+_BINARY, _VERDICT_USED = 3, 4
+
+
+def _empty_index():
+    return {'version': INDEX_VERSION, 'clock': 0, 'files': {}, 'lists': {}, 'verdicts': {}}
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def cache_dir(root):
+    """
+    root のキャッシュディレクトリのパスを返します。
+
+    検索対象のディレクトリには書き込まず、$XDG_CACHE_HOME (未設定の場合は ~/.cache) の codeaggregator/ 以下に、
+    root の絶対パスから作った名前のディレクトリを使います。
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    root = os.path.abspath(root)
+    digest = hashlib.sha1(root.encode('utf-8', 'surrogateescape')).hexdigest()[:16]
+    return os.path.join(base, 'codeaggregator', f"{os.path.basename(root) or 'root'}-{digest}")
+
+
+def list_key(*parts):
+    """
+    ファイルリストを識別するキーを、検索条件から作成します。
+    """
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class AggregateCache:
+    """
+    前回の実行結果をディスクに保持し、変更のないファイルの読み込みを省くキャッシュです。
+
+    - ファイルリスト: 走査したディレクトリの更新時刻が変わっていなければ、走査せずに再利用します。
+    - 出力チャンク: ファイルの (サイズ, 更新時刻, inode) が変わっていなければ、
+      前回レンダリングした本文をキャッシュから出力先へそのままコピーします。
+    - バイナリの判定: 同じ (サイズ, 更新時刻, inode) のファイルは、先頭部分を読み直さずに前回の判定を使います。
+
+    チャンクの合計サイズが max_bytes を超えた場合は、最後に使われた実行が古いものから削除します。
+
+    Args:
+        path (str): キャッシュディレクトリのパス。
+        max_bytes (int, optional): 出力チャンクの合計サイズの上限。デフォルトは 256 MiB。
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._chunks_dir = os.path.join(path, 'chunks')
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+        self._index['clock'] += 1
+        self._clock = self._index['clock']
+        self._racy_after_ns = time.time_ns() - RACY_WINDOW_NS
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.path, INDEX_NAME), 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return _empty_index()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring broken cache index in {self.path}: {e}")
+            return _empty_index()
+        if index.get('version') != INDEX_VERSION:
+            return _empty_index()
+        index.setdefault('verdicts', {})
+        return index
+
+    def clear(self):
+        """
+        キャッシュの内容をすべて破棄します。
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
+        self._index = _empty_index()
+        self._index['clock'] = self._clock
+
+    def save(self):
+        """
+        上限を超えたチャンクを削除し、インデックスをディスクへ書き込みます。
+        """
+        self._evict()
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            tmp_path = os.path.join(self.path, f"{INDEX_NAME}.{os.getpid()}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._index, f, separators=(',', ':'))
+            os.replace(tmp_path, os.path.join(self.path, INDEX_NAME))
+        except OSError as e:
+            logger.warning(f"Error writing cache index to {self.path}: {e}")
+
+    def iter_files(self, key, walk, rule_names=(), rule_files=()):
+        """
+        ファイルリストをキャッシュから返します。無効な場合は walk で走査し直して保存します。
+
+        Args:
+            key (str): list_key で作成したファイルリストのキー。
+            walk (callable): on_dir コールバックを受け取り、ファイルパスを返すイテラブルを作る関数。
+            rule_names (tuple, optional): 各ディレクトリで変更を監視するファイル名 ('.gitignore' など)。
+            rule_files (tuple, optional): 変更を監視する追加のファイルパス (.git/info/exclude など)。
+
+        Yields:
+            str: ファイルパス。
+        """
+        listing = self._index['lists'].get(key)
+        if listing is not None and self._listing_valid(listing):
+            logger.info("Using cached file list.")
+            listing['used'] = self._clock
+            yield from listing['files']
+            return
+
+        dirs = {}
+        rules = {path: _file_signature(path) for path in rule_files}
+
+        def on_dir(path):
+            try:
+                dirs[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                return
+            for name in rule_names:
+                rule_path = os.path.join(path, name)
+                rules[rule_path] = _file_signature(rule_path)
+
+        files = []
+        for file in walk(on_dir):
+            files.append(file)
+            yield file
+
+        # 走査が最後まで終わり、直前に変更されたディレクトリがない場合だけ保存する
+        if any(mtime_ns >= self._racy_after_ns for mtime_ns in dirs.values()):
+            return
+        self._index['lists'][key] = {'dirs': dirs, 'rules': rules, 'files': files, 'used': self._clock}
+
+    def _listing_valid(self, listing):
+        for path, mtime_ns in listing['dirs'].items():
+            try:
+                if os.stat(path).st_mtime_ns != mtime_ns:
+                    return False
+            except OSError:
+                return False
+        for path, signature in listing['rules'].items():
+            if _file_signature(path) != signature:
+                return False
+        return True
+
+    def _key(self, file):
+        return file
+
+    def verdict(self, file, st, sniff):
+        """
+        ファイルがバイナリかどうかを返します。変更のないファイルは前回の判定を返し、それ以外は sniff で判定します。
+
+        Args:
+            file (str): ファイルパス。
+            st (os.stat_result): file の stat 結果。
+            sniff (callable): (ファイルパス, サイズ) を受け取り、バイナリかどうか (判定できない場合は None) を返す関数。
+
+        Returns:
+            bool or None: バイナリの場合は True。判定できない場合は None。
+        """
+        key = self._key(file)
+        verdicts = self._index['verdicts']
+        entry = verdicts.get(key)
+        if entry is not None and entry[_SIZE] == st.st_size and entry[_MTIME] == st.st_mtime_ns \
+                and entry[_INO] == st.st_ino:
+            with self._lock:
+                entry[_VERDICT_USED] = self._clock
+            return entry[_BINARY]
+        binary = sniff(file, st.st_size)
+        if binary is not None and st.st_mtime_ns < self._racy_after_ns:
+            with self._lock:
+                verdicts[key] = [st.st_size, st.st_mtime_ns, st.st_ino, binary, self._clock]
+        return binary
+
+    def _evict_verdicts(self):
+        verdicts = self._index['verdicts']
+        oldest = self._clock - MAX_VERDICT_AGE
+        for key in [key for key, entry in verdicts.items() if entry[_VERDICT_USED] < oldest]:
+            del verdicts[key]
+
+    def load(self, file):
+        """
+        output.load_file と同じ本文を返します。変更のないファイルはキャッシュしたチャンクを返します。
+        """
+        try:
+            st = os.stat(file)
+        except OSError:
+            return None
+
+        entry = self._index['files'].get(file)
+        if entry is not None and entry[_SIZE] == st.st_size and entry[_MTIME] == st.st_mtime_ns \
+                and entry[_INO] == st.st_ino:
+            try:
+                f = open(self._chunk_path(file), 'rb')
+            except OSError:
+                pass
+            else:
+                with self._lock:
+                    entry[_USED] = self._clock
+                    self.hits += 1
+                return Passthrough(f, entry[_CHUNK_SIZE], suffix='')
+
+        body = load_file(file, st)
+        self.remember(file, st, body)
+        return body
+
+    def remember(self, file, st, body):
+        """
+        キャッシュを使わずに読み込んだ本文 (--grep の照合で読み込んだ内容など) を、load の読み込みと同じく記録します。
+        """
+        with self._lock:
+            self.misses += 1
+        # 大きなファイルはすでにパススルーされるため、キャッシュするのは読み込めた本文だけ
+        if isinstance(body, str) and not isinstance(body, ErrorBody) and st.st_mtime_ns < self._racy_after_ns:
+            self._store(self._key(file), st, body)
+
+    def _chunk_path(self, file):
+        name = hashlib.sha1(file.encode('utf-8', 'surrogateescape')).hexdigest()
+        return os.path.join(self._chunks_dir, name[:2], name)
+
+    def _store(self, file, st, body):
+        data = body.encode('utf-8')
+        chunk_path = self._chunk_path(file)
+        try:
+            os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+            tmp_path = f"{chunk_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, chunk_path)
+        except OSError as e:
+            logger.debug(f"Cannot store cache chunk for {file}: {e}")
+            return
+        with self._lock:
+            self._index['files'][file] = [st.st_size, st.st_mtime_ns, st.st_ino, len(data), self._clock]
+
+    def _evict(self):
+        lists = self._index['lists']
+        if len(lists) > MAX_LISTS:
+            for key in sorted(lists, key=lambda k: lists[k]['used'])[:len(lists) - MAX_LISTS]:
+                del lists[key]
+        self._evict_verdicts()
+
+        files = self._index['files']
+        total = sum(entry[_CHUNK_SIZE] for entry in files.values())
+        if total <= self.max_bytes:
+            return
+        for file in sorted(files, key=lambda f: files[f][_USED]):
+            if total <= self.max_bytes:
+                break
+            total -= files.pop(file)[_CHUNK_SIZE]
+            try:
+                os.remove(self._chunk_path(file))
+            except OSError:
+                pass
+        logger.info(f"Evicted cache chunks down to {total} bytes.")
+
+
+class MemoryCache(AggregateCache):
+    """
+    AggregateCache と同じ判定で、ファイルリストと出力チャンクをプロセスのメモリに保持するキャッシュです。
+
+    常駐プロセス (serve) で、ディレクトリごとではなくプロセス全体で1つ使います。
+    出力チャンクはファイルの絶対パスで管理し、合計の文字数が max_bytes を超えた場合は
+    最後に使われたのが古いものから削除します (LRU)。ディスクには何も書き込みません。
+
+    Args:
+        max_bytes (int, optional): 出力チャンクの合計の大きさ (文字数) の上限。デフォルトは 256 MiB。
+        max_lists (int, optional): 保持するファイルリストの数の上限。デフォルトは 16。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, max_lists=MAX_LISTS):
+        self.path = None
+        self.max_bytes = max_bytes
+        self.max_lists = max_lists
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = _empty_index()
+        # 絶対パス -> (サイズ, 更新時刻, inode, 本文)
+        self._chunks = OrderedDict()
+        self._total = 0
+        self.begin()
+
+    def begin(self):
+        """
+        1回の実行の始めに呼び出し、件数と、直前に更新されたファイルを判定する時刻を更新します。
+        """
+        self._index['clock'] += 1
+        self._clock = self._index['clock']
+        self._racy_after_ns = time.time_ns() - RACY_WINDOW_NS
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        with self._lock:
+            self._chunks.clear()
+            self._total = 0
+            self._index['lists'].clear()
+            self._index['verdicts'].clear()
+
+    def save(self):
+        """
+        上限を超えたファイルリストと、しばらく使われていないバイナリの判定を、最後に使われたのが古いものから削除します。
+        """
+        lists = self._index['lists']
+        if len(lists) > self.max_lists:
+            for key in sorted(lists, key=lambda k: lists[k]['used'])[:len(lists) - self.max_lists]:
+                del lists[key]
+        self._evict_verdicts()
+
+    def _key(self, file):
+        return os.path.abspath(file)
+
+    def load(self, file):
+        """
+        output.load_file と同じ本文を返します。変更のないファイルはメモリに保持した本文を返します。
+        """
+        try:
+            st = os.stat(file)
+        except OSError:
+            return None
+
+        key = os.path.abspath(file)
+        with self._lock:
+            entry = self._chunks.get(key)
+            if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns and entry[2] == st.st_ino:
+                self._chunks.move_to_end(key)
+                self.hits += 1
+                return entry[3]
+
+        body = load_file(file, st)
+        self.remember(file, st, body)
+        return body
+
+    def _store(self, key, st, body):
+        with self._lock:
+            old = self._chunks.pop(key, None)
+            if old is not None:
+                self._total -= len(old[3])
+            self._chunks[key] = (st.st_size, st.st_mtime_ns, st.st_ino, body)
+            self._total += len(body)
+            while self._total > self.max_bytes and self._chunks:
+                _, evicted = self._chunks.popitem(last=False)
+                self._total -= len(evicted[3])
@@ -0,0 +1,162 @@
+# classify.py
+
+import os
+import codecs
+import logging
+from codeaggregator.output import load_file, ErrorBody
+
+logger = logging.getLogger(__name__)
+
+# 判定のために読み込む先頭部分の大きさ
+SNIFF_SIZE = 8192
+
+# NUL を含まずに始まることがあるバイナリ形式の先頭バイト列
+MAGIC_NUMBERS = (
+    b'\x89PNG\r\n\x1a\n',     # PNG
+    b'\xff\xd8\xff',          # JPEG
+    b'GIF87a', b'GIF89a',     # GIF
+    b'PK\x03\x04',            # zip, jar, docx, whl など
+    b'%PDF-',                 # PDF
+    b'\x7fELF',               # ELF 実行ファイル
+    b'\x1f\x8b',              # gzip
+    b'\xfd7zXZ\x00',          # xz
+    b'7z\xbc\xaf\x27\x1c',    # 7z
+    b'PACK\x00\x00\x00',      # git の pack ファイル
+    b'\xca\xfe\xba\xbe',      # Java class / Mach-O
+    b'RIFF',                  # wav, avi, webp
+)
+
+BINARY = 'binary'
+OVERSIZED = 'oversized'
+
+
+class SkippedBody(ErrorBody):
+    """
+    読み込まずに省略したファイルの本文 (省略したことを示す1行) です。
+
+    reason に省略した理由 ('binary' または 'oversized') を持ちます。
+    """
+
+    def __new__(cls, text, reason):
+        self = super().__new__(cls, text)
+        self.reason = reason
+        return self
+
+
+def is_binary(prefix, complete=False):
+    """
+    ファイルの先頭部分から、バイナリファイル (UTF-8 のテキストでないファイル) かどうかを判定します。
+
+    NUL バイト、既知の形式の先頭バイト列、UTF-8 として不正なバイト列のいずれかがあればバイナリとみなします。
+    complete が False (prefix がファイルの途中までの場合) は、末尾で途切れた複数バイト文字を不正とはみなしません。
+    """
+    if b'\0' in prefix or prefix.startswith(MAGIC_NUMBERS):
+        return True
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(prefix, final=complete)
+    except UnicodeDecodeError:
+        return True
+    return False
+
+
+def read_prefix(file, size=SNIFF_SIZE):
+    """ファイルの先頭 size バイトを1回の read で読み込みます。読めない場合は None を返します。"""
+    try:
+        with open(file, 'rb') as f:
+            return f.read(size)
+    except OSError:
+        return None
+
+
+class FileClassifier:
+    """
+    ファイルを読み込む前に、大きすぎるファイルとバイナリファイルを判定して省略します。
+
+    判定に使うのは stat のサイズと、先頭 SNIFF_SIZE バイトを1回読んだ内容だけです。
+    キャッシュを指定した場合、変更のないファイルは先頭部分を読まずに前回のバイナリの判定を使います。
+    省略したファイルは見出しを残し、本文を理由を示す1行 (SkippedBody) に置き換えます。
+
+    Args:
+        max_file_size (int, optional): これより大きいファイルは読み込まない (バイト)。デフォルトは None（上限なし）。
+        include_binary (bool, optional): バイナリの判定を行わず、従来どおり読み込むかどうか。デフォルトは False。
+    """
+
+    def __init__(self, max_file_size=None, include_binary=False):
+        self.max_file_size = max_file_size
+        self.include_binary = include_binary
+
+    def classify(self, file, cache=None):
+        """
+        ファイルを判定します。
+
+        Args:
+            file (str): ファイルパス。
+            cache (AggregateCache, optional): バイナリの判定を保持するキャッシュ。デフォルトは None。
+
+        Returns:
+            tuple: (理由, サイズ)。読み込んでよいファイルの理由は None です。存在しない場合は (None, None)。
+        """
+        reason, st = self._classify(file, cache)
+        return reason, st.st_size if st is not None else None
+
+    def _classify(self, file, cache):
+        # (理由, stat 結果) を返す
+        try:
+            st = os.stat(file)
+        except OSError:
+            return None, None
+        size = st.st_size
+        if self.is_oversized(size):
+            return OVERSIZED, st
+        if not self.include_binary and size > 0:
+            binary = cache.verdict(file, st, self._sniff) if cache is not None else self._sniff(file, size)
+            if binary:
+                return BINARY, st
+        return None, st
+
+    @staticmethod
+    def _sniff(file, size):
+        prefix = read_prefix(file)
+        if prefix is None:
+            return None
+        return is_binary(prefix, complete=size <= SNIFF_SIZE)
+
+    def is_oversized(self, size):
+        return self.max_file_size is not None and size > self.max_file_size
+
+    def classify_data(self, data):
+        """
+        読み込み済みの内容 (アーカイブのメンバーなど) を判定します。理由は classify と同じです。
+        """
+        size = len(data)
+        if self.is_oversized(size):
+            return OVERSIZED
+        if not self.include_binary and is_binary(data[:SNIFF_SIZE], complete=size <= SNIFF_SIZE):
+            return BINARY
+        return None
+
+    def skipped(self, file, reason, size):
+        """
+        省略したファイルの本文 (理由を示す1行) を返します。
+        """
+        if reason == OVERSIZED:
+            logger.info(f"Skipped oversized file ({size} bytes): {file}")
+            return SkippedBody(f"(file omitted: {size} bytes exceeds the {self.max_file_size} byte limit)\n",
+                               OVERSIZED)
+        logger.info(f"Skipped binary file: {file}")
+        return SkippedBody(f"(binary file omitted: {size} bytes)\n", BINARY)
+
+    def wrap(self, loader=load_file, cache=None, on_stat=None):
+        """
+        判定を行ってから loader で読み込む関数を返します。cache はバイナリの判定の保持に使います。
+
+        on_stat を指定した場合、判定に使った stat 結果を (ファイルパス, stat) で渡します (存在しないファイルは除く)。
+        """
+        def load(file):
+            reason, st = self._classify(file, cache)
+            if st is not None and on_stat is not None:
+                on_stat(file, st)
+            if reason is not None:
+                return self.skipped(file, reason, st.st_size)
+            return loader(file)
+        return load
@@ -1,20 +1,64 @@
 # cli.py
 
+import os
+import re
+import sys
+import json
 import argparse
 import logging
-from codeaggregator.finder import find_files
-from codeaggregator.output import output_files
+from codeaggregator.aggregator import Aggregator
+from codeaggregator.gitindex import GitIndexError
+from codeaggregator.output import compression_of
+from codeaggregator.formats import FORMATS
+from codeaggregator.cache import AggregateCache, cache_dir
+from codeaggregator.tokens import BUDGET_MODES, BUDGET_PRIORITIES
+from codeaggregator.shard import parse_shard_size, write_shards
+from codeaggregator.watch import watch
+from codeaggregator.excerpt import Excerpter
+from codeaggregator.archive import is_archive
+from codeaggregator.daemon import serve_main
+from codeaggregator.trigram import TrigramIndex, index_main, index_path
+from codeaggregator.transform import TRANSFORMS, default_names
+from codeaggregator.stats import RunStats, PROFILERS, DEFAULT_SLOWEST, profile_run
+
+logger = logging.getLogger(__name__)
 
 def main():
+    argv = sys.argv[1:]
+    if argv[:1] == ['serve']:
+        # 常駐プロセスとして起動する
+        sys.exit(serve_main(argv[1:]))
+    if argv[:1] == ['index']:
+        # --grep で使うトライグラム索引を作成・更新する
+        sys.exit(index_main(argv[1:]))
+
+    args, shard_size, max_file_size, excerpter = parse_args(argv)
+
+    # ログレベルの設定
+    if args.info:
+        logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    else:
+        logging.basicConfig(level=logging.WARNING, format='%(levelname)s: %(message)s')
+
+    with profile_run(args.profile, args.profile_output):
+        run(args, shard_size, max_file_size, excerpter)
+
+def build_parser(prog=None):
+    """
+    コマンドライン引数のパーサーを作成します。
+    """
     parser = argparse.ArgumentParser(
-        description='生成AI用にコードファイルをまとめて出力するツール'
+        prog=prog,
+        description='生成AI用にコードファイルをまとめて出力するツール',
+        epilog='`code-aggregator serve` で常駐プロセスを起動すると、以降の実行は常駐プロセスのキャッシュを使います。'
+               '`code-aggregator index` で --grep の索引を作成・更新します'
     )
     # 'directory' 引数をオプションの位置引数に変更
     parser.add_argument(
         'directory',
         nargs='?',  # 0または1の引数を受け取る
         default='.',  # デフォルト値をカレントディレクトリに設定
-        help='検索対象のディレクトリ (デフォルト: カレントディレクトリ)'
+        help='検索対象のディレクトリ、または .tar/.tar.gz/.tar.xz/.zip などのアーカイブ (デフォルト: カレントディレクトリ)'
     )
     parser.add_argument(
         '-P', '--pattern',
@@ -31,15 +75,178 @@ def main():
         const='.',
         help='ファイルリストを指定。パイプ入力の場合は何も指定せずに使用。例: --fromfile, --fromfile=path.txt'
     )
+    parser.add_argument(
+        '-0', '--null',
+        action='store_true',
+        help='--fromfile のファイルリストを NUL 区切りで読み取る (git ls-files -z, find -print0 などの出力)'
+    )
     parser.add_argument(
         '-a', '--all',
         action='store_true',
         help='隠しファイルやフォルダも含める'
     )
+    parser.add_argument(
+        '--gitignore',
+        action='store_true',
+        help='.gitignore (ネストしたものや .git/info/exclude を含む) に従ってファイルを除外する'
+    )
+    parser.add_argument(
+        '--git-tracked',
+        action='store_true',
+        help='ディレクトリを走査せず、.git/index に登録されている (git で管理している) ファイルを対象にする。'
+             'インデックスからはパスとサイズだけを使い、読み込む各ファイルは stat する'
+    )
+    parser.add_argument(
+        '--grep',
+        metavar='REGEX',
+        help='内容が正規表現 REGEX に一致するファイルだけを出力する (キャッシュが有効ならトライグラム索引で候補を絞り込む)'
+    )
     parser.add_argument(
         '-o', '--output',
         help='出力先を指定（デフォルトは標準出力）'
     )
+    parser.add_argument(
+        '--format',
+        dest='output_format',
+        choices=sorted(FORMATS),
+        default='text',
+        help='出力形式。text: 従来の区切り線の形式、jsonl: 1ファイル1行のJSON、'
+             'indexed: 内容を連結し末尾にオフセット表を置くバイナリ形式 (デフォルト: text)'
+    )
+    parser.add_argument(
+        '--compress-level',
+        type=int,
+        metavar='N',
+        help='-o の拡張子が .gz/.xz/.bz2 の場合の圧縮レベル (0-9, bz2 は 1-9)'
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=1,
+        metavar='N',
+        help='ファイル読み込みに使うスレッド数 (デフォルト: 1)。出力順は変わりません'
+    )
+    parser.add_argument(
+        '--walk-threads',
+        type=int,
+        default=1,
+        metavar='N',
+        help='ディレクトリの走査に使うスレッド数 (デフォルト: 1)。出力順は変わりません'
+    )
+    parser.add_argument(
+        '--max-file-size',
+        metavar='SIZE',
+        help='SIZE より大きいファイルは読み込まずに省略する。例: 1m, 500k'
+    )
+    parser.add_argument(
+        '--include-binary',
+        action='store_true',
+        help='バイナリファイルを省略せずに読み込む (デフォルトでは先頭を調べてバイナリと判定したファイルは省略する)'
+    )
+    parser.add_argument(
+        '--head-lines',
+        type=int,
+        metavar='N',
+        help='各ファイルの先頭 N 行だけを出力する (--tail-lines と併用すると先頭と末尾)'
+    )
+    parser.add_argument(
+        '--tail-lines',
+        type=int,
+        metavar='N',
+        help='各ファイルの末尾 N 行だけを出力する'
+    )
+    parser.add_argument(
+        '--max-bytes-per-file',
+        metavar='SIZE',
+        help='各ファイルから出力するバイト数の上限。例: 64k'
+    )
+    parser.add_argument(
+        '--transform',
+        metavar='NAMES',
+        help=f'書き込む前に本文を変換する ({", ".join(TRANSFORMS)} をカンマ区切りで指定、all は {",".join(default_names())})。'
+             'python: コメントと空行を除く, c: C 系の言語のコメントを除く, whitespace: その他のファイルの行末の空白と連続する空行を除く '
+             '(すべてのファイルを読み込んでデコードするため、大きなファイルのパススルーが無効になる。名前で指定した場合だけ使う)'
+    )
+    parser.add_argument(
+        '--transform-jobs',
+        type=int,
+        metavar='N',
+        help='--transform の変換に使うプロセス数 (デフォルト: CPU 数)。出力順は変わりません'
+    )
+    parser.add_argument(
+        '--dedupe',
+        action='store_true',
+        help='内容が同じファイルは最初のファイルへの参照行に置き換える'
+    )
+    parser.add_argument(
+        '--max-tokens',
+        type=int,
+        metavar='N',
+        help='出力全体のトークン数 (概算) の上限'
+    )
+    parser.add_argument(
+        '--budget-mode',
+        choices=BUDGET_MODES,
+        default='skip',
+        help='上限を超えるファイルの扱い: skip=省略して続行, truncate=切り詰めて終了, stop=以降を省略 (デフォルト: skip)'
+    )
+    parser.add_argument(
+        '--budget-priority',
+        choices=BUDGET_PRIORITIES,
+        default='order',
+        help='--max-tokens 指定時の出力順: order=見つかった順, path=パス順, smallest=小さい順 (デフォルト: order)'
+    )
+    parser.add_argument(
+        '--shard-size',
+        metavar='SIZE',
+        help='出力を SIZE ごとのファイル (out.001.txt, ...) に分割する。例: 500k (バイト), 120kt (トークン)'
+    )
+    parser.add_argument(
+        '--shards',
+        type=int,
+        metavar='N',
+        help='出力をサイズが均等な N 個のファイルに分割する'
+    )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='出力後も変更を監視し、変更されたファイルだけを読み直して -o の出力先を更新し続ける'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='$XDG_CACHE_HOME/codeaggregator/ (デフォルトは ~/.cache/codeaggregator/) のキャッシュを使わない'
+    )
+    parser.add_argument(
+        '--rebuild-cache',
+        action='store_true',
+        help='キャッシュを破棄して作り直す'
+    )
+    parser.add_argument(
+        '--stats',
+        action='store_true',
+        help='走査・読み込み・書き込みの時間、スキップしたファイル数、遅いファイルを標準エラー出力に表示する'
+    )
+    parser.add_argument(
+        '--stats-json',
+        metavar='FILE',
+        help='--stats と同じ内容を JSON で FILE に保存する'
+    )
+    parser.add_argument(
+        '--profile',
+        choices=PROFILERS,
+        help='実行全体を cProfile または tracemalloc で計測する'
+    )
+    parser.add_argument(
+        '--profile-output',
+        metavar='FILE',
+        help='--profile の結果を保存するファイル (省略時は標準エラー出力に表示)'
+    )
+    parser.add_argument(
+        '--no-daemon',
+        action='store_true',
+        help='常駐プロセス (serve) が起動していても使わずに実行する'
+    )
     parser.add_argument(
         '-v', '--version',
         action='version',
@@ -52,29 +259,216 @@ def main():
         help='詳細情報の表示 (INFOレベルのログを有効にします)'
     )
 
-    args = parser.parse_args()
+    return parser
 
-    # ログレベルの設定
-    if args.info:
-        logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
-    else:
-        logging.basicConfig(level=logging.WARNING, format='%(levelname)s: %(message)s')
+def parse_args(argv, prog=None):
+    """
+    コマンドライン引数を解析して検証します。不正な場合は parser.error で終了します。
+
+    Returns:
+        tuple: (args, shard_size, max_file_size, excerpter)。
+    """
+    parser = build_parser(prog)
+    args = parser.parse_args(argv)
+
+    for option, value in (('-j/--jobs', args.jobs), ('--walk-threads', args.walk_threads), ('--shards', args.shards)):
+        if value is not None and value < 1:
+            parser.error(f'{option} には 1 以上を指定してください')
+    if args.git_tracked and args.fromfile:
+        parser.error('--git-tracked と --fromfile は同時に指定できません')
+    if args.null and not args.fromfile:
+        parser.error('-0/--null には --fromfile の指定が必要です')
+    if args.grep is not None:
+        try:
+            re.compile(args.grep)
+        except re.error as e:
+            parser.error(f'--grep の正規表現が不正です: {e}')
+
+    if args.watch:
+        if not args.output:
+            parser.error('--watch には -o で出力先を指定してください')
+        if args.fromfile or args.git_tracked or args.shard_size or args.shards \
+                or args.max_tokens is not None or args.dedupe or args.grep is not None:
+            parser.error('--watch は --fromfile/--git-tracked/--shard-size/--shards/--max-tokens/--dedupe/--grep '
+                         'と同時に指定できません')
+
+    compression = compression_of(args.output) if args.output else None
+    if compression is not None:
+        if args.watch or args.shard_size or args.shards:
+            parser.error('圧縮した出力 (.gz/.xz/.bz2) は --watch/--shard-size/--shards と同時に指定できません')
+    if args.compress_level is not None:
+        if compression is None:
+            parser.error('--compress-level には -o で .gz/.xz/.bz2 の出力先を指定してください')
+        if not (1 if compression == 'bz2' else 0) <= args.compress_level <= 9:
+            parser.error(f'{compression} の圧縮レベルが範囲外です: {args.compress_level}')
+
+    transforms = None
+    if args.transform:
+        transforms = default_names() if args.transform == 'all' else args.transform.split(',')
+        unknown = [name for name in transforms if name not in TRANSFORMS]
+        if unknown:
+            parser.error(f"不明な変換です: {', '.join(unknown)} (指定できるもの: {', '.join(TRANSFORMS)}, all)")
+        if args.watch or args.shard_size or args.shards:
+            parser.error('--transform は --watch/--shard-size/--shards と同時に指定できません')
+    elif args.transform_jobs is not None:
+        parser.error('--transform-jobs には --transform の指定が必要です')
+    if args.transform_jobs is not None and args.transform_jobs < 1:
+        parser.error('--transform-jobs には 1 以上を指定してください')
+    args.transform = transforms
+
+    if args.output_format != 'text':
+        if args.watch or args.shard_size or args.shards:
+            parser.error('--format jsonl/indexed は --watch/--shard-size/--shards と同時に指定できません')
+        if args.output_format == 'indexed' and compression is not None:
+            parser.error('--format indexed は圧縮した出力 (.gz/.xz/.bz2) と同時に指定できません')
+
+    if is_archive(args.directory):
+        if args.fromfile or args.git_tracked or args.gitignore or args.watch or args.shard_size or args.shards \
+                or args.dedupe or args.budget_priority != 'order' or args.grep is not None:
+            parser.error('アーカイブには --fromfile/--git-tracked/--gitignore/--watch/--shard-size/--shards/--dedupe/'
+                         '--grep/--budget-priority path|smallest を指定できません')
+
+    max_file_size = parse_byte_size(parser, args.max_file_size)
+    max_bytes_per_file = parse_byte_size(parser, args.max_bytes_per_file)
+    for name in ('head_lines', 'tail_lines'):
+        value = getattr(args, name)
+        if value is not None and value < 0:
+            parser.error(f"--{name.replace('_', '-')} には 0 以上を指定してください")
+
+    shard_size = None
+    if args.shard_size or args.shards:
+        if not args.output:
+            parser.error('--shard-size/--shards には -o で出力先を指定してください')
+        if args.shard_size and args.shards:
+            parser.error('--shard-size と --shards は同時に指定できません')
+        if args.max_tokens is not None or args.dedupe:
+            parser.error('--max-tokens/--dedupe は --shard-size/--shards と同時に指定できません')
+        if args.shard_size:
+            try:
+                shard_size = parse_shard_size(args.shard_size)
+            except ValueError as e:
+                parser.error(str(e))
+
+    excerpter = Excerpter(args.head_lines, args.tail_lines, max_bytes_per_file)
+    return args, shard_size, max_file_size, excerpter
+
+def run(args, shard_size=None, max_file_size=None, excerpter=None, cache=None):
+    """
+    解析済みのコマンドライン引数から Aggregator を作成し、ファイルを検索して出力します。
+
+    cache を指定した場合は、ディレクトリごとのキャッシュの代わりに使います (常駐プロセスの MemoryCache など)。
+    """
+    stats = RunStats(DEFAULT_SLOWEST) if args.stats or args.stats_json else None
 
     # パターンをリストに変換
     patterns = expand_patterns(args.pattern) if args.pattern else None
     ignore_patterns = expand_patterns(args.ignore) if args.ignore else None
 
-    # ファイル検索
-    files = find_files(
-        directory=args.directory,
+    aggregator = Aggregator(
         patterns=patterns,
         ignore_patterns=ignore_patterns,
-        fromfile=args.fromfile,
-        include_hidden=args.all  # -a オプションに基づき隠しファイルを含める
+        include_hidden=args.all,  # -a オプションに基づき隠しファイルを含める
+        gitignore=args.gitignore,
+        # 読み込む前に大きすぎるファイルとバイナリファイルを判定し、必要なら先頭/末尾だけを読み込む
+        max_file_size=max_file_size,
+        include_binary=args.include_binary,
+        excerpter=excerpter,
+        jobs=args.jobs,
+        walk_threads=args.walk_threads,
+        dedupe=args.dedupe,
+        max_tokens=args.max_tokens,
+        budget_mode=args.budget_mode,
+        budget_priority=args.budget_priority,
+        output_format=args.output_format,
+        grep=args.grep,
+        transforms=args.transform,
+        transform_jobs=args.transform_jobs
     )
 
-    # 検索結果の出力
-    output_files(files, args.output)
+    # アーカイブはキャッシュを使わない
+    if args.no_cache or is_archive(args.directory):
+        cache = None
+    elif cache is None:
+        cache = AggregateCache(cache_dir(args.directory))
+    # 常駐プロセスから渡された MemoryCache も作り直す
+    if cache is not None and args.rebuild_cache:
+        cache.clear()
+
+    # --grep の索引はキャッシュと同じ場所に置き、キャッシュを使わない場合はすべてのファイルを読んで照合する
+    index = None
+    if args.grep is not None and cache is not None:
+        index = TrigramIndex(index_path(args.directory))
+        if args.rebuild_cache:
+            index.clear()
+
+    if args.watch:
+        try:
+            watch(args.output, aggregator.walker(args.directory, stats), jobs=args.jobs,
+                  loader=aggregator.loader(cache))
+        except KeyboardInterrupt:
+            pass
+        if cache is not None:
+            cache.save()
+        return
+
+    result = None
+    try:
+        if shard_size or args.shards:
+            files, size_of, source = aggregator.select(args.directory, args.fromfile, args.null, args.git_tracked,
+                                                       cache, stats, index)
+            size, unit = shard_size or (None, 'bytes')
+            write_shards(files, args.output, shard_size=size, unit=unit, shards=args.shards,
+                         jobs=args.jobs, loader=aggregator.loader(cache, source), size_of=size_of)
+            if cache is not None:
+                logger.info(f"Cache hits: {cache.hits}, misses: {cache.misses}")
+        else:
+            result = aggregator.render(args.directory, args.output, args.fromfile, args.null, args.git_tracked,
+                                       cache, stats, compress_level=args.compress_level, index=index)
+    except GitIndexError as e:
+        logger.error(f"Cannot read git index: {e}")
+        sys.exit(1)
+    budget = result.budget if result is not None else None
+
+    if result is not None and result.dedupe is not None:
+        logger.info(f"Replaced {result.dedupe.duplicates} duplicate file(s), saving {result.dedupe.saved_bytes} bytes.")
+
+    if budget is not None:
+        print('\n'.join(budget.summary()), file=sys.stderr)
+    transformer = result.transformer if result is not None else None
+
+    if cache is not None:
+        cache.save()
+    if index is not None:
+        index.save()
+
+    if stats is not None:
+        stats.stop()
+        if budget is not None:
+            stats.skipped['budget'] = len(budget.omitted)
+        if transformer is not None:
+            stats.transforms = transformer.to_dict()
+        if args.stats:
+            print('\n'.join(stats.report()), file=sys.stderr)
+        if args.stats_json:
+            with open(args.stats_json, 'w', encoding='utf-8') as f:
+                json.dump(stats.to_dict(), f, ensure_ascii=False, indent=2)
+
+    if result is not None and result.error is not None:
+        sys.exit(1)
+
+def parse_byte_size(parser, value):
+    """
+    '64k' のようなバイト数の指定を解析します。未指定の場合は None を返します。
+    """
+    if not value:
+        return None
+    try:
+        size, unit = parse_shard_size(value)
+    except ValueError:
+        unit = None
+    if unit != 'bytes':
+        parser.error(f'Invalid size: {value}')
+    return size
 
 def expand_patterns(pattern_str):
     """
@@ -0,0 +1,117 @@
+# client.py
+
+import os
+import sys
+import socket
+import struct
+
+# ソケットのパスを指定する環境変数
+SOCKET_ENV = 'CODEAGGREGATOR_SOCKET'
+
+# 応答のフレームの種類 (1バイト): 標準出力、標準エラー出力、終了ステータス、このプロセスでの実行の指示
+STDOUT, STDERR, EXIT, LOCAL = b'o', b'e', b'x', b'l'
+FRAME_HEADER = struct.Struct('>cI')
+REQUEST_HEADER = struct.Struct('>I')
+
+
+class DaemonError(Exception):
+    """常駐プロセスとの通信に失敗した場合に送出されます。"""
+
+
+def socket_path():
+    """
+    常駐プロセスのソケットのパスを返します。
+
+    環境変数 CODEAGGREGATOR_SOCKET、$XDG_RUNTIME_DIR、$TMPDIR (/tmp) の順に決めます。
+    """
+    path = os.environ.get(SOCKET_ENV)
+    if path:
+        return path
+    base = os.environ.get('XDG_RUNTIME_DIR') or os.environ.get('TMPDIR') or '/tmp'
+    uid = os.getuid() if hasattr(os, 'getuid') else 0
+    return os.path.join(base, f'codeaggregator-{uid}.sock')
+
+
+def daemon_available(path=None):
+    """常駐プロセスのソケットがあるかどうかを、接続せずに返します。"""
+    return hasattr(socket, 'AF_UNIX') and os.path.exists(path or socket_path())
+
+
+def encode_request(argv, cwd):
+    # 引数に NUL は含まれないため、NUL 区切りで送る (デコードできないパスもそのまま送る)
+    return '\0'.join([cwd] + list(argv)).encode('utf-8', 'surrogateescape')
+
+
+def decode_request(data):
+    cwd, *argv = data.decode('utf-8', 'surrogateescape').split('\0')
+    return cwd, argv
+
+
+def recv_exact(f, size):
+    data = f.read(size)
+    if len(data) < size:
+        raise DaemonError('Connection to the server closed unexpectedly')
+    return data
+
+
+def daemon_request(argv, path=None, stdout=None, stderr=None, cwd=None):
+    """
+    常駐プロセスに argv の実行を依頼し、出力を stdout/stderr へ書き込みます。
+
+    Args:
+        argv (list): コマンドライン引数 (プログラム名を除く)。
+        path (str, optional): ソケットのパス。デフォルトは socket_path()。
+        stdout, stderr (optional): 出力を書き込むバイナリストリーム。デフォルトは標準出力/標準エラー出力。
+        cwd (str, optional): 実行するディレクトリ。デフォルトはカレントディレクトリ。
+
+    Returns:
+        int or None: 終了ステータス。常駐プロセスが起動していない場合や、
+            常駐プロセスでは実行できない引数の場合は None。
+    """
+    stdout = stdout if stdout is not None else sys.stdout.buffer
+    stderr = stderr if stderr is not None else sys.stderr.buffer
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path or socket_path())
+    except (FileNotFoundError, ConnectionRefusedError):
+        # 終了した常駐プロセスのソケットが残っている場合も、このプロセスで実行する
+        sock.close()
+        return None
+
+    with sock, sock.makefile('rb') as f:
+        payload = encode_request(argv, cwd or os.getcwd())
+        try:
+            sock.sendall(REQUEST_HEADER.pack(len(payload)) + payload)
+            while True:
+                kind, size = FRAME_HEADER.unpack(recv_exact(f, FRAME_HEADER.size))
+                data = recv_exact(f, size)
+                if kind == LOCAL:
+                    return None
+                if kind == EXIT:
+                    stdout.flush()
+                    stderr.flush()
+                    return int(data)
+                (stdout if kind == STDOUT else stderr).write(data)
+        except OSError as e:
+            raise DaemonError(f"Error communicating with the server: {e}") from e
+
+
+def main():
+    """
+    コマンドのエントリポイントです。
+
+    常駐プロセス (code-aggregator serve) が起動していれば処理を依頼し、
+    起動していなければ cli.main を実行します。依頼するだけの場合は、他のモジュールを読み込みません。
+    """
+    argv = sys.argv[1:]
+    if argv[:1] not in (['serve'], ['index']) and '--no-daemon' not in argv and daemon_available():
+        try:
+            status = daemon_request(argv)
+        except DaemonError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            sys.exit(1)
+        if status is not None:
+            sys.exit(status)
+
+    from codeaggregator.cli import main as cli_main
+    cli_main()
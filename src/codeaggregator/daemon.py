@@ -0,0 +1,229 @@
+# daemon.py
+
+import io
+import os
+import sys
+import socket
+import signal
+import logging
+import argparse
+import contextlib
+import socketserver
+from codeaggregator.cache import MemoryCache, DEFAULT_MAX_BYTES
+from codeaggregator.client import (SOCKET_ENV, STDOUT, STDERR, EXIT, LOCAL, FRAME_HEADER, REQUEST_HEADER,
+                                   DaemonError, socket_path, decode_request, recv_exact)
+
+logger = logging.getLogger(__name__)
+
+
+def runs_locally(args):
+    """
+    常駐プロセスではなく依頼元のプロセスで実行する引数かどうかを返します。
+
+    標準入力を使う --fromfile、実行し続ける --watch、依頼元のプロセスを計測する --profile と、
+    スレッドで依頼を処理する常駐プロセスからはプロセスプールを作らないよう --transform が該当します。
+    """
+    return bool(args.no_daemon or args.watch or args.fromfile == '.' or args.profile or args.transform)
+
+
+class _FrameWriter(io.RawIOBase):
+    """書き込まれたバイト列を、種類を付けたフレームとしてソケットへ送ります。"""
+
+    def __init__(self, wfile, kind):
+        self._wfile = wfile
+        self._kind = kind
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        size = len(data)
+        if size:
+            self._wfile.write(FRAME_HEADER.pack(self._kind, size))
+            self._wfile.write(data)
+        return size
+
+
+def _text_stream(wfile, kind):
+    return io.TextIOWrapper(io.BufferedWriter(_FrameWriter(wfile, kind)), encoding='utf-8', write_through=True)
+
+
+@contextlib.contextmanager
+def _request_logging(stream):
+    """
+    実行中のログを、依頼元へ送る標準エラー出力にも書き込みます。レベルは yield した関数で設定します。
+    """
+    root = logging.getLogger()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+    level = root.level
+    root.addHandler(handler)
+    try:
+        yield lambda info: root.setLevel(logging.INFO if info else logging.WARNING)
+    finally:
+        root.removeHandler(handler)
+        root.setLevel(level)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            (size,) = REQUEST_HEADER.unpack(recv_exact(self.rfile, REQUEST_HEADER.size))
+            cwd, argv = decode_request(recv_exact(self.rfile, size))
+        except (DaemonError, ValueError) as e:
+            logger.warning(f"Ignoring malformed request: {e}")
+            return
+        try:
+            status = self.server.execute(cwd, argv, self.wfile)
+            if status is None:
+                self.wfile.write(FRAME_HEADER.pack(LOCAL, 0))
+            else:
+                self.wfile.write(FRAME_HEADER.pack(EXIT, len(str(status))) + str(status).encode('ascii'))
+        except OSError as e:
+            # 依頼元が途中で切断した場合
+            logger.info(f"Client disconnected: {e}")
+
+
+class AggregatorServer(socketserver.UnixStreamServer):
+    """
+    Unix ソケットで依頼を受け付け、MemoryCache を使って実行する常駐プロセスのサーバーです。
+
+    依頼は1件ずつ順に実行します。ファイルリストと出力チャンクはプロセスのメモリに保持し、
+    ディレクトリの更新時刻とファイルの stat で変更を判定するため、2回目以降は変更のあった部分だけを読み込みます。
+
+    Args:
+        path (str): ソケットのパス。
+        max_bytes (int, optional): 保持する出力チャンクの合計の上限。デフォルトは 256 MiB。
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache = MemoryCache(max_bytes)
+        # 所有者以外が接続できないよう、ソケットを作成する間だけ umask を絞る
+        umask = os.umask(0o077)
+        try:
+            super().__init__(path, _RequestHandler)
+        finally:
+            os.umask(umask)
+
+    def execute(self, cwd, argv, wfile):
+        """
+        依頼された引数で cli.run を cwd で実行し、出力をフレームとして wfile へ送ります。
+
+        Returns:
+            int or None: 終了ステータス。依頼元で実行すべき引数の場合は None。
+        """
+        from codeaggregator import cli
+
+        out = _text_stream(wfile, STDOUT)
+        err = _text_stream(wfile, STDERR)
+        server_cwd = os.getcwd()
+        status = 0
+        try:
+            os.chdir(cwd)
+            with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err), \
+                    _request_logging(err) as set_level:
+                try:
+                    args, shard_size, max_file_size, excerpter = cli.parse_args(argv, 'code-aggregator')
+                    if runs_locally(args):
+                        return None
+                    set_level(args.info)
+                    self.cache.begin()
+                    cli.run(args, shard_size, max_file_size, excerpter, cache=self.cache)
+                    logger.info(f"Served from memory: hits {self.cache.hits}, misses {self.cache.misses}")
+                except SystemExit as e:
+                    if isinstance(e.code, int) or e.code is None:
+                        status = e.code or 0
+                    else:
+                        print(e.code, file=sys.stderr)
+                        status = 1
+                except Exception as e:
+                    logger.exception(f"Error while serving request: {e}")
+                    status = 1
+        except OSError as e:
+            print(f"Error: {e}", file=err)
+            status = 1
+        finally:
+            os.chdir(server_cwd)
+            out.flush()
+            err.flush()
+        return status
+
+
+def serve(path=None, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    常駐プロセスとして依頼を待ち受けます。終了するとソケットを削除します。
+    """
+    path = path or socket_path()
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            # 異常終了した常駐プロセスのソケットは削除して作り直す
+            os.unlink(path)
+        else:
+            raise DaemonError(f"A server is already listening on {path}")
+        finally:
+            probe.close()
+
+    server = AggregatorServer(path, max_bytes)
+    logger.info(f"Listening on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def serve_main(argv):
+    """
+    `code-aggregator serve` のエントリポイントです。
+    """
+    from codeaggregator.shard import parse_shard_size
+
+    parser = argparse.ArgumentParser(
+        prog='code-aggregator serve',
+        description='キャッシュをメモリに保持したまま依頼を待ち受ける常駐プロセスを起動する'
+    )
+    parser.add_argument(
+        '--socket',
+        metavar='PATH',
+        help=f'待ち受ける Unix ソケットのパス (デフォルト: ${SOCKET_ENV} または {socket_path()})'
+    )
+    parser.add_argument(
+        '--cache-size',
+        metavar='SIZE',
+        help='メモリに保持する出力の合計の上限。例: 512m (デフォルト: 256m)'
+    )
+    parser.add_argument(
+        '-i', '--info',
+        action='store_true',
+        help='詳細情報の表示 (INFOレベルのログを有効にします)'
+    )
+    args = parser.parse_args(argv)
+
+    if not hasattr(socket, 'AF_UNIX'):
+        parser.error('この環境では Unix ソケットを使えません')
+    max_bytes = DEFAULT_MAX_BYTES
+    if args.cache_size:
+        try:
+            max_bytes, unit = parse_shard_size(args.cache_size)
+        except ValueError:
+            unit = None
+        if unit != 'bytes':
+            parser.error(f'Invalid size: {args.cache_size}')
+
+    logging.basicConfig(level=logging.INFO if args.info else logging.WARNING, format='%(levelname)s: %(message)s')
+    # SIGTERM でもソケットを削除してから終了する
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        serve(args.socket, max_bytes)
+    except DaemonError as e:
+        logger.error(f"{e}")
+        return 1
+    return 0
@@ -0,0 +1,153 @@
+# dedupe.py
+
+import os
+import mmap
+import hashlib
+import logging
+from codeaggregator.output import load_file, Passthrough, ErrorBody
+
+logger = logging.getLogger(__name__)
+
+# 事前判定に使う先頭部分の大きさ
+PREFIX_SIZE = 4096
+
+# ハッシュを計算する際に一度に処理する大きさ
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _body_size_and_prefix(body):
+    if isinstance(body, Passthrough):
+        suffix = body.suffix.encode('utf-8')
+        with mmap.mmap(body.file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            prefix = mm[:PREFIX_SIZE]
+        return body.size + len(suffix), prefix
+    data = body.encode('utf-8')
+    return len(data), data[:PREFIX_SIZE]
+
+
+def _digest(body):
+    """
+    本文 (見出しを除く出力部分) のハッシュ値を返します。
+    """
+    h = hashlib.blake2b(digest_size=20)
+    if isinstance(body, Passthrough):
+        with mmap.mmap(body.file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = min(body.size, len(mm))
+            for start in range(0, end, HASH_CHUNK_SIZE):
+                h.update(mm[start:min(start + HASH_CHUNK_SIZE, end)])
+        h.update(body.suffix.encode('utf-8'))
+    else:
+        h.update(body.encode('utf-8'))
+    return h.digest()
+
+
+class Deduper:
+    """
+    内容が同じファイルを検出し、2つ目以降を最初のファイルへの参照に置き換えます。
+
+    - ハードリンクやシンボリックリンクは (st_dev, st_ino) で判定し、ハッシュを計算しません。
+    - 内容の比較は (サイズ, 先頭 4 KiB) が一致するファイルがある場合だけハッシュで行います。
+      (サイズ, 先頭) が他と重ならないファイルはハッシュを計算せず、読み込みも出力時の1回だけです。
+      一致した場合は、先に出力したファイルのハッシュをそのとき初めて計算します。
+
+    Args:
+        loader (callable, optional): ハッシュ計算のために先のファイルを読み直す関数。デフォルトは load_file。
+    """
+
+    def __init__(self, loader=load_file):
+        self.loader = loader
+        self.duplicates = 0
+        self.saved_bytes = 0
+        self._inodes = {}
+        # (サイズ, 先頭部分) -> [ファイルパス, ...]
+        self._candidates = {}
+        # ファイルパス -> ハッシュ値
+        self._digests = {}
+        # ハッシュ値 -> 最初のファイルパス
+        self._by_digest = {}
+
+    def check(self, file, body):
+        """
+        file が以前に出力したファイルと同じ内容かを判定し、新しいファイルとして記録します。
+
+        Returns:
+            str or None: 同じ内容の最初のファイルパス。重複でなければ None。
+        """
+        if isinstance(body, ErrorBody):
+            return None
+        try:
+            st = os.stat(file)
+            inode = (st.st_dev, st.st_ino)
+        except OSError:
+            inode = None
+        if inode is not None:
+            first = self._inodes.get(inode)
+            if first is not None:
+                return self._found(first, body)
+
+        size, prefix = _body_size_and_prefix(body)
+        key = (size, prefix)
+        candidates = self._candidates.get(key)
+        if candidates is None:
+            self._candidates[key] = [file]
+        else:
+            digest = _digest(body)
+            for candidate in candidates:
+                if candidate not in self._digests:
+                    candidate_digest = self._digest_of(candidate)
+                    self._digests[candidate] = candidate_digest
+                    if candidate_digest is not None:
+                        self._by_digest.setdefault(candidate_digest, candidate)
+            first = self._by_digest.get(digest)
+            if first is not None:
+                if inode is not None:
+                    self._inodes[inode] = first
+                return self._found(first, body, size)
+            candidates.append(file)
+            self._digests[file] = digest
+            self._by_digest[digest] = file
+
+        if inode is not None:
+            self._inodes[inode] = file
+        return None
+
+    def forget(self, file):
+        """
+        check で記録した file を取り消し、以降の重複の参照先にしないようにします。
+
+        予算により省略または切り詰めたファイルに使います。同じ内容の次のファイルが新しい最初のファイルになります。
+        """
+        for key, candidates in list(self._candidates.items()):
+            if file in candidates:
+                candidates.remove(file)
+                if not candidates:
+                    del self._candidates[key]
+        digest = self._digests.pop(file, None)
+        if digest is not None and self._by_digest.get(digest) == file:
+            del self._by_digest[digest]
+        for inode, first in list(self._inodes.items()):
+            if first == file:
+                del self._inodes[inode]
+
+    def reference(self, first):
+        """重複したファイルの本文の代わりに出力する参照行を返します。"""
+        return f"(duplicate of {first})\n"
+
+    def _found(self, first, body, size=None):
+        if size is None:
+            size, _ = _body_size_and_prefix(body)
+        self.duplicates += 1
+        self.saved_bytes += size
+        if isinstance(body, Passthrough):
+            body.file.close()
+        return first
+
+    def _digest_of(self, file):
+        body = self.loader(file)
+        if body is None:
+            return None
+        try:
+            return _digest(body)
+        finally:
+            if isinstance(body, Passthrough):
+                body.file.close()
@@ -0,0 +1,187 @@
+# excerpt.py
+
+import os
+import codecs
+import logging
+from codeaggregator.output import load_file, decode_text, ErrorBody
+
+logger = logging.getLogger(__name__)
+
+# 行の境界を探す際に一度に読み込む大きさ
+BLOCK_SIZE = 64 * 1024
+
+
+def _find_head_end(f, lines, limit):
+    """
+    先頭から lines 行目の終わり (改行の直後) の位置を、limit バイトまでの前方読み込みで探します。
+
+    Returns:
+        int: 見つかった位置。lines 行に満たない場合は読み込んだ終わりの位置 (limit 以下)。
+    """
+    f.seek(0)
+    offset = 0
+    remaining = lines
+    while offset < limit:
+        block = f.read(min(BLOCK_SIZE, limit - offset))
+        if not block:
+            break
+        count = block.count(b'\n')
+        if count >= remaining:
+            pos = -1
+            for _ in range(remaining):
+                pos = block.index(b'\n', pos + 1)
+            return offset + pos + 1
+        remaining -= count
+        offset += len(block)
+    return offset
+
+
+def _find_tail_start(f, size, lines, floor):
+    """
+    末尾の lines 行の始まりの位置を、末尾からのブロック単位の後方読み込みで探します。
+
+    ファイル末尾の改行は行の終わりとして扱い、floor より前は探しません。
+
+    Returns:
+        int: 見つかった位置。floor までに lines 行に満たない場合は floor。
+    """
+    end = size
+    if end > floor:
+        f.seek(end - 1)
+        if f.read(1) == b'\n':
+            end -= 1
+    remaining = lines
+    while end > floor:
+        start = max(end - BLOCK_SIZE, floor)
+        f.seek(start)
+        block = f.read(end - start)
+        count = block.count(b'\n')
+        if count >= remaining:
+            pos = len(block)
+            for _ in range(remaining):
+                pos = block.rindex(b'\n', 0, pos)
+            return start + pos + 1
+        remaining -= count
+        end = start
+    return floor
+
+
+def _split_incomplete(data):
+    """
+    data を UTF-8 として末尾で途切れた文字の手前まで返します (不正なバイト列は UnicodeDecodeError)。
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    decoder.decode(data, final=False)
+    pending, _ = decoder.getstate()
+    return data[:len(data) - len(pending)]
+
+
+def _skip_continuation(data):
+    """data の先頭にある UTF-8 の継続バイト (途中から始まった文字の残り) の数を返します。"""
+    skip = 0
+    while skip < min(len(data), 3) and (data[skip] & 0xC0) == 0x80:
+        skip += 1
+    return skip
+
+
+class Excerpter:
+    """
+    大きなファイルの先頭/末尾の行だけを読み込み、省略した部分を示す行を挟んだ本文を作ります。
+
+    先頭は必要な行までの前方読み込み、末尾は seek による後方読み込みで探すため、
+    読み込む量はファイルサイズではなく残す行数 (とブロックの大きさ) で決まります。
+    残す範囲がファイル全体になる場合は、元の loader でそのまま読み込みます。
+
+    Args:
+        head_lines (int, optional): 残す先頭の行数。
+        tail_lines (int, optional): 残す末尾の行数。
+        max_bytes (int, optional): 1ファイルあたりに残すバイト数の上限。
+    """
+
+    def __init__(self, head_lines=None, tail_lines=None, max_bytes=None):
+        self.head_lines = head_lines
+        self.tail_lines = tail_lines
+        self.max_bytes = max_bytes
+
+    def __bool__(self):
+        return any(value is not None for value in (self.head_lines, self.tail_lines, self.max_bytes))
+
+    def plan(self, f, size):
+        """
+        残す範囲を決めます。
+
+        Returns:
+            tuple: (先頭部分の終わり, 末尾部分の始まり)。先頭部分の終わり >= 末尾部分の始まりの場合はファイル全体を残します。
+        """
+        max_bytes = min(self.max_bytes, size) if self.max_bytes is not None else size
+        if self.head_lines is None and self.tail_lines is None:
+            # 行数の指定がない場合は、先頭から max_bytes までを行の境界で残す
+            if size <= max_bytes:
+                return size, size
+            f.seek(0)
+            newline = f.read(max_bytes).rfind(b'\n')
+            return (newline + 1 if newline >= 0 else max_bytes), size
+
+        head_end = 0
+        if self.head_lines is not None:
+            head_end = _find_head_end(f, self.head_lines, max_bytes)
+        tail_start = size
+        if self.tail_lines is not None:
+            # 末尾部分は、先頭部分で使わなかったバイト数の範囲で探す
+            floor = max(head_end, size - (max_bytes - head_end))
+            tail_start = _find_tail_start(f, size, self.tail_lines, floor)
+            if tail_start == floor > head_end:
+                # 上限で行の途中から始まる場合は次の行の始まりに合わせる (1行も収まらなければ残さない)
+                f.seek(tail_start)
+                newline = f.read(min(BLOCK_SIZE, size - tail_start)).find(b'\n')
+                if newline >= 0:
+                    tail_start += newline + 1
+        return head_end, tail_start
+
+    def excerpt(self, file, size):
+        """
+        file の先頭/末尾を残した本文を返します。ファイル全体を残す場合は None を返します。
+        """
+        with open(file, 'rb') as f:
+            return self.excerpt_stream(f, size)
+
+    def excerpt_stream(self, f, size):
+        """
+        seek できるバイナリのファイルオブジェクト f について excerpt と同じ本文を返します。
+        """
+        head_end, tail_start = self.plan(f, size)
+        if head_end >= tail_start:
+            return None
+        f.seek(0)
+        head = _split_incomplete(f.read(head_end))
+        f.seek(tail_start)
+        tail = f.read(size - tail_start)
+        tail = tail[_skip_continuation(tail):]
+
+        omitted = size - len(head) - len(tail)
+        text = decode_text(head)
+        if text and not text.endswith('\n'):
+            text += '\n'
+        text += f"... [{omitted} bytes omitted] ...\n"
+        return text + decode_text(tail) + "\n"
+
+    def wrap(self, loader=load_file):
+        """
+        先頭/末尾だけを読み込み、残す範囲がファイル全体になる場合は loader で読み込む関数を返します。
+        """
+        def load(file):
+            try:
+                size = os.stat(file).st_size
+            except OSError:
+                return loader(file)
+            try:
+                body = self.excerpt(file, size)
+            except UnicodeDecodeError as e:
+                return ErrorBody(f"Error reading {file}: {e}\n")
+            except OSError:
+                return loader(file)
+            if body is None:
+                return loader(file)
+            logger.info(f"Excerpted: {file}")
+            return body
+        return load
@@ -1,130 +1,504 @@
 # finder.py
 
 import os
-import fnmatch
 from pathlib import Path
 import logging
 import sys
+import threading
+from codeaggregator.patterns import PatternSet, normalize_patterns, expand_or_patterns
+from codeaggregator.gitignore import GitIgnore, GITIGNORE_NAME, is_ignored
 
 # ロガーの設定
 logger = logging.getLogger(__name__)
 
-def normalize_patterns(patterns):
+# --fromfile のファイルリストを1回に読み取る最大のバイト数
+FROMFILE_CHUNK_SIZE = 64 * 1024
+
+def _to_posix(path):
+    return path
+
+
+# .gitignore のパターンは '/' 区切りで照合する
+if os.sep != '/':
+    def _to_posix(path):
+        return path.replace(os.sep, '/')
+
+def build_matchers(patterns=None, ignore_patterns=None, include_hidden=False):
     """
-    パターンの末尾に '/' があれば除去します。
+    インクルード/除外パターンをコンパイルした PatternSet の組を返します。
+
+    Returns:
+        tuple: (include, exclude) の PatternSet。
     """
-    normalized = []
-    for pat in patterns:
-        if pat.endswith('/'):
-            pat = pat.rstrip('/')
-        normalized.append(pat)
-    return normalized
+    ignore = []
+
+    # 隠しファイル/フォルダを除外するパターンを追加
+    if not include_hidden:
+        ignore.append('.*')  # 先頭に '.' が付くファイルやフォルダを無視
+
+    if ignore_patterns:
+        ignore += ignore_patterns
+
+    # パターンは展開・正規化・重複除去したうえで一度だけコンパイルする
+    include = PatternSet(patterns)
+    exclude = PatternSet(ignore)
 
-def expand_or_patterns(patterns):
+    logger.info(f"Final include patterns: {include.patterns}")
+    logger.info(f"Final ignore patterns: {exclude.patterns}")
+    return include, exclude
+
+def _scan_dir(path):
     """
-    パターン内の '|' を分割し、フラットなパターンリストを返します。
-    例: ["*.py|*.txt", "*.md"] -> ["*.py", "*.txt", "*.md"]
+    os.walk と同様に、読み込めないディレクトリは空として扱います。
     """
-    expanded = []
-    for pat in patterns:
-        split_pats = pat.split('|')
-        expanded.extend(split_pats)
-    return expanded
+    try:
+        with os.scandir(path) as it:
+            return list(it)
+    except OSError as e:
+        logger.debug(f"Cannot scan directory {path}: {e}")
+        return []
 
-def find_files(directory, patterns=None, ignore_patterns=None, fromfile=None, include_hidden=False):
+def _scan_filtered(path, prefix, chain, include, exclude, include_hidden, gitignore, debug):
     """
-    指定されたディレクトリ内のファイルを検索します。
+    1つのディレクトリを一覧し、iter_files の規則でファイルとサブディレクトリを振り分けます。
+
+    Returns:
+        tuple: (対象のファイルのパスのリスト, 降りるサブディレクトリの (パス, 接頭辞, .gitignore ルール) のリスト,
+            スキップしたファイルの理由のリスト, 枝刈りしたディレクトリ数)。
+    """
+    entries = _scan_dir(path)
+    if gitignore and prefix and any(entry.name == GITIGNORE_NAME for entry in entries):
+        chain = gitignore.extend(chain, path, _to_posix(prefix))
+    files = []
+    subdirs = []
+    skipped = []
+    pruned = 0
+    for entry in entries:
+        name = entry.name
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+
+        if is_dir:
+            # ディレクトリ名のみでマッチング
+            if exclude.match(name):
+                if debug:
+                    logger.debug(f"Excluding directory: {entry.path}")
+                pruned += 1
+                continue
+            if gitignore and (name == '.git' or is_ignored(chain, _to_posix(prefix + name), True)):
+                if debug:
+                    logger.debug(f"Excluding directory by .gitignore: {entry.path}")
+                pruned += 1
+                continue
+            # os.walk と同じくシンボリックリンク先のディレクトリへは降りない
+            try:
+                is_link = entry.is_symlink()
+            except OSError:
+                is_link = False
+            if not is_link:
+                subdirs.append((entry.path, prefix + name + os.sep, chain))
+            continue
+
+        if not include_hidden and name.startswith('.'):
+            skipped.append('hidden')
+            continue
+        rel_path = prefix + name
+
+        # インクルードパターンの適用
+        if include and not include.match(rel_path):
+            if debug:
+                logger.debug(f"Excluded by include pattern: {rel_path}")
+            skipped.append('include')
+            continue
+
+        # エクスクルードパターンの適用
+        if exclude and exclude.match(rel_path):
+            if debug:
+                logger.debug(f"Excluded by ignore pattern: {rel_path}")
+            skipped.append('ignore')
+            continue
+
+        if chain and is_ignored(chain, _to_posix(rel_path), False):
+            if debug:
+                logger.debug(f"Excluded by .gitignore: {rel_path}")
+            skipped.append('gitignore')
+            continue
+
+        files.append(entry.path)
+    return files, subdirs, skipped, pruned
+
+def _record_scan(stats, skipped, pruned):
+    stats.dirs_visited += 1
+    stats.dirs_pruned += pruned
+    for reason in skipped:
+        stats.skip(reason)
+
+def iter_files(directory, patterns=None, ignore_patterns=None, include_hidden=False, gitignore=False, on_dir=None,
+               stats=None, threads=1, matchers=None):
+    """
+    指定されたディレクトリ内のファイルを os.scandir で走査し、マッチしたファイルを逐次返します。
+
+    走査順は os.walk (topdown) と同じで、各ディレクトリのファイルを返してから
+    サブディレクトリへ進みます。除外パターンに一致するディレクトリは走査しません。
+
+    gitignore が有効な場合は、.git/info/exclude と各ディレクトリの .gitignore を
+    そのディレクトリに入った時点でコンパイルし、サブディレクトリへ引き継ぎます。
+    除外されたディレクトリは一覧を取得する前に枝刈りされます。
 
     Args:
         directory (str): 検索対象のディレクトリパス。
         patterns (list, optional): インクルードするファイルパターンのリスト。デフォルトは None（すべてのファイルを含む）。
         ignore_patterns (list, optional): 除外するファイル/ディレクトリパターンのリスト。デフォルトは None。
-        fromfile (str, optional): ファイルリストを指定。"." を指定すると標準入力から読み取ります。デフォルトは None。
         include_hidden (bool, optional): 先頭に '.' が付くファイルやフォルダを含めるかどうか。デフォルトは False。
+        gitignore (bool or GitIgnore, optional): .gitignore のルールを適用するかどうか。
+            GitIgnore のインスタンスを渡すと、そのコンパイル済みルールのキャッシュを再利用します。デフォルトは False。
+        on_dir (callable, optional): 走査する各ディレクトリのパスを、一覧を取得する直前に受け取るコールバック。
+            threads が 2 以上の場合は走査用のスレッドから呼ばれます。
+        stats (RunStats, optional): 走査したディレクトリ数やスキップしたファイル数を記録する場合に指定します。
+        threads (int, optional): ディレクトリの一覧の取得に使うスレッド数。2 以上の場合も返す順序は同じです。
+            デフォルトは 1。
+        matchers (tuple, optional): build_matchers でコンパイル済みの (include, exclude)。
+            指定した場合は patterns と ignore_patterns の代わりに使います。デフォルトは None。
 
-    Returns:
-        list: マッチしたファイルのパスのリスト。
+    Yields:
+        str: マッチしたファイルのパス (directory と相対パスを結合したもの)。
     """
-    matched_files = []
-    ignore = []
+    include, exclude = matchers or build_matchers(patterns, ignore_patterns, include_hidden)
+    debug = logger.isEnabledFor(logging.DEBUG)
 
-    # 隠しファイル/フォルダを除外するパターンを追加
-    if not include_hidden:
-        ignore.append('.*')  # 先頭に '.' が付くファイルやフォルダを無視
+    if gitignore and not isinstance(gitignore, GitIgnore):
+        gitignore = GitIgnore(directory)
+    chain = gitignore.base_chain() if gitignore else ()
 
-    # 追加の除外パターンがあれば正規化して追加
-    if ignore_patterns:
-        normalized_ignore = normalize_patterns(ignore_patterns)
-        ignore += normalized_ignore
-        logger.debug(f"Normalized ignore patterns: {normalized_ignore}")
-
-    # パターンの展開（ORパターンを分割）
-    if patterns:
-        expanded_patterns = expand_or_patterns(patterns)
-        patterns = expanded_patterns
-        logger.debug(f"Expanded include patterns: {patterns}")
-
-    # エクスクルードパターンも展開（必要に応じて）
-    if ignore:
-        expanded_ignore = expand_or_patterns(ignore)
-        ignore += expanded_ignore
-        logger.debug(f"Expanded ignore patterns: {ignore}")
-
-    logger.info(f"Final include patterns: {patterns}")
-    logger.info(f"Final ignore patterns: {ignore}")
-
-    if fromfile:
-        if fromfile == '.':
-            # 標準入力からファイルリストを取得
-            logger.info("Reading file list from stdin.")
-            file_list = [line.strip() for line in sys.stdin if line.strip()]
-        else:
-            # 指定されたファイルからファイルリストを取得
-            logger.info(f"Reading file list from {fromfile}.")
+    def scan(path, prefix, chain):
+        if on_dir is not None:
+            on_dir(path)
+        return _scan_filtered(path, prefix, chain, include, exclude, include_hidden, gitignore, debug)
+
+    if threads > 1:
+        yield from _iter_parallel(scan, (directory, '', chain), threads, stats)
+        return
+
+    # (走査するディレクトリのパス, directory からの相対パスの接頭辞, 有効な .gitignore ルール)
+    stack = [(directory, '', chain)]
+    while stack:
+        files, subdirs, skipped, pruned = scan(*stack.pop())
+        if stats is not None:
+            _record_scan(stats, skipped, pruned)
+        yield from files
+        # スタックなので逆順に積み、列挙順どおりに降りる
+        stack.extend(reversed(subdirs))
+
+def _iter_parallel(scan, root, threads, stats=None):
+    """
+    scan (1つのディレクトリを一覧する関数) を threads 個のスレッドで並列に呼び出し、
+    逐次に走査した場合と同じ順序でファイルパスを返します。
+
+    ディレクトリはスレッド間で共有する1つの作業スタックに積み、空いたスレッドが取り出して一覧します。
+    除外するディレクトリは一覧した時点で枝刈りされ、作業スタックには積まれません。
+    結果はディレクトリごとに保持し、返す順番が来たものから順に返します。
+    """
+    cond = threading.Condition()
+    # (ディレクトリの番号, パス, 接頭辞, .gitignore ルール)
+    work = [(0,) + root]
+    # ディレクトリの番号 -> (ファイルパスのリスト, サブディレクトリの番号のリスト, スキップ理由, 枝刈り数) または例外
+    results = {}
+    state = {'next_id': 1, 'busy': 0, 'stop': False}
+
+    def worker():
+        while True:
+            with cond:
+                while not work and state['busy'] and not state['stop']:
+                    cond.wait()
+                if state['stop'] or not work:
+                    # 作業スタックが空で一覧中のディレクトリもなければ、走査は終わり
+                    cond.notify_all()
+                    return
+                node, path, prefix, chain = work.pop()
+                state['busy'] += 1
             try:
-                with open(fromfile, 'r', encoding='utf-8') as f:
-                    file_list = [line.strip() for line in f if line.strip()]
-            except Exception as e:
-                logger.error(f"Error reading from file {fromfile}: {e}")
-                return matched_files
+                result = scan(path, prefix, chain)
+            except BaseException as e:
+                result = e
+            with cond:
+                state['busy'] -= 1
+                if isinstance(result, BaseException):
+                    results[node] = result
+                else:
+                    files, subdirs, skipped, pruned = result
+                    children = list(range(state['next_id'], state['next_id'] + len(subdirs)))
+                    state['next_id'] += len(subdirs)
+                    # 先に返すディレクトリが後から取り出されるよう、逆順に積む
+                    for child, subdir in zip(reversed(children), reversed(subdirs)):
+                        work.append((child,) + subdir)
+                    results[node] = (files, children, skipped, pruned)
+                cond.notify_all()
+
+    workers = [threading.Thread(target=worker, name=f"walk-{i}", daemon=True) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    try:
+        order = [0]
+        while order:
+            node = order.pop()
+            with cond:
+                while node not in results:
+                    cond.wait()
+                result = results.pop(node)
+            if isinstance(result, BaseException):
+                raise result
+            files, children, skipped, pruned = result
+            if stats is not None:
+                _record_scan(stats, skipped, pruned)
+            yield from files
+            order.extend(reversed(children))
+    finally:
+        with cond:
+            state['stop'] = True
+            cond.notify_all()
+
+def path_matcher(patterns=None, ignore_patterns=None, include_hidden=False, stats=None, matchers=None):
+    """
+    走査済みの相対パス ('/' 区切り) を、iter_files と同じ規則で判定する関数を返します。
+
+    除外パターンに一致する名前のディレクトリ配下のファイルは、走査時の枝刈りと同じく除外されます。
+    ディレクトリの判定は、同じディレクトリのパスが続く間は使い回します (.git/index やアーカイブはおおむねパス順)。
+
+    Args:
+        stats (RunStats, optional): スキップしたファイル数を記録する場合に指定します。
+        matchers (tuple, optional): build_matchers でコンパイル済みの (include, exclude)。
+            指定した場合は patterns と ignore_patterns の代わりに使います。デフォルトは None。
+
+    Returns:
+        callable: 相対パスを受け取り、対象なら os.sep 区切りの相対パスを、対象外なら None を返す関数。
+    """
+    include, exclude = matchers or build_matchers(patterns, ignore_patterns, include_hidden)
+    include_match = include.match if include else None
+    exclude_match = exclude.match if exclude else None
+    debug = logger.isEnabledFor(logging.DEBUG)
+    # ディレクトリごとの判定結果 (除外されるなら None、されないなら os.sep 区切りの接頭辞)
+    dir_prefixes = {'': ''}
+
+    def dir_prefix(rel_dir):
+        if rel_dir in dir_prefixes:
+            return dir_prefixes[rel_dir]
+        parent, _, name = rel_dir.rpartition('/')
+        prefix = dir_prefix(parent)
+        if prefix is not None:
+            if exclude.match(name):
+                if debug:
+                    logger.debug(f"Excluding directory: {rel_dir}")
+                if stats is not None:
+                    stats.dirs_pruned += 1
+                prefix = None
+            else:
+                prefix = prefix + name + os.sep
+        dir_prefixes[rel_dir] = prefix
+        return prefix
+
+    last = [None, '']
+
+    def match(rel):
+        slash = rel.rfind('/')
+        rel_dir = rel[:slash] if slash >= 0 else ''
+        if rel_dir != last[0]:
+            last[0] = rel_dir
+            last[1] = dir_prefix(rel_dir)
+        prefix = last[1]
+        if prefix is None:
+            if stats is not None:
+                stats.skip('ignore')
+            return None
+        name = rel[slash + 1:]
+        if not include_hidden and name.startswith('.'):
+            if stats is not None:
+                stats.skip('hidden')
+            return None
+        rel_path = prefix + name
+        if include_match is not None and not include_match(rel_path):
+            if stats is not None:
+                stats.skip('include')
+            return None
+        if exclude_match is not None and exclude_match(rel_path):
+            if stats is not None:
+                stats.skip('ignore')
+            return None
+        return rel_path
+
+    return match
+
+def filter_paths(directory, rel_paths, patterns=None, ignore_patterns=None, include_hidden=False, stats=None,
+                 matchers=None):
+    """
+    走査済みの相対パス ('/' 区切り) のリストに、iter_files と同じ規則でパターンを適用します。
+
+    判定の規則は path_matcher を参照してください。
+
+    Args:
+        directory (str): 相対パスの基準となるディレクトリ。
+        rel_paths (iterable): directory からの相対パスのイテラブル。
+        stats (RunStats, optional): スキップしたファイル数を記録する場合に指定します。
+        matchers (tuple, optional): path_matcher を参照してください。
+
+    Yields:
+        str: マッチしたファイルのパス (directory と相対パスを結合したもの)。
+    """
+    match = path_matcher(patterns, ignore_patterns, include_hidden, stats, matchers)
+    base = os.path.join(directory, '')
+    for rel in rel_paths:
+        rel_path = match(rel)
+        if rel_path is not None:
+            yield base + rel_path
+
+def _iter_records(stream, null=False):
+    """
+    ストリームからパスを1件ずつ読み取ります。
+
+    読み取れた分から順に返すため、パイプの書き込み側が終わる前から返し始めます。
+    バイナリストリームの場合、デコードできないバイトは os.fsdecode と同じくサロゲートとして保持します。
+
+    Args:
+        stream: 読み取るストリーム (バイナリまたはテキスト)。
+        null (bool, optional): NUL 区切りで読み取るかどうか。False の場合は改行区切りで、前後の空白を取り除きます。
+
+    Yields:
+        str: 空でないパス。
+    """
+    # read1 はパイプに届いている分だけを返すので、入力の終わりを待たない
+    read = getattr(stream, 'read1', None) or stream.read
+    pending = None
+    sep = None
+    while True:
+        chunk = read(FROMFILE_CHUNK_SIZE)
+        if not chunk:
+            break
+        if pending is None:
+            binary = isinstance(chunk, bytes)
+            sep = (b'\0' if null else b'\n') if binary else ('\0' if null else '\n')
+            pending = chunk[:0]
+        records = (pending + chunk).split(sep)
+        pending = records.pop()
+        for record in records:
+            record = _decode_record(record, null)
+            if record:
+                yield record
+    if pending:
+        record = _decode_record(pending, null)
+        if record:
+            yield record
+
+def _decode_record(record, null):
+    if isinstance(record, bytes):
+        record = os.fsdecode(record)
+    return record if null else record.strip()
+
+def iter_fromfile(directory, fromfile, patterns=None, ignore_patterns=None, include_hidden=False, gitignore=False,
+                  stats=None, null=False, matchers=None):
+    """
+    ファイルリスト (標準入力またはファイル) を読み取りながらパターンを適用し、マッチしたファイルを逐次返します。
+
+    Args:
+        directory (str): ファイルリストの相対パスの基準となるディレクトリ。
+        fromfile (str): ファイルリストのパス。"." を指定すると標準入力から読み取ります。
+        patterns, ignore_patterns, include_hidden, gitignore, stats: find_files と同じです。
+        null (bool, optional): ファイルリストを NUL 区切りで読み取るかどうか。デフォルトは False (改行区切り)。
+        matchers (tuple, optional): iter_files を参照してください。
+
+    Yields:
+        str: マッチしたファイルのパス (directory と相対パスを結合したもの)。
+    """
+    include, exclude = matchers or build_matchers(patterns, ignore_patterns, include_hidden)
+    if gitignore and not isinstance(gitignore, GitIgnore):
+        gitignore = GitIgnore(directory)
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    if fromfile == '.':
+        # 標準入力からファイルリストを取得
+        logger.info("Reading file list from stdin.")
+        stream = getattr(sys.stdin, 'buffer', sys.stdin)
+        close = False
     else:
-        # 通常のファイル検索
-        file_list = []
-        for root, dirs, files in os.walk(directory):
-            # 除外ディレクトリの処理
-            dirs_to_remove = []
-            for d in dirs:
-                # ディレクトリ名のみでマッチング
-                if any(fnmatch.fnmatch(d, pat) for pat in ignore):
-                    dirs_to_remove.append(d)
-                    logger.debug(f"Excluding directory: {os.path.join(root, d)}")
-            for d in dirs_to_remove:
-                dirs.remove(d)
-
-            for file in files:
-                if not include_hidden and file.startswith('.'):
-                    continue
-                file_path = os.path.join(root, file)
-                rel_path = os.path.relpath(file_path, directory)
-                file_list.append(rel_path)
-
-    
-    for rel_file_path in file_list:
-        abs_file_path = os.path.join(directory, rel_file_path)
-        print(rel_file_path)
+        # 指定されたファイルからファイルリストを取得
+        logger.info(f"Reading file list from {fromfile}.")
+        try:
+            stream = open(fromfile, 'rb')
+        except OSError as e:
+            logger.error(f"Error reading from file {fromfile}: {e}")
+            return
+        close = True
 
-        # インクルードパターンの適用
-        if patterns:
-            if not any(fnmatch.fnmatch(rel_file_path, pat) for pat in patterns):
-                logger.debug(f"Excluded by include pattern: {rel_file_path}")
-                continue  # インクルードパターンに一致しない場合、スキップ
+    try:
+        for rel_file_path in _iter_records(stream, null):
+            # インクルードパターンの適用
+            if include and not include.match(rel_file_path):
+                if debug:
+                    logger.debug(f"Excluded by include pattern: {rel_file_path}")
+                if stats is not None:
+                    stats.skip('include')
+                continue
 
-        # エクスクルードパターンの適用
-        if ignore:
-            if any(fnmatch.fnmatch(rel_file_path, pat) for pat in ignore):
-                logger.debug(f"Excluded by ignore pattern: {rel_file_path}")
-                continue  # エクスクルードパターンに一致する場合、スキップ
+            # エクスクルードパターンの適用
+            if exclude and exclude.match(rel_file_path):
+                if debug:
+                    logger.debug(f"Excluded by ignore pattern: {rel_file_path}")
+                if stats is not None:
+                    stats.skip('ignore')
+                continue
+
+            # .gitignore の適用
+            if gitignore and gitignore.match_path(_to_posix(rel_file_path)):
+                if debug:
+                    logger.debug(f"Excluded by .gitignore: {rel_file_path}")
+                if stats is not None:
+                    stats.skip('gitignore')
+                continue
+
+            yield os.path.join(directory, rel_file_path)
+    except OSError as e:
+        logger.error(f"Error reading from file {fromfile}: {e}")
+    finally:
+        if close:
+            stream.close()
+
+def log_found(files, directory):
+    """
+    見つかったファイルの相対パスを1件ずつ INFO レベルでログに出力しながら files を返します (-i で表示されます)。
+
+    INFO レベルが無効な場合は files をそのまま返し、ファイルごとの処理を加えません。
+    """
+    if not logger.isEnabledFor(logging.INFO):
+        return files
+    return _log_found(files, directory)
+
+def _log_found(files, directory):
+    base = os.path.join(directory, '')
+    for file in files:
+        logger.info(f"Found: {file[len(base):] if file.startswith(base) else os.path.relpath(file, directory)}")
+        yield file
+
+def find_files(directory, patterns=None, ignore_patterns=None, fromfile=None, include_hidden=False, gitignore=False,
+               stats=None, null=False):
+    """
+    指定されたディレクトリ内のファイルを検索します。
 
-        matched_files.append(abs_file_path)
+    Args:
+        directory (str): 検索対象のディレクトリパス。
+        patterns (list, optional): インクルードするファイルパターンのリスト。デフォルトは None（すべてのファイルを含む）。
+        ignore_patterns (list, optional): 除外するファイル/ディレクトリパターンのリスト。デフォルトは None。
+        fromfile (str, optional): ファイルリストを指定。"." を指定すると標準入力から読み取ります。デフォルトは None。
+        include_hidden (bool, optional): 先頭に '.' が付くファイルやフォルダを含めるかどうか。デフォルトは False。
+        gitignore (bool, optional): .gitignore のルールを適用するかどうか。デフォルトは False。
+        stats (RunStats, optional): スキップしたファイル数などを記録する場合に指定します。デフォルトは None。
+        null (bool, optional): ファイルリストを NUL 区切りで読み取るかどうか。デフォルトは False。
 
-    return matched_files
+    Returns:
+        list: マッチしたファイルのパスのリスト。
+    """
+    if not fromfile:
+        # 通常のファイル検索
+        files = iter_files(directory, patterns, ignore_patterns, include_hidden, gitignore, stats=stats)
+    else:
+        files = iter_fromfile(directory, fromfile, patterns, ignore_patterns, include_hidden, gitignore, stats, null)
+    return list(log_found(files, directory))
@@ -0,0 +1,199 @@
+# formats.py
+
+import json
+import mmap
+import struct
+import hashlib
+from codeaggregator.output import TextFormat, Passthrough, INCLUDED
+
+# indexed 形式の先頭と末尾に置く識別子
+INDEXED_MAGIC = b'CAGGIDX1'
+INDEXED_VERSION = 1
+# 末尾: (オフセット表の開始位置, オフセット表のバイト数, 識別子)
+INDEXED_FOOTER = struct.Struct('>QQ8s')
+
+
+def _body_bytes(body):
+    """
+    本文を、テキスト形式で各ファイルの後ろに付ける改行を除いたバイト列で返します。
+    """
+    if isinstance(body, Passthrough):
+        with body.file:
+            data = body.file.read(body.size)
+        data += body.suffix.encode('utf-8')
+    else:
+        data = body.encode('utf-8')
+    return data[:-1] if data.endswith(b'\n') else data
+
+
+class JsonlFormat:
+    """
+    1ファイルを1行の JSON オブジェクトとして出力する形式です。
+
+    各行は {"path": ..., "status": ..., "content": ...} です。読み込みを省略したファイルやエラー、
+    重複の参照 (status が 'included' 以外) は、content の代わりに message に理由を持ちます。
+    """
+
+    name = 'jsonl'
+    trailing_newline = False
+
+    def begin(self, writer):
+        pass
+
+    def write_file(self, writer, file, status, header, body):
+        text = _body_bytes(body).decode('utf-8')
+        record = {'path': file, 'status': status}
+        record['content' if status == INCLUDED else 'message'] = text
+        writer.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def end(self, writer):
+        pass
+
+
+class IndexedFormat:
+    """
+    ファイルの内容をそのまま連結し、末尾にオフセット表を置くバイナリ形式です。
+
+    構成は次のとおりです (オフセットはすべて出力の先頭からのバイト数)。
+
+    - 先頭 8 バイト: INDEXED_MAGIC
+    - 各ファイルの内容 (区切りなし)。status が 'included' 以外のファイルは理由のメッセージ
+    - オフセット表: {"version": 1, "files": [{"path", "status", "offset", "length", "sha256"}, ...]} の JSON
+    - 末尾 24 バイト: INDEXED_FOOTER (オフセット表の位置と長さ、INDEXED_MAGIC)
+
+    読み込む側は末尾とオフセット表だけを解析し、mmap した出力から任意のファイルの内容を直接取り出せます
+    (IndexedOutput を参照)。
+    """
+
+    name = 'indexed'
+    trailing_newline = False
+
+    def __init__(self):
+        self.entries = []
+
+    def begin(self, writer):
+        writer.write_bytes(INDEXED_MAGIC)
+
+    def write_file(self, writer, file, status, header, body):
+        offset = writer.bytes_written
+        digest = hashlib.sha256()
+        if isinstance(body, Passthrough) and body.size > 0:
+            # 大きなファイルはデコードせず、mmap した内容をハッシュしてそのまま書き込む
+            size = body.size if body.suffix else body.size - 1
+            with body.file, mmap.mmap(body.file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as view:
+                    content = view[:size]
+                    digest.update(content)
+                    writer.write_bytes(content)
+                    content.release()
+        else:
+            data = _body_bytes(body)
+            digest.update(data)
+            writer.write_bytes(data)
+        self.entries.append({'path': file, 'status': status, 'offset': offset,
+                             'length': writer.bytes_written - offset, 'sha256': digest.hexdigest()})
+
+    def end(self, writer):
+        table = json.dumps({'version': INDEXED_VERSION, 'files': self.entries}, ensure_ascii=False).encode('utf-8')
+        table_offset = writer.bytes_written
+        writer.write_bytes(table)
+        writer.write_bytes(INDEXED_FOOTER.pack(table_offset, len(table), INDEXED_MAGIC))
+
+
+# --format で指定できる出力形式
+FORMATS = {
+    'text': TextFormat,
+    'jsonl': JsonlFormat,
+    'indexed': IndexedFormat,
+}
+
+
+def make_format(name):
+    """
+    出力形式の名前から、1回の出力に使う出力形式のインスタンスを作成します。
+    """
+    return FORMATS[name]()
+
+
+class IndexedFormatError(Exception):
+    """indexed 形式として読み込めない場合に送出されます。"""
+
+
+class IndexedOutput:
+    """
+    --format indexed の出力を mmap し、オフセット表からファイルの内容を直接取り出します。
+
+    開く際に解析するのは末尾とオフセット表だけで、ファイルの内容は取り出すまで読み込みません。
+
+    Args:
+        path (str): indexed 形式の出力ファイルのパス。
+
+    Raises:
+        IndexedFormatError: indexed 形式のファイルでない場合。
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise IndexedFormatError(f"Empty file: {path}")
+        try:
+            self.entries = self._read_table(path)
+        except IndexedFormatError:
+            self.close()
+            raise
+        self._by_path = {entry['path']: entry for entry in self.entries}
+
+    def _read_table(self, path):
+        mm = self._mm
+        if len(mm) < len(INDEXED_MAGIC) + INDEXED_FOOTER.size or mm[:len(INDEXED_MAGIC)] != INDEXED_MAGIC:
+            raise IndexedFormatError(f"Not an indexed output: {path}")
+        table_offset, table_length, magic = INDEXED_FOOTER.unpack(mm[-INDEXED_FOOTER.size:])
+        if magic != INDEXED_MAGIC or table_offset + table_length > len(mm) - INDEXED_FOOTER.size:
+            raise IndexedFormatError(f"Broken offset table: {path}")
+        try:
+            table = json.loads(mm[table_offset:table_offset + table_length].decode('utf-8'))
+        except ValueError as e:
+            raise IndexedFormatError(f"Broken offset table: {path}: {e}")
+        if table.get('version') != INDEXED_VERSION:
+            raise IndexedFormatError(f"Unsupported version: {table.get('version')}")
+        return table['files']
+
+    def __contains__(self, path):
+        return path in self._by_path
+
+    def __iter__(self):
+        return iter(self._by_path)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def entry(self, path):
+        """ファイルのオフセット表の項目 (path, status, offset, length, sha256) を返します。"""
+        return self._by_path[path]
+
+    def read(self, path, verify=False):
+        """
+        ファイルの内容をバイト列で返します。verify が True の場合は sha256 を照合します。
+
+        Raises:
+            KeyError: 出力に含まれないパスの場合。
+            IndexedFormatError: verify で内容が一致しない場合。
+        """
+        entry = self._by_path[path]
+        data = self._mm[entry['offset']:entry['offset'] + entry['length']]
+        if verify and hashlib.sha256(data).hexdigest() != entry['sha256']:
+            raise IndexedFormatError(f"Checksum mismatch: {path}")
+        return data
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
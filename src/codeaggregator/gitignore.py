@@ -0,0 +1,257 @@
+# gitignore.py
+
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+GITIGNORE_NAME = '.gitignore'
+
+
+def translate(pattern):
+    """
+    gitignore のグロブを正規表現の文字列に変換します。
+
+    '*' と '?' は '/' に一致せず、'**' は前後が '/' で区切られている場合にのみ
+    任意の階層に一致します。
+    """
+    i, n = 0, len(pattern)
+    res = []
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            j = i
+            while j < n and pattern[j] == '*':
+                j += 1
+            if j - i >= 2 and (i == 0 or pattern[i - 1] == '/') and (j == n or pattern[j] == '/'):
+                if j == n:
+                    # 末尾の '**' (例: 'abc/**') は配下すべてに一致
+                    res.append('.*')
+                else:
+                    # '**/' は0個以上のディレクトリに一致
+                    res.append('(?:.*/)?')
+                    j += 1
+            else:
+                res.append('[^/]*')
+            i = j
+        elif c == '?':
+            res.append('[^/]')
+            i += 1
+        elif c == '[':
+            j = i + 1
+            if j < n and pattern[j] in '!^':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 1
+            if j >= n:
+                # 閉じていない '[' は文字として扱う
+                res.append('\\[')
+                i += 1
+            else:
+                stuff = pattern[i + 1:j].replace('\\', '\\\\')
+                if stuff[0] in '!^':
+                    stuff = '^' + stuff[1:]
+                res.append(f'(?!/)[{stuff}]')
+                i = j + 1
+        elif c == '\\' and i + 1 < n:
+            res.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            res.append(re.escape(c))
+            i += 1
+    return ''.join(res)
+
+
+def parse_line(line):
+    """
+    .gitignore の1行を解析します。
+
+    Returns:
+        tuple or None: (パターン, 否定か, ディレクトリのみか, 固定位置か)。空行やコメントは None。
+    """
+    line = line.rstrip('\n').rstrip('\r')
+    # エスケープされていない末尾の空白は無視する
+    stripped = line.rstrip(' \t')
+    if stripped.endswith('\\') and len(stripped) < len(line):
+        stripped += line[len(stripped)]
+    line = stripped
+    if not line or line.startswith('#'):
+        return None
+
+    negate = False
+    if line.startswith('!'):
+        negate = True
+        line = line[1:]
+    elif line.startswith('\\!') or line.startswith('\\#'):
+        line = line[1:]
+
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+
+    # 途中または先頭に '/' を含むパターンは .gitignore のあるディレクトリからの相対位置に固定される
+    anchored = '/' in line
+    line = line.lstrip('/')
+    return line, negate, dir_only, anchored
+
+
+class IgnoreRules:
+    """
+    1つの除外ファイル (.gitignore や .git/info/exclude) をコンパイルしたルール集合です。
+
+    ルールはファイル内の逆順に1つの正規表現へ結合されるため、最初に一致した選択肢が
+    「最後に一致したルール」になり、1回の照合で否定 ('!') を含めた判定ができます。
+
+    Args:
+        lines (iterable): 除外ファイルの各行。
+        prefix (str): 走査のルートからこのファイルのあるディレクトリまでの相対パス ('src/' など)。
+    """
+
+    def __init__(self, lines, prefix=''):
+        self.prefix = prefix
+        file_parts = []
+        dir_parts = []
+        rules = [rule for rule in (parse_line(line) for line in lines) if rule]
+        for index in range(len(rules) - 1, -1, -1):
+            pattern, negate, dir_only, anchored = rules[index]
+            body = translate(pattern)
+            if not anchored:
+                body = '(?:.*/)?' + body
+            group = f"{'n' if negate else 'i'}{index}"
+            part = f'(?P<{group}>{body})'
+            dir_parts.append(part)
+            if not dir_only:
+                file_parts.append(part)
+
+        self.size = len(rules)
+        self._file_regex = re.compile('(?s:' + '|'.join(file_parts) + r')\Z') if file_parts else None
+        self._dir_regex = re.compile('(?s:' + '|'.join(dir_parts) + r')\Z') if dir_parts else None
+
+    def __bool__(self):
+        return self.size > 0
+
+    def match(self, rel, is_dir):
+        """
+        走査のルートからの相対パス rel を判定します。
+
+        Returns:
+            bool or None: 除外なら True、否定ルールで再び含めるなら False、一致するルールがなければ None。
+        """
+        regex = self._dir_regex if is_dir else self._file_regex
+        if regex is None:
+            return None
+        m = regex.match(rel, len(self.prefix))
+        if m is None:
+            return None
+        return m.lastgroup[0] == 'i'
+
+
+def is_ignored(chain, rel, is_dir):
+    """
+    ルートから深い順に並んだ IgnoreRules のタプル chain で rel を判定します。
+
+    深いディレクトリのルールほど優先されます。
+    """
+    for rules in reversed(chain):
+        result = rules.match(rel, is_dir)
+        if result is not None:
+            return result
+    return False
+
+
+class GitIgnore:
+    """
+    走査のルートに対する .gitignore の読み込みとコンパイル結果をキャッシュします。
+
+    各ディレクトリの .gitignore は (サイズ, 更新時刻) が変わらない限り一度だけコンパイルされ、
+    同じインスタンスを使う以降の走査でも再利用されます。
+
+    Args:
+        root (str): 走査のルートディレクトリ。
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._cache = {}
+        self._dir_chains = {}
+
+    def clear(self):
+        """ディレクトリごとのルールの引き継ぎ状態を破棄します (ファイルの変更を反映させる場合に使用)。"""
+        self._dir_chains.clear()
+
+    def base_chain(self):
+        """
+        ルートディレクトリで有効なルール (.git/info/exclude と ルートの .gitignore) を返します。
+        """
+        chain = ()
+        exclude = self.load(os.path.join(self.root, '.git', 'info', 'exclude'), '')
+        if exclude:
+            chain += (exclude,)
+        return self.extend(chain, self.root, '')
+
+    def extend(self, chain, dir_path, prefix):
+        """
+        dir_path に .gitignore があれば、そのルールを chain の末尾に加えて返します。
+        """
+        rules = self.load(os.path.join(dir_path, GITIGNORE_NAME), prefix)
+        if rules:
+            return chain + (rules,)
+        return chain
+
+    def load(self, path, prefix):
+        """
+        除外ファイルを読み込んでコンパイルします。存在しない場合は None を返します。
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        signature = (st.st_size, st.st_mtime_ns)
+        cached = self._cache.get(path)
+        if cached is not None and cached[0] == signature and cached[1].prefix == prefix:
+            return cached[1]
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                rules = IgnoreRules(f, prefix)
+        except OSError as e:
+            logger.warning(f"Error reading {path}: {e}")
+            return None
+        logger.debug(f"Loaded {rules.size} ignore rules from {path}")
+        self._cache[path] = (signature, rules)
+        return rules
+
+    def match_path(self, rel):
+        """
+        ルートからの相対パス rel (区切りは '/') のファイルが除外されるかを判定します。
+
+        走査を伴わないファイルリスト向けに、親ディレクトリが除外されている場合も除外と判定します。
+        """
+        parent, _, _ = rel.rpartition('/')
+        chain = self._chain_for_dir(parent)
+        if chain is None:
+            return True
+        return is_ignored(chain, rel, False)
+
+    def _chain_for_dir(self, rel_dir):
+        """
+        ディレクトリ rel_dir で有効なルールを返します。ディレクトリ自体が除外される場合は None。
+        結果はディレクトリごとに記録され、同じディレクトリのファイルでは再計算しません。
+        """
+        if rel_dir in self._dir_chains:
+            return self._dir_chains[rel_dir]
+        if not rel_dir:
+            chain = self.base_chain()
+        else:
+            parent, _, name = rel_dir.rpartition('/')
+            chain = self._chain_for_dir(parent)
+            if chain is not None:
+                if name == '.git' or is_ignored(chain, rel_dir, True):
+                    chain = None
+                else:
+                    chain = self.extend(chain, os.path.join(self.root, rel_dir), rel_dir + '/')
+        self._dir_chains[rel_dir] = chain
+        return chain
@@ -0,0 +1,184 @@
+# gitindex.py
+
+import os
+import sys
+import stat
+import struct
+import logging
+
+logger = logging.getLogger(__name__)
+
+INDEX_SIGNATURE = b'DIRC'
+SUPPORTED_VERSIONS = (2, 3, 4)
+
+# ctime(s, ns), mtime(s, ns), dev, ino, mode, uid, gid, size, オブジェクトID (SHA-1), flags
+# のうち、mode, size, flags 以外は読み飛ばす
+_ENTRY = struct.Struct('>24xI8xI20xH')
+_EXTENDED_FLAGS = struct.Struct('>H')
+
+_FLAG_EXTENDED = 0x4000
+_FLAG_NAME_MASK = 0x0FFF
+# 拡張フラグ: スパースチェックアウトで作業ツリーに置かれていないエントリ
+_FLAG_SKIP_WORKTREE = 0x4000
+
+# ディレクトリ (スパースインデックス) とサブモジュールは実ファイルではないので除外する
+_SKIP_MODES = (stat.S_IFDIR, 0o160000)
+
+
+class IndexEntry:
+    """
+    .git/index の1エントリです。
+
+    インデックスの stat 情報のうちサイズだけを保持します。更新時刻や inode は git が最後に記録した
+    時点のもので、作業ツリーの変更を反映していないため、キャッシュの検証には使いません。
+    """
+
+    __slots__ = ('path', 'mode', 'size')
+
+    def __init__(self, path, mode, size):
+        self.path = path
+        self.mode = mode
+        self.size = size
+
+    def __repr__(self):
+        return f"IndexEntry({self.path!r}, size={self.size})"
+
+
+class GitIndexError(Exception):
+    """.git/index を解析できない場合の例外です。"""
+
+
+def _read_varint(data, pos):
+    """
+    インデックス v4 のパス圧縮で使われる可変長整数を読み込みます。
+
+    Returns:
+        tuple: (値, 次の位置)。
+    """
+    c = data[pos]
+    pos += 1
+    value = c & 0x7F
+    while c & 0x80:
+        c = data[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (c & 0x7F)
+    return value, pos
+
+
+def parse_index(data):
+    """
+    .git/index のバイト列を解析し、IndexEntry を順に返します。
+
+    バージョン 2〜4 (v4 のパス接頭辞圧縮を含む) に対応します。マージ途中の
+    複数ステージのエントリは同じパスを1度だけ返し、作業ツリーに置かれないエントリ
+    (skip-worktree、スパースインデックスのディレクトリ、サブモジュール) は返しません。
+    拡張 (ツリーキャッシュなど) は読み飛ばします。
+    """
+    if len(data) < 12 or data[:4] != INDEX_SIGNATURE:
+        raise GitIndexError("not a git index file")
+    version, count = struct.unpack_from('>II', data, 4)
+    if version not in SUPPORTED_VERSIONS:
+        raise GitIndexError(f"unsupported index version {version}")
+
+    encoding = sys.getfilesystemencoding()
+    unpack_entry = _ENTRY.unpack_from
+    entry_size = _ENTRY.size
+    pos = 12
+    previous = b''
+    last_path = None
+    for _ in range(count):
+        start = pos
+        mode, size, flags = unpack_entry(data, pos)
+        pos += entry_size
+        skip_worktree = False
+        if flags & _FLAG_EXTENDED:
+            if version < 3:
+                raise GitIndexError("extended flags in a version 2 index")
+            skip_worktree = bool(_EXTENDED_FLAGS.unpack_from(data, pos)[0] & _FLAG_SKIP_WORKTREE)
+            pos += _EXTENDED_FLAGS.size
+
+        if version == 4:
+            strip, pos = _read_varint(data, pos)
+            end = data.index(b'\0', pos)
+            path = previous[:len(previous) - strip] + data[pos:end]
+            pos = end + 1
+        else:
+            name_length = flags & _FLAG_NAME_MASK
+            if name_length < _FLAG_NAME_MASK:
+                end = pos + name_length
+            else:
+                end = data.index(b'\0', pos)
+            path = data[pos:end]
+            # エントリ全体が 8 バイト境界になるよう 1〜8 バイトの NUL で埋められている
+            pos = start + ((end - start + 8) & ~7)
+        previous = path
+
+        if path == last_path or skip_worktree or (mode & 0o170000) in _SKIP_MODES:
+            continue
+        last_path = path
+        yield IndexEntry(path.decode(encoding, 'surrogateescape'), mode, size)
+
+
+def find_git_dir(directory):
+    """
+    directory を含む作業ツリーのルートと .git ディレクトリを探します。
+
+    .git がファイル (worktree やサブモジュール) の場合は 'gitdir:' の指す先を返します。
+
+    Returns:
+        tuple or None: (作業ツリーのルート, .git ディレクトリ)。見つからなければ None。
+    """
+    current = os.path.abspath(directory)
+    while True:
+        dot_git = os.path.join(current, '.git')
+        if os.path.isdir(dot_git):
+            return current, dot_git
+        if os.path.isfile(dot_git):
+            try:
+                with open(dot_git, 'r', encoding='utf-8') as f:
+                    line = f.readline().strip()
+            except OSError:
+                line = ''
+            if line.startswith('gitdir:'):
+                git_dir = line[len('gitdir:'):].strip()
+                return current, os.path.normpath(os.path.join(current, git_dir))
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+
+def read_index(directory):
+    """
+    directory を含むリポジトリの .git/index を読み込み、directory 配下のエントリを返します。
+
+    返す IndexEntry の path は directory からの相対パス ('/' 区切り) に置き換えます。
+
+    Returns:
+        list: IndexEntry のリスト (インデックスの順 = パス順)。
+    """
+    found = find_git_dir(directory)
+    if found is None:
+        raise GitIndexError(f"{directory} is not inside a git repository")
+    root, git_dir = found
+    index_path = os.path.join(git_dir, 'index')
+    try:
+        with open(index_path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        # まだ何もコミットしていないリポジトリ
+        return []
+    except OSError as e:
+        raise GitIndexError(f"cannot read {index_path}: {e}")
+
+    rel = os.path.relpath(os.path.abspath(directory), root)
+    prefix = '' if rel == '.' else rel.replace(os.sep, '/') + '/'
+    entries = []
+    for entry in parse_index(data):
+        if prefix:
+            if not entry.path.startswith(prefix):
+                continue
+            entry.path = entry.path[len(prefix):]
+        entries.append(entry)
+    logger.info(f"Read {len(entries)} tracked files from {index_path}")
+    return entries
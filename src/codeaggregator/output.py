@@ -1,34 +1,629 @@
+import io
 import os
+import sys
+import mmap
+import stat
+import time
+import codecs
+import queue
 import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
-def output_files(files, output_destination=None):
-    output = []
-    output.append("=" * 17)
-    for file in files:
-        # 存在チェック
-        if os.path.exists(file):
-            logger.info(f"Included: {file}")
+# 出力フォーマットの区切り線
+SECTION_RULE = "=" * 17
+FILE_RULE = "#" * 34
+
+# バッファ付き書き込みのデフォルトサイズ (64 KiB)
+DEFAULT_BUFFER_SIZE = 64 * 1024
+
+# この大きさ以上の UTF-8 ファイルは、デコードせずバイト列のまま出力先へコピーする
+PASSTHROUGH_MIN_SIZE = 64 * 1024
+
+# パススルー前の UTF-8 検証で一度に検証する大きさ (改行の確認とデコードを CPU キャッシュに載る大きさで続けて行う)
+VALIDATE_CHUNK_SIZE = 64 * 1024
+
+# 並列読み込み時に、ワーカー1つあたり先読みするファイル数
+READ_AHEAD_PER_JOB = 4
+
+# 出力先の拡張子ごとの圧縮形式と、圧縮レベルのデフォルト (各コマンドラインツールのデフォルトと同じ)
+COMPRESSIONS = {'.gz': 'gzip', '.xz': 'xz', '.bz2': 'bz2'}
+DEFAULT_COMPRESS_LEVELS = {'gzip': 6, 'xz': 6, 'bz2': 9}
+
+# 圧縮スレッドへ渡すキューの長さと、1回に渡す大きさの上限
+COMPRESS_QUEUE_SIZE = 16
+COMPRESS_CHUNK_SIZE = 1024 * 1024
+
+# 出力したファイルごとの状態 (省略したファイルは SkippedBody の理由 'binary'/'oversized' になる)
+INCLUDED = 'included'
+MISSING = 'missing'
+ERROR = 'error'
+DUPLICATE = 'duplicate'
+OMITTED = 'omitted'
+
+
+class StreamWriter:
+    """
+    出力先へバッファ付きで書き込むライターです。
+
+    小さな書き込みは内部バッファにまとめ、バッファサイズを超えた時点で
+    まとめて出力先へ書き込みます。出力先はバイナリのファイルライクオブジェクト、
+    または `buffer` 属性を持つテキストストリーム (sys.stdout など) を受け付けます。
+    `buffer` を持たないテキストストリーム (io.StringIO など) にはデコードした文字列を書き込みます。
+
+    Args:
+        stream: 書き込み先のストリーム。
+        buffer_size (int, optional): 内部バッファのサイズ。デフォルトは 64 KiB。
+        encoding (str, optional): 文字列を書き込む際のエンコーディング。デフォルトは 'utf-8'。
+    """
+
+    def __init__(self, stream, buffer_size=DEFAULT_BUFFER_SIZE, encoding='utf-8'):
+        self.encoding = encoding
+        self.buffer_size = buffer_size
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._text = False
+
+        if isinstance(stream, io.TextIOBase):
+            binary = getattr(stream, 'buffer', None)
+            if binary is not None:
+                # テキスト層に残っているデータを先に流してからバイナリ層へ書き込む
+                stream.flush()
+                stream = binary
+            else:
+                self._text = True
+        self.stream = stream
+
+    def write(self, text):
+        """文字列をエンコードして書き込みます。"""
+        self.write_bytes(text.encode(self.encoding))
+
+    def write_bytes(self, data):
+        """バイト列を書き込みます。"""
+        if len(self._buffer) + len(data) > self.buffer_size:
+            self._drain()
+            if len(data) >= self.buffer_size:
+                # バッファより大きいデータはコピーせずにそのまま書き込む
+                self._raw_write(data)
+                self.bytes_written += len(data)
+                return
+        self._buffer += data
+        self.bytes_written += len(data)
+
+    def copy_file(self, f, size):
+        """
+        バイナリモードで開いたファイルの先頭から size バイトをそのまま書き込みます。
+
+        出力先が実際のファイルディスクリプタを持つ場合は os.sendfile でカーネル内コピーを行い、
+        それ以外の場合は mmap した内容を memoryview のまま書き込みます。
+        """
+        self._drain()
+        copied = 0
+        out_fd = self._fileno()
+        if out_fd is not None:
+            # バッファ済みのデータより後ろに書き込まれるよう、先に出力先をフラッシュする
+            self.stream.flush()
+            try:
+                while copied < size:
+                    sent = os.sendfile(out_fd, f.fileno(), copied, size - copied)
+                    if sent == 0:
+                        break
+                    copied += sent
+            except OSError:
+                # sendfile 非対応の出力先は mmap によるコピーに切り替える
+                pass
+
+        if copied < size:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    with memoryview(mm) as view:
+                        chunk = view[copied:size]
+                        self._raw_write(chunk)
+                        copied += len(chunk)
+                        chunk.release()
+            except ValueError:
+                # 読み込みの間に空になったファイルは mmap できない
+                pass
+        self.bytes_written += copied
+
+    def flush(self):
+        """内部バッファを出力先へ書き出し、出力先もフラッシュします。"""
+        self._drain()
+        flush = getattr(self.stream, 'flush', None)
+        if flush is not None:
+            flush()
+
+    def _drain(self):
+        if self._buffer:
+            self._raw_write(bytes(self._buffer))
+            self._buffer.clear()
+
+    def _raw_write(self, data):
+        if self._text:
+            self.stream.write(str(data, self.encoding))
         else:
-            logger.warning(f"File does not exist: {file}")
-            continue
+            self.stream.write(data)
 
-        output.append(f"##################################\n{file}\n##################################\n")
+    def _fileno(self):
+        if self._text or not hasattr(os, 'sendfile'):
+            return None
         try:
-            with open(file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            output.append(content + "\n")
+            return self.stream.fileno()
+        except (AttributeError, OSError, ValueError):
+            return None
+
+
+def compression_of(path):
+    """
+    出力先のパスの拡張子から圧縮形式 ('gzip', 'xz', 'bz2') を返します。圧縮しない場合は None を返します。
+    """
+    return COMPRESSIONS.get(os.path.splitext(os.fspath(path))[1].lower())
+
+
+class CompressedWriter:
+    """
+    書き込まれたバイト列を専用スレッドで圧縮し、ファイルへ書き込みます。
+
+    zlib/lzma/bz2 は圧縮中に GIL を解放するため、呼び出し側のファイルの読み込みと圧縮が重なります。
+    キューの長さで、圧縮を待っているデータの量を抑えます。
+
+    Args:
+        path (str): 出力先のパス。
+        compression (str): 'gzip'、'xz' または 'bz2'。
+        level (int, optional): 圧縮レベル。デフォルトは DEFAULT_COMPRESS_LEVELS の値。
+    """
+
+    def __init__(self, path, compression, level=None):
+        if level is None:
+            level = DEFAULT_COMPRESS_LEVELS[compression]
+        if compression == 'gzip':
+            import gzip
+            # 出力ファイル名をヘッダに埋め込まず、mtime を 0 にして内容が同じなら同じバイト列にする
+            raw = open(path, 'wb')
+            self._file = gzip.GzipFile(filename='', mode='wb', compresslevel=level, fileobj=raw, mtime=0)
+            self._raw = raw
+        elif compression == 'xz':
+            import lzma
+            self._file = lzma.open(path, 'wb', preset=level)
+            self._raw = None
+        elif compression == 'bz2':
+            import bz2
+            self._file = bz2.open(path, 'wb', compresslevel=level)
+            self._raw = None
+        else:
+            raise ValueError(f"Unknown compression: {compression}")
+        self._queue = queue.Queue(maxsize=COMPRESS_QUEUE_SIZE)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name=f"compress-{os.path.basename(path)}", daemon=True)
+        self._thread.start()
+
+    def write(self, data):
+        if self._error is not None:
+            raise self._error
+        if isinstance(data, bytes):
+            self._queue.put(data)
+            return len(data)
+        # mmap の memoryview などは呼び出し後に解放されるため、上限の大きさごとにコピーして渡す
+        with memoryview(data) as view:
+            for start in range(0, len(view), COMPRESS_CHUNK_SIZE):
+                self._queue.put(bytes(view[start:start + COMPRESS_CHUNK_SIZE]))
+            return len(view)
+
+    def flush(self):
+        # 圧縮の区切りを増やさないよう、途中のフラッシュは行わない (close で書き出す)
+        pass
+
+    def close(self):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        done = False
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    done = True
+                    break
+                self._file.write(item)
         except Exception as e:
-            output.append(f"Error reading {file}: {e}\n")
-    output.append("=" * 17)
-    output_str = "\n".join(output)
-    
-    if output_destination:
+            self._error = e
+        finally:
+            try:
+                self._file.close()
+                if self._raw is not None:
+                    self._raw.close()
+            except Exception as e:
+                if self._error is None:
+                    self._error = e
+        if not done:
+            # 呼び出し側が put で止まらないよう、残りを読み捨てる
+            while self._queue.get() is not None:
+                pass
+
+
+def open_output(path, compress_level=None):
+    """
+    出力先のファイルを開きます。拡張子が .gz/.xz/.bz2 の場合は CompressedWriter を返します。
+    """
+    compression = compression_of(path)
+    if compression is None:
+        return open(path, 'wb')
+    return CompressedWriter(path, compression, compress_level)
+
+
+class Passthrough:
+    """
+    UTF-8 として検証済みで、デコードせずにそのまま出力できるファイルの本文です。
+
+    Args:
+        file: バイナリモードで開いたファイルオブジェクト。
+        size (int): 出力するバイト数。
+        suffix (str, optional): 内容の後ろに書き込む文字列。デフォルトは改行。
+    """
+
+    __slots__ = ('file', 'size', 'suffix')
+
+    def __init__(self, file, size, suffix="\n"):
+        self.file = file
+        self.size = size
+        self.suffix = suffix
+
+
+class ErrorBody(str):
+    """
+    読み込みに失敗したファイルの本文 (エラーメッセージ) です。
+    """
+
+    __slots__ = ()
+
+
+def render_header(file):
+    """
+    ファイルごとの見出し部分を返します。
+    """
+    return f"\n{FILE_RULE}\n{file}\n{FILE_RULE}\n\n"
+
+
+def read_file(file):
+    """
+    ファイルを読み込み、出力する本文を返します。
+    読み込みに失敗した場合はエラーメッセージを本文として返します。
+    """
+    try:
+        with open(file, 'r', encoding='utf-8') as f:
+            content = f.read()
+        return content + "\n"
+    except Exception as e:
+        return ErrorBody(f"Error reading {file}: {e}\n")
+
+
+def decode_text(data):
+    """
+    UTF-8 のバイト列を、テキストモードで読み込んだ場合と同じく改行を '\\n' に揃えてデコードします。
+    """
+    text = data.decode('utf-8')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+def _is_passthrough_safe(mm):
+    """
+    テキストモードで読み込んだ場合と同じバイト列になるか (UTF-8 として正しく、改行の変換が
+    起きないか) を、デコード結果を保持せずに検証します。
+
+    検証にはファイル全体を1回なめる必要があります (64 MiB の ASCII で約 20 ms、デコードして読み込む場合の
+    1/15 程度)。VALIDATE_CHUNK_SIZE ごとに '\r' の確認とデコードを続けて行い、チャンクを複製せずに
+    memoryview で渡すため、不正な内容は見つかったチャンクで打ち切ります。
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        with memoryview(mm) as view:
+            for start in range(0, len(mm), VALIDATE_CHUNK_SIZE):
+                end = start + VALIDATE_CHUNK_SIZE
+                if mm.find(b'\r', start, end) != -1:
+                    return False
+                decoder.decode(view[start:end])
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def open_passthrough(file, size):
+    """
+    ファイルがそのまま出力できる場合は、開いたファイルを Passthrough として返します。
+
+    Returns:
+        Passthrough or None: パススルーできない場合は None。
+    """
+    try:
+        f = open(file, 'rb')
+    except OSError:
+        return None
+    try:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if _is_passthrough_safe(mm):
+                return Passthrough(f, size)
+    except (OSError, ValueError):
+        pass
+    f.close()
+    return None
+
+
+def load_file(file, st=None):
+    """
+    ファイルの存在を確認して読み込みます。
+
+    PASSTHROUGH_MIN_SIZE 以上の通常ファイルは、デコードせずにそのまま出力できるかを検証し、
+    できる場合は Passthrough を返します。
+
+    Args:
+        file (str): 読み込むファイルのパス。
+        st (os.stat_result, optional): 取得済みの stat 結果。デフォルトは None（ここで取得する）。
+
+    Returns:
+        str, Passthrough or None: 出力する本文。ファイルが存在しない場合は None。
+    """
+    if st is None:
+        try:
+            st = os.stat(file)
+        except OSError:
+            return None
+    if st.st_size >= PASSTHROUGH_MIN_SIZE and stat.S_ISREG(st.st_mode):
+        body = open_passthrough(file, st.st_size)
+        if body is not None:
+            return body
+    return read_file(file)
+
+
+def iter_loaded(files, jobs=1, window=None, loader=load_file):
+    """
+    ファイルを読み込み、(ファイルパス, 本文) を files と同じ順序で返します。
+
+    jobs が 2 以上の場合はスレッドプールで先読みします。先読みするのは最大 window 件までで、
+    保持する内容はツリー全体ではなく window の大きさで抑えられます。
+
+    Args:
+        files (iterable): 読み込むファイルパスのイテラブル。
+        jobs (int, optional): 読み込みに使うスレッド数。デフォルトは 1（逐次読み込み）。
+        window (int, optional): 先読みするファイル数の上限。デフォルトは jobs * 4。
+        loader (callable, optional): ファイルを読み込む関数。デフォルトは load_file。
+
+    Yields:
+        tuple: (ファイルパス, 本文)。本文は loader の戻り値です。
+    """
+    if jobs <= 1:
+        for file in files:
+            yield file, loader(file)
+        return
+
+    window = max(window or jobs * READ_AHEAD_PER_JOB, jobs)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        try:
+            for file in files:
+                pending.append((file, executor.submit(loader, file)))
+                if len(pending) >= window:
+                    done_file, future = pending.popleft()
+                    yield done_file, future.result()
+            while pending:
+                done_file, future = pending.popleft()
+                yield done_file, future.result()
+        finally:
+            # 途中で打ち切られた場合、未着手の読み込みは取り消す
+            for _, future in pending:
+                future.cancel()
+
+
+class TextFormat:
+    """
+    区切り線とファイルごとの見出しで区切る、従来の出力形式です。
+
+    出力形式は iter_write から begin、ファイルごとの write_file、end の順に呼ばれます。
+    formats モジュールの JsonlFormat と IndexedFormat も同じメソッドを持ちます。
+    """
+
+    name = 'text'
+    # 標準出力へ出力する場合に、print() と同じく末尾に改行を付けるかどうか
+    trailing_newline = True
+
+    def begin(self, writer):
+        writer.write(SECTION_RULE)
+
+    def write_file(self, writer, file, status, header, body):
+        writer.write(header)
+        if isinstance(body, Passthrough):
+            with body.file:
+                writer.copy_file(body.file, body.size)
+            writer.write(body.suffix)
+        else:
+            writer.write(body)
+
+    def end(self, writer):
+        writer.write("\n" + SECTION_RULE)
+
+
+def body_status(body):
+    """
+    loader の戻り値から、FileRecord などで使うファイルの状態を返します。
+
+    Returns:
+        str: 'included'、'missing'、'error'、または省略した理由 ('binary'、'oversized')。
+    """
+    if body is None:
+        return MISSING
+    if isinstance(body, ErrorBody):
+        return getattr(body, 'reason', ERROR)
+    return INCLUDED
+
+
+def iter_write(files, writer, jobs=1, loader=load_file, budget=None, dedupe=None, stats=None, fmt=None,
+               transformer=None):
+    """
+    ファイルの内容を1件ずつ writer へ書き込み、ファイルごとに書き込んだ位置を返します。
+
+    ファイルは files の順に書き込まれ、保持するのは先読み中のファイルの内容だけです。
+    引数は write_files と同じです。
+
+    Yields:
+        tuple: (ファイルパス, 状態, 開始オフセット, バイト数)。状態は body_status の値のほか、
+            'duplicate' (参照に置き換えた) と 'omitted' (予算により省略した) があります。
+            書き込まなかったファイルのオフセットとバイト数は None です。
+    """
+    if stats is not None:
+        loader = stats.timed_loader(loader)
+        clock = time.perf_counter
+    if budget is not None:
+        files = budget.watch(files)
+        budget.reserve(SECTION_RULE + "\n" + SECTION_RULE)
+
+    if fmt is None:
+        fmt = TextFormat()
+    fmt.begin(writer)
+    loaded = iter_loaded(files, jobs, loader=loader)
+    if transformer is not None:
+        # 読み込んだ本文を、書き込む前に拡張子ごとの変換に通す (順序は変わらない)
+        loaded = transformer.iter_transform(loaded, stats)
+    for file, body in loaded:
+        status = body_status(body)
+        # 存在チェック
+        if body is None:
+            logger.warning(f"File does not exist: {file}")
+            yield file, status, None, None
+            continue
+
+        if dedupe is not None:
+            first = dedupe.check(file, body)
+            if first is not None:
+                logger.info(f"Duplicate of {first}: {file}")
+                body = dedupe.reference(first)
+                status = DUPLICATE
+                if stats is not None:
+                    stats.skip('duplicate')
+
+        header = render_header(file)
+        if budget is not None:
+            fitted = budget.fit(file, header, body)
+            if dedupe is not None and status != DUPLICATE and fitted is not body:
+                # 省略または切り詰めたファイルは、後の重複の参照先にしない
+                dedupe.forget(file)
+            body = fitted
+            if body is None:
+                logger.info(f"Omitted by token budget: {file}")
+                yield file, OMITTED, None, None
+                continue
+        logger.info(f"Included: {file}")
+
+        if stats is not None:
+            start = clock()
+        offset = writer.bytes_written
+        fmt.write_file(writer, file, status, header, body)
+        if stats is not None:
+            stats.add_time('write', clock() - start)
+        yield file, status, offset, writer.bytes_written - offset
+    fmt.end(writer)
+
+
+def write_files(files, writer, jobs=1, loader=load_file, budget=None, on_file=None, dedupe=None, stats=None,
+                on_record=None, fmt=None, transformer=None):
+    """
+    ファイルの内容を1件ずつ writer へ書き込みます。
+
+    ファイルは files の順に書き込まれ、保持するのは先読み中のファイルの内容だけです。
+
+    Args:
+        files (iterable): 出力するファイルパスのイテラブル。
+        writer (StreamWriter): 書き込み先のライター。
+        jobs (int, optional): 読み込みに使うスレッド数。デフォルトは 1。
+        loader (callable, optional): ファイルを読み込む関数。デフォルトは load_file。
+        budget (TokenBudget, optional): 出力全体のトークン数の上限。デフォルトは None（上限なし）。
+        on_file (callable, optional): 各ファイルを書き込んだ後に (ファイルパス, 開始オフセット, バイト数) を受け取るコールバック。
+        dedupe (Deduper, optional): 内容が同じファイルを参照に置き換える場合に指定します。デフォルトは None。
+        stats (RunStats, optional): 読み込み/書き込みの時間やバイト数を記録する場合に指定します。デフォルトは None。
+        on_record (callable, optional): 書き込まなかったものを含む各ファイルについて、iter_write が返す
+            (ファイルパス, 状態, 開始オフセット, バイト数) を受け取るコールバック。デフォルトは None。
+        fmt (optional): 出力形式。デフォルトは None（TextFormat）。
+        transformer (Transformer, optional): 書き込む前に本文を変換する場合に指定します。デフォルトは None。
+    """
+    for file, status, offset, length in iter_write(files, writer, jobs, loader, budget, dedupe, stats, fmt,
+                                                   transformer):
+        if on_record is not None:
+            on_record(file, status, offset, length)
+        if on_file is not None and offset is not None:
+            on_file(file, offset, length)
+
+
+def output_files(files, output_destination=None, jobs=1, cache=None, budget=None, dedupe=None, stats=None,
+                 loader=None, compress_level=None, on_record=None, fmt=None, transformer=None):
+    """
+    ファイルの内容をまとめて出力します。
+
+    Args:
+        files (iterable): 出力するファイルパスのイテラブル。
+        output_destination (str or file-like, optional): 出力先のパス、または書き込み可能な
+            ファイルライクオブジェクト。デフォルトは None（標準出力）。
+        jobs (int, optional): 読み込みに使うスレッド数。デフォルトは 1。
+        cache (AggregateCache, optional): 変更のないファイルの出力を再利用するキャッシュ。デフォルトは None。
+        budget (TokenBudget, optional): 出力全体のトークン数の上限。デフォルトは None（上限なし）。
+        dedupe (Deduper, optional): 内容が同じファイルを最初のファイルへの参照に置き換える場合に指定します。
+            デフォルトは None。
+        stats (RunStats, optional): フェーズごとの時間や件数を記録する場合に指定します。デフォルトは None。
+        loader (callable, optional): ファイルを読み込む関数。デフォルトは cache.load (cache 指定時) または load_file。
+        compress_level (int, optional): 出力先が .gz/.xz/.bz2 の場合の圧縮レベル。デフォルトは None（形式ごとのデフォルト）。
+        on_record (callable, optional): 各ファイルの (ファイルパス, 状態, 開始オフセット, バイト数) を受け取るコールバック。
+            詳細は write_files を参照してください。
+        fmt (optional): 出力形式 (TextFormat、formats.JsonlFormat など)。デフォルトは None（TextFormat）。
+        transformer (Transformer, optional): 読み込んだ本文を書き込む前に変換する場合に指定します
+            (transform.Transformer を参照)。デフォルトは None。
+    """
+    if fmt is None:
+        fmt = TextFormat()
+    if loader is None:
+        loader = cache.load if cache is not None else load_file
+
+    def finish(writer):
+        start = time.perf_counter()
+        writer.flush()
+        if stats is not None:
+            stats.add_time('write', time.perf_counter() - start)
+            stats.bytes_written = writer.bytes_written
+
+    if output_destination is None:
+        writer = StreamWriter(sys.stdout)
+        write_files(files, writer, jobs, loader, budget, dedupe=dedupe, stats=stats, on_record=on_record,
+                    fmt=fmt, transformer=transformer)
+        if fmt.trailing_newline:
+            # print() と同じく末尾に改行を付ける
+            writer.write("\n")
+        finish(writer)
+    elif isinstance(output_destination, (str, os.PathLike)):
         try:
-            with open(output_destination, 'w', encoding='utf-8') as f:
-                f.write(output_str)
+            # 拡張子が .gz/.xz/.bz2 の場合は、書き込みながら別スレッドで圧縮する
+            with open_output(output_destination, compress_level) as f:
+                writer = StreamWriter(f)
+                write_files(files, writer, jobs, loader, budget, dedupe=dedupe, stats=stats, on_record=on_record,
+                            fmt=fmt, transformer=transformer)
+                finish(writer)
         except Exception as e:
             print(f"Error writing to {output_destination}: {e}")
     else:
-        print(output_str)
+        writer = StreamWriter(output_destination)
+        write_files(files, writer, jobs, loader, budget, dedupe=dedupe, stats=stats, on_record=on_record,
+                    fmt=fmt, transformer=transformer)
+        finish(writer)
@@ -0,0 +1,114 @@
+# patterns.py
+
+import os
+import re
+import fnmatch
+
+# グロブの特殊文字を含むかどうかの判定用
+_MAGIC_CHARS = re.compile(r'[*?[]')
+
+
+def normalize_patterns(patterns):
+    """
+    パターンの末尾に '/' があれば除去します。
+    """
+    normalized = []
+    for pat in patterns:
+        if pat.endswith('/'):
+            pat = pat.rstrip('/')
+        normalized.append(pat)
+    return normalized
+
+
+def expand_or_patterns(patterns):
+    """
+    パターン内の '|' を分割し、フラットなパターンリストを返します。
+    例: ["*.py|*.txt", "*.md"] -> ["*.py", "*.txt", "*.md"]
+    """
+    expanded = []
+    for pat in patterns:
+        split_pats = pat.split('|')
+        expanded.extend(split_pats)
+    return expanded
+
+
+def _normcase(name):
+    return name
+
+
+# fnmatch.fnmatch と同じく、大文字小文字を区別しない OS では正規化してから比較する
+if os.path.normcase('A') != 'A':
+    _normcase = os.path.normcase
+
+
+class PatternSet:
+    """
+    複数のグロブパターンを一度だけコンパイルし、まとめて照合するマッチャーです。
+
+    `any(fnmatch.fnmatch(name, pat) for pat in patterns)` と同じ結果を返しますが、
+    パターンを種類ごとに振り分けて照合コストを下げます。
+
+    - 特殊文字を含まないパターン: 集合による完全一致
+    - '*.ext' 形式のパターン: 最後の '.' 以降による拡張子の集合照合
+    - '*literal' 形式のパターン: str.endswith による末尾一致
+    - それ以外のパターン: 1つに結合した正規表現
+
+    Args:
+        patterns (list): グロブパターンのリスト。'|' による OR 指定と末尾の '/' は正規化されます。
+    """
+
+    def __init__(self, patterns=None):
+        self.patterns = []
+        seen = set()
+        for pat in normalize_patterns(expand_or_patterns(patterns or [])):
+            if pat and pat not in seen:
+                seen.add(pat)
+                self.patterns.append(pat)
+
+        literals = set()
+        extensions = set()
+        suffixes = []
+        globs = []
+        for pat in self.patterns:
+            pat = _normcase(pat)
+            if not _MAGIC_CHARS.search(pat):
+                literals.add(pat)
+            elif pat.startswith('*') and not _MAGIC_CHARS.search(pat, 1):
+                suffix = pat[1:]
+                if suffix.startswith('.') and suffix.count('.') == 1:
+                    extensions.add(suffix)
+                else:
+                    suffixes.append(suffix)
+            else:
+                globs.append(pat)
+
+        self._literals = literals
+        self._extensions = extensions
+        self._suffixes = tuple(suffixes)
+        if globs:
+            self._regex = re.compile('|'.join(fnmatch.translate(pat) for pat in globs))
+        else:
+            self._regex = None
+
+    def __bool__(self):
+        return bool(self.patterns)
+
+    def __repr__(self):
+        return f"PatternSet({self.patterns!r})"
+
+    def match(self, name):
+        """
+        name がいずれかのパターンに一致するかどうかを返します。
+        """
+        name = _normcase(name)
+        if name in self._literals:
+            return True
+        if self._extensions:
+            dot = name.rfind('.')
+            if dot >= 0 and name[dot:] in self._extensions:
+                return True
+        if self._suffixes and name.endswith(self._suffixes):
+            return True
+        if self._regex is not None and self._regex.match(name):
+            return True
+        return False
@@ -0,0 +1,363 @@
+# shard.py
+
+import os
+import re
+import json
+import heapq
+import itertools
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from codeaggregator.output import (
+    StreamWriter, Passthrough, SECTION_RULE, render_header, load_file, iter_loaded, write_files,
+)
+from codeaggregator.tokens import estimate_tokens, estimate_file_tokens, stat_size
+
+logger = logging.getLogger(__name__)
+
+SHARD_UNITS = ('bytes', 'tokens')
+
+# シャードの書き込みスレッドへ渡すキューの長さ
+SINK_QUEUE_SIZE = 64
+
+_SIZE_RE = re.compile(r'^\s*(\d+)\s*([kmg]?)\s*(t|tokens?)?\s*$', re.IGNORECASE)
+_MULTIPLIERS = {'': 1, 'k': 1000, 'm': 1000 ** 2, 'g': 1000 ** 3}
+
+
+def parse_shard_size(value):
+    """
+    シャードサイズの指定を解析します。
+
+    数値の後ろに k/m/g (1000 倍単位) を付けられます。末尾に 't' を付けるとトークン数になります。
+    例: '500k' -> (500000, 'bytes'), '120kt' -> (120000, 'tokens')
+
+    Returns:
+        tuple: (サイズ, 単位)。
+    """
+    m = _SIZE_RE.match(value)
+    if not m:
+        raise ValueError(f"Invalid shard size: {value}")
+    size = int(m.group(1)) * _MULTIPLIERS[m.group(2).lower()]
+    if size <= 0:
+        raise ValueError(f"Invalid shard size: {value}")
+    return size, 'tokens' if m.group(3) else 'bytes'
+
+
+def shard_path(output, index):
+    """
+    出力先のパスから、index 番目 (1 始まり) のシャードのパスを作ります。例: out.txt -> out.001.txt
+    """
+    root, ext = os.path.splitext(output)
+    return f"{root}.{index:03d}{ext}"
+
+
+def manifest_path(output):
+    """シャードのマニフェストのパスを返します。例: out.txt -> out.manifest.json"""
+    root, _ = os.path.splitext(output)
+    return f"{root}.manifest.json"
+
+
+def plan_shards(files, count, size_of=stat_size):
+    """
+    size_of (デフォルトは stat) で得たサイズをもとに、ファイルを count 個のシャードへ貪欲法で振り分けます。
+
+    大きいファイルから順に、その時点で最も小さいシャードへ割り当てます。
+    各シャード内のファイルは元の順序を保ちます。
+
+    Returns:
+        list: シャードごとのファイルパスのリスト。
+    """
+    sized = [(size_of(file), position, file) for position, file in enumerate(files)]
+
+    heap = [(0, index) for index in range(count)]
+    assigned = [[] for _ in range(count)]
+    for size, position, file in sorted(sized, key=lambda item: (-item[0], item[1])):
+        load, index = heapq.heappop(heap)
+        assigned[index].append((position, file))
+        heapq.heappush(heap, (load + size, index))
+    return [[file for _, file in sorted(shard)] for shard in assigned]
+
+
+def write_shard_count(files, output, count, jobs=1, loader=load_file, size_of=stat_size):
+    """
+    ファイルを count 個のシャードへ振り分け、各シャードを並列に書き込みます。
+
+    Returns:
+        dict: マニフェストの内容。
+    """
+    plan = plan_shards(list(files), count, size_of)
+    entries = [[] for _ in plan]
+
+    def write_one(index):
+        path = shard_path(output, index + 1)
+        with open(path, 'wb') as f:
+            writer = StreamWriter(f)
+            write_files(plan[index], writer, loader=loader,
+                        on_file=lambda file, offset, length: entries[index].append((file, offset, length)))
+            writer.flush()
+        return path, writer.bytes_written
+
+    with ThreadPoolExecutor(max_workers=min(count, max(jobs, 8))) as executor:
+        results = list(executor.map(write_one, range(count)))
+
+    manifest = {'shards': [], 'files': []}
+    for index, (path, size) in enumerate(results):
+        manifest['shards'].append({'path': path, 'files': len(entries[index]), 'bytes': size})
+        for file, offset, length in entries[index]:
+            manifest['files'].append({'path': file, 'shard': index + 1, 'offset': offset, 'length': length})
+    return manifest
+
+
+class _ShardSink:
+    """
+    1つのシャードファイルへの書き込みを専用スレッドで行います。
+
+    呼び出し側は次のファイルの読み込みを続けられ、書き込みと読み込みが重なります。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.bytes_written = 0
+        self.files = 0
+        self._queue = queue.Queue(maxsize=SINK_QUEUE_SIZE)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name=f"shard-{os.path.basename(path)}", daemon=True)
+        self._thread.start()
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self.bytes_written += len(data)
+        self._queue.put(data)
+
+    def copy(self, body):
+        self.bytes_written += body.size
+        self._queue.put(body)
+        self.write(body.suffix)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        try:
+            with open(self.path, 'wb') as f:
+                writer = StreamWriter(f)
+                while True:
+                    item = self._queue.get()
+                    if item is None:
+                        break
+                    if isinstance(item, Passthrough):
+                        with item.file:
+                            writer.copy_file(item.file, item.size)
+                    else:
+                        writer.write_bytes(item)
+                writer.flush()
+        except Exception as e:
+            self._error = e
+            # 呼び出し側が put で止まらないよう、残りを読み捨てる
+            while self._queue.get() is not None:
+                pass
+
+
+def _measure(data, unit):
+    return len(data) if unit == 'bytes' else estimate_tokens(data)
+
+
+def _iter_lines(body):
+    """
+    本文を str.splitlines と同じ境界で分けた行を、UTF-8 のバイト列で返します。
+
+    Passthrough はファイルから1行ずつ読み、全体を読み込みません。末尾の suffix は最後の行に続けます。
+    """
+    if not isinstance(body, Passthrough):
+        for line in body.splitlines(keepends=True):
+            yield line.encode('utf-8')
+        return
+    remaining = body.size
+    tail = b''
+    while remaining > 0:
+        line = body.file.readline(remaining)
+        if not line:
+            break
+        remaining -= len(line)
+        if not line.endswith(b'\n'):
+            tail = line
+            break
+        for piece in line.decode('utf-8').splitlines(keepends=True):
+            yield piece.encode('utf-8')
+    for piece in (tail.decode('utf-8') + body.suffix).splitlines(keepends=True):
+        yield piece.encode('utf-8')
+
+
+def _split_lines(lines, limit, unit):
+    """
+    lines を、それぞれ limit 以内の部分に分割します (1行で limit を超える行はそのまま1部分)。
+
+    Returns:
+        list: 各部分の行数のリスト。
+    """
+    counts = []
+    current = 0
+    current_size = 0
+    for line in lines:
+        size = _measure(line, unit)
+        if current and current_size + size > limit:
+            counts.append(current)
+            current, current_size = 0, 0
+        current += 1
+        current_size += size
+    if current or not counts:
+        counts.append(current)
+    return counts
+
+
+def _part_header(file, number, total):
+    return render_header(f"{file} (part {number}/{total})")
+
+
+def _plan_parts(file, body, limit, overhead, unit):
+    """
+    1つのシャードに収まらない本文を分割する、各部分の行数のリストを返します。
+
+    部分の見出しは部分の数の桁数だけ長くなるため、桁数が足りなければ計算し直します。
+    """
+    start = body.file.tell() if isinstance(body, Passthrough) else None
+    digits = 1
+    while True:
+        widest = _measure(_part_header(file, '9' * digits, '9' * digits).encode('utf-8'), unit)
+        counts = _split_lines(_iter_lines(body), max(limit - overhead - widest, 1), unit)
+        if start is not None:
+            body.file.seek(start)
+        if len(str(len(counts))) <= digits:
+            return counts
+        digits = len(str(len(counts)))
+
+
+def write_shard_size(files, output, limit, unit='bytes', jobs=1, loader=load_file):
+    """
+    ファイルを順に、各シャードが limit (バイト数またはトークン数) 以内になるよう書き込みます。
+
+    ファイルはできるだけ分割せずに1つのシャードに収め、1ファイルで limit を超える場合は
+    行の境界で分割して、複数のシャードにまたがって書き込みます。
+    書き込み中のシャードは常に1つだけで、次のシャードを開く前に閉じます。
+
+    Returns:
+        dict: マニフェストの内容。
+    """
+    closing = "\n" + SECTION_RULE
+    overhead = _measure((SECTION_RULE + closing).encode('utf-8'), unit)
+    manifest = {'shards': [], 'files': []}
+    state = {'sink': None, 'used': 0}
+
+    def open_sink():
+        sink = _ShardSink(shard_path(output, len(manifest['shards']) + 1))
+        sink.write(SECTION_RULE)
+        state['sink'] = sink
+        state['used'] = overhead
+        return sink
+
+    def close_sink():
+        sink = state['sink']
+        if sink is not None:
+            sink.write(closing)
+            state['sink'] = None
+            sink.close()
+            manifest['shards'].append({'path': sink.path, 'files': sink.files, 'bytes': sink.bytes_written})
+
+    def add_entry(file, header, body, size, part=None):
+        sink = state['sink']
+        if sink is None or (sink.files and state['used'] + size > limit):
+            close_sink()
+            sink = open_sink()
+        offset = sink.bytes_written
+        sink.write(header)
+        if isinstance(body, Passthrough):
+            sink.copy(body)
+        else:
+            sink.write(body)
+        sink.files += 1
+        state['used'] += size
+        record = {'path': file, 'shard': len(manifest['shards']) + 1, 'offset': offset,
+                  'length': sink.bytes_written - offset}
+        if part is not None:
+            record['part'] = part
+        manifest['files'].append(record)
+
+    try:
+        for file, body in iter_loaded(files, jobs, loader=loader):
+            if body is None:
+                logger.warning(f"File does not exist: {file}")
+                continue
+            logger.info(f"Included: {file}")
+
+            header = render_header(file)
+            header_size = _measure(header.encode('utf-8'), unit)
+            if isinstance(body, Passthrough):
+                if unit == 'bytes':
+                    body_size = body.size + len(body.suffix.encode('utf-8'))
+                else:
+                    body_size = estimate_file_tokens(body.file, body.size) + _measure(body.suffix.encode('utf-8'), unit)
+            else:
+                body_size = _measure(body.encode('utf-8'), unit)
+
+            if overhead + header_size + body_size <= limit:
+                add_entry(file, header, body, header_size + body_size)
+                continue
+
+            # 1つのシャードに収まらないファイルは、行の境界で分割する (Passthrough も1部分ずつ読む)
+            try:
+                counts = _plan_parts(file, body, limit, overhead, unit)
+                lines = _iter_lines(body)
+                for number, count in enumerate(counts, 1):
+                    text = b''.join(itertools.islice(lines, count)).decode('utf-8')
+                    part_header = _part_header(file, number, len(counts))
+                    size = _measure(part_header.encode('utf-8'), unit) + _measure(text.encode('utf-8'), unit)
+                    # 分割した各部分は新しいシャードから始める
+                    close_sink()
+                    add_entry(file, part_header, text, size, part=number)
+            finally:
+                if isinstance(body, Passthrough):
+                    body.file.close()
+        if not manifest['shards'] and state['sink'] is None:
+            open_sink()
+        close_sink()
+    finally:
+        # 途中で失敗した場合も、書き込み中のシャードのスレッドを終わらせる
+        sink = state['sink']
+        if sink is not None:
+            state['sink'] = None
+            sink.close()
+
+    return manifest
+
+
+def write_shards(files, output, shard_size=None, unit='bytes', shards=None, jobs=1, loader=load_file,
+                 size_of=stat_size):
+    """
+    出力を複数のシャードファイルに分割して書き込み、マニフェストを保存します。
+
+    Args:
+        files (iterable): 出力するファイルパスのイテラブル。
+        output (str): 出力先のパス。シャードは out.001.txt のように番号を付けたパスに書き込まれます。
+        shard_size (int, optional): 1シャードあたりの上限 (unit の単位)。
+        unit (str, optional): shard_size の単位。'bytes' または 'tokens'。デフォルトは 'bytes'。
+        shards (int, optional): シャード数。指定した場合はサイズで均等になるよう振り分けます。
+        jobs (int, optional): 読み込み/書き込みに使うスレッド数。デフォルトは 1。
+        loader (callable, optional): ファイルを読み込む関数。デフォルトは load_file。
+        size_of (callable, optional): shards 指定時の振り分けに使うファイルサイズの取得関数。
+
+    Returns:
+        dict: マニフェストの内容 (各ファイルのシャード番号とシャード内のバイトオフセット)。
+    """
+    if shards:
+        manifest = write_shard_count(files, output, shards, jobs, loader, size_of)
+    else:
+        manifest = write_shard_size(files, output, shard_size, unit, jobs, loader)
+
+    with open(manifest_path(output), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    logger.info(f"Wrote {len(manifest['shards'])} shards and {manifest_path(output)}")
+    return manifest
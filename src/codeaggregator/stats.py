@@ -0,0 +1,218 @@
+# stats.py
+
+import io
+import sys
+import time
+import heapq
+import logging
+import threading
+import contextlib
+from codeaggregator.output import Passthrough, ErrorBody
+
+logger = logging.getLogger(__name__)
+
+# 集計するスキップ理由
+SKIP_REASONS = ('hidden', 'include', 'ignore', 'gitignore', 'missing', 'unreadable', 'binary', 'oversized',
+                'duplicate', 'budget', 'grep')
+
+# 表示する遅いファイルの数のデフォルト
+DEFAULT_SLOWEST = 10
+
+PROFILERS = ('cprofile', 'tracemalloc')
+
+
+class RunStats:
+    """
+    1回の実行のフェーズごとの時間と件数を集計します。
+
+    計測はフェーズの切り替わりとファイル単位でのみ行い、パターン照合などの内側のループには
+    時間の計測を入れません。読み込みは複数スレッドから記録されるためロックで保護します。
+
+    - walk: 走査と照合 (ファイルを1件取り出すまでの時間の合計)
+    - read: ファイルの読み込み (スレッドで並列に読む場合は各スレッドの時間の合計)
+    - write: 出力先への書き込み
+    - transform: 本文の変換 (--transform 指定時のみ。別プロセスで変換する場合は結果を待った時間)
+
+    Args:
+        slowest (int, optional): 記録する遅いファイルの数。デフォルトは 10。
+    """
+
+    def __init__(self, slowest=DEFAULT_SLOWEST):
+        self.slowest_count = slowest
+        self.phases = {'walk': 0.0, 'read': 0.0, 'write': 0.0}
+        self.dirs_visited = 0
+        self.dirs_pruned = 0
+        self.files_found = 0
+        self.files_read = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.skipped = dict.fromkeys(SKIP_REASONS, 0)
+        # 変換の名前 -> {'files', 'bytes_before', 'bytes_after', 'saved_bytes'} (Transformer.to_dict)
+        self.transforms = {}
+        self._slowest = []
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self.total = None
+
+    def skip(self, reason):
+        self.skipped[reason] += 1
+
+    def add_time(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def stop(self):
+        """経過時間の計測を終えます。"""
+        self.total = time.perf_counter() - self._started
+
+    def iter_timed(self, files, phase='walk'):
+        """
+        files をそのまま返すジェネレータです。次のファイルを取り出すまでの時間を phase に加算します。
+        """
+        it = iter(files)
+        clock = time.perf_counter
+        while True:
+            start = clock()
+            try:
+                file = next(it)
+            except StopIteration:
+                self.phases[phase] += clock() - start
+                return
+            self.phases[phase] += clock() - start
+            self.files_found += 1
+            yield file
+
+    def timed_loader(self, loader):
+        """
+        loader を包み、読み込み時間・バイト数・遅いファイルを記録する関数を返します。
+        """
+        clock = time.perf_counter
+
+        def load(file):
+            start = clock()
+            body = loader(file)
+            elapsed = clock() - start
+            if body is None:
+                size = 0
+            elif isinstance(body, Passthrough):
+                size = body.size
+            elif isinstance(body, ErrorBody):
+                size = 0
+            elif body.isascii():
+                size = len(body)
+            else:
+                size = len(body.encode('utf-8'))
+            with self._lock:
+                self.phases['read'] += elapsed
+                if body is None:
+                    self.skipped['missing'] += 1
+                    return body
+                if isinstance(body, ErrorBody):
+                    # 読み込む前に省略したファイル (SkippedBody) は理由ごとに数える
+                    self.skipped[getattr(body, 'reason', 'unreadable')] += 1
+                else:
+                    self.files_read += 1
+                    self.bytes_read += size
+                item = (elapsed, file)
+                if len(self._slowest) < self.slowest_count:
+                    heapq.heappush(self._slowest, item)
+                elif item > self._slowest[0]:
+                    heapq.heapreplace(self._slowest, item)
+            return body
+        return load
+
+    @property
+    def slowest(self):
+        """読み込みに時間がかかったファイルを (秒, パス) の遅い順のリストで返します。"""
+        return sorted(self._slowest, reverse=True)
+
+    def to_dict(self):
+        return {
+            'total_seconds': self.total,
+            'phases': dict(self.phases),
+            'dirs_visited': self.dirs_visited,
+            'dirs_pruned': self.dirs_pruned,
+            'files_found': self.files_found,
+            'files_read': self.files_read,
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'skipped': dict(self.skipped),
+            'transforms': dict(self.transforms),
+            'slowest': [{'path': file, 'seconds': seconds} for seconds, file in self.slowest],
+        }
+
+    def report(self):
+        """
+        集計結果を、表示用の行のリストで返します。
+        """
+        total = self.total if self.total is not None else time.perf_counter() - self._started
+        lines = [f"Total: {total:.3f} s"]
+        lines.append(f"  walk   {self.phases['walk']:8.3f} s  dirs visited {self.dirs_visited}, "
+                     f"pruned {self.dirs_pruned}, files found {self.files_found}")
+        lines.append(f"  read   {self.phases['read']:8.3f} s  files {self.files_read}, {self.bytes_read} bytes")
+        lines.append(f"  write  {self.phases['write']:8.3f} s  {self.bytes_written} bytes")
+        if 'transform' in self.phases:
+            lines.append(f"  transform {self.phases['transform']:5.3f} s")
+        for name, result in self.transforms.items():
+            lines.append(f"    {name:<10} files {result['files']}, saved {result['saved_bytes']} bytes "
+                         f"({result['bytes_before']} -> {result['bytes_after']})")
+        skipped = ', '.join(f"{reason} {count}" for reason, count in self.skipped.items() if count)
+        lines.append(f"Skipped: {skipped or 'none'}")
+        if self._slowest:
+            lines.append("Slowest files:")
+            for seconds, file in self.slowest:
+                lines.append(f"  {seconds * 1000:8.2f} ms  {file}")
+        return lines
+
+
+@contextlib.contextmanager
+def profile_run(kind=None, output=None, limit=25):
+    """
+    with ブロックの実行を cProfile または tracemalloc で計測します。kind が None の場合は何もしません。
+
+    Args:
+        kind (str, optional): 'cprofile' または 'tracemalloc'。
+        output (str, optional): cProfile の結果 (pstats 形式) を保存するパス。
+            None の場合は上位 limit 件を標準エラー出力に表示します。
+        limit (int, optional): 表示する件数。デフォルトは 25。
+    """
+    if kind is None:
+        yield
+        return
+
+    if kind == 'cprofile':
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            if output:
+                profiler.dump_stats(output)
+                logger.info(f"Wrote profile to {output}")
+            else:
+                buffer = io.StringIO()
+                pstats.Stats(profiler, stream=buffer).sort_stats('cumulative').print_stats(limit)
+                print(buffer.getvalue(), file=sys.stderr)
+    elif kind == 'tracemalloc':
+        import tracemalloc
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            lines = [f"tracemalloc peak: {peak} bytes", "Top allocations:"]
+            for stat in snapshot.statistics('lineno')[:limit]:
+                lines.append(f"  {stat}")
+            text = '\n'.join(lines) + '\n'
+            if output:
+                with open(output, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                logger.info(f"Wrote memory profile to {output}")
+            else:
+                print(text, end='', file=sys.stderr)
+    else:
+        raise ValueError(f"Unknown profiler: {kind}")
@@ -0,0 +1,241 @@
+# tokens.py
+
+import os
+import mmap
+import logging
+
+logger = logging.getLogger(__name__)
+
+# トークン数を見積もる際に一度に処理する大きさ
+ESTIMATE_CHUNK_SIZE = 1024 * 1024
+
+BUDGET_MODES = ('skip', 'truncate', 'stop')
+BUDGET_PRIORITIES = ('order', 'path', 'smallest')
+
+
+def _build_tables():
+    # 各バイトを 英数字 'a' / 空白 ' ' / 記号 'p' / 非ASCII 'u' の4種類に分類する
+    classes = bytearray()
+    for b in range(256):
+        c = chr(b)
+        if b >= 0x80:
+            classes.append(ord('u'))
+        elif c.isalnum() or c == '_':
+            classes.append(ord('a'))
+        elif c.isspace():
+            classes.append(ord(' '))
+        else:
+            classes.append(ord('p'))
+    # 分類後の列を、英数字とそれ以外の2種類にまとめる
+    runs = bytearray(range(256))
+    for c in b'pu':
+        runs[c] = ord(' ')
+    return bytes(classes), bytes(runs)
+
+
+_CLASS_TABLE, _RUN_TABLE = _build_tables()
+
+
+def estimate_tokens(data):
+    """
+    バイト列のトークン数を見積もります。
+
+    文字ごとの Python ループは使わず、bytes.translate と bytes.count (いずれも C 実装) で
+    バイトを分類・集計します。見積もりは一般的な BPE トークナイザよりやや多めになるようにしています。
+
+    - 英数字の連続 (単語): 1語あたり1トークン + 12文字ごとに1トークン
+    - 記号: 3/4 トークン
+    - 非ASCIIのバイト: 2バイトごとに1トークン
+    """
+    if not data:
+        return 0
+    classes = bytes(data).translate(_CLASS_TABLE)
+    alnum = classes.count(b'a')
+    punct = classes.count(b'p')
+    non_ascii = classes.count(b'u')
+    runs = classes.translate(_RUN_TABLE)
+    words = runs.count(b' a') + (1 if runs[:1] == b'a' else 0)
+    return words + alnum // 12 + punct * 3 // 4 + non_ascii // 2
+
+
+def estimate_text_tokens(text):
+    """文字列のトークン数を見積もります。"""
+    return estimate_tokens(text.encode('utf-8'))
+
+
+def estimate_file_tokens(f, size):
+    """
+    バイナリモードで開いたファイルの先頭から size バイトのトークン数を、mmap を使って見積もります。
+    """
+    if size == 0:
+        return 0
+    total = 0
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        end = min(size, len(mm))
+        for start in range(0, end, ESTIMATE_CHUNK_SIZE):
+            total += estimate_tokens(mm[start:min(start + ESTIMATE_CHUNK_SIZE, end)])
+    return total
+
+
+def truncate_text(text, max_tokens):
+    """
+    text を max_tokens 以内に収まるよう、行の境界で切り詰めます。
+
+    Returns:
+        str: 切り詰めた文字列 (max_tokens に収まる行がなければ空文字列)。
+    """
+    tokens = estimate_text_tokens(text)
+    while text and tokens > max_tokens:
+        # トークン数はおおむね長さに比例するので、比率で切る位置を決めて行の境界に合わせる
+        cut = int(len(text) * max_tokens / tokens)
+        newline = text.rfind('\n', 0, cut)
+        text = text[:newline + 1] if newline >= 0 else ''
+        tokens = estimate_text_tokens(text)
+    return text
+
+
+def stat_size(file):
+    """ファイルサイズを stat で取得します。取得できなければ 0 を返します。"""
+    try:
+        return os.stat(file).st_size
+    except OSError:
+        return 0
+
+
+def order_files(files, priority='order', size_of=stat_size):
+    """
+    トークン予算の優先順位に従ってファイルを並べ替えます。
+
+    Args:
+        files (iterable): ファイルパスのイテラブル。
+        priority (str, optional): 'order'（見つかった順, 並べ替えない）、'path'（パス順）、
+            'smallest'（サイズの小さい順）。デフォルトは 'order'。
+        size_of (callable, optional): 'smallest' で使うファイルサイズの取得関数。デフォルトは stat_size。
+    """
+    if priority == 'order':
+        return files
+    if priority == 'path':
+        return sorted(files)
+    return sorted(files, key=size_of)
+
+
+class TokenBudget:
+    """
+    出力全体のトークン数の上限を管理します。
+
+    write_files は各ファイルを書き込む前に fit を呼び出し、見出しと本文が予算に収まるかを判定します。
+    収まらない場合の扱いは mode で指定します。
+
+    - 'skip': そのファイルを省略し、後続のファイルで残りの予算を使う
+    - 'truncate': 収まる行までに切り詰めて出力し、以降のファイルは省略する
+    - 'stop': そのファイル以降をすべて省略する
+
+    Args:
+        max_tokens (int): 出力全体のトークン数の上限。
+        mode (str, optional): 予算を超える場合の扱い。デフォルトは 'skip'。
+    """
+
+    def __init__(self, max_tokens, mode='skip'):
+        if mode not in BUDGET_MODES:
+            raise ValueError(f"Unknown budget mode: {mode}")
+        self.max_tokens = max_tokens
+        self.mode = mode
+        self.used = 0
+        self.stopped = False
+        self.omitted = []
+        self.truncated = []
+
+    @property
+    def remaining(self):
+        return max(self.max_tokens - self.used, 0)
+
+    def reserve(self, text):
+        """出力に必ず含まれる文字列 (区切り線など) の分を予算から差し引きます。"""
+        self.used += estimate_text_tokens(text)
+
+    def watch(self, files):
+        """
+        files をそのまま返すジェネレータです。予算を使い切った後は読み込まずに省略として記録します。
+        """
+        for file in files:
+            if self.stopped:
+                self.omitted.append((file, None))
+                continue
+            yield file
+
+    def fit(self, file, header, body):
+        """
+        見出しと本文が予算に収まるかを判定し、出力する本文を返します。
+
+        Args:
+            file (str): ファイルパス。
+            header (str): ファイルの見出し。
+            body (str or Passthrough): load_file が返した本文。
+
+        Returns:
+            str, Passthrough or None: 出力する本文。省略する場合は None。
+        """
+        raw = not isinstance(body, str)
+        if self.stopped:
+            return self._omit(file, body, None)
+
+        header_tokens = estimate_text_tokens(header)
+        if raw:
+            body_tokens = estimate_file_tokens(body.file, body.size) + estimate_text_tokens(body.suffix)
+        else:
+            body_tokens = estimate_text_tokens(body)
+
+        tokens = header_tokens + body_tokens
+        if tokens <= self.remaining:
+            self.used += tokens
+            return body
+
+        if self.mode == 'skip':
+            return self._omit(file, body, tokens)
+        self.stopped = True
+        if self.mode == 'stop':
+            return self._omit(file, body, tokens)
+
+        # 'truncate': 残りの予算に収まる分だけ出力する
+        allowed = self.remaining - header_tokens - estimate_text_tokens(self._marker(0, 0))
+        if allowed <= 0:
+            return self._omit(file, body, tokens)
+        if raw:
+            with body.file:
+                cut = int(body.size * allowed / max(body_tokens, 1))
+                text = body.file.read(cut).decode('utf-8', errors='ignore')
+                total_bytes = body.size + len(body.suffix.encode('utf-8'))
+        else:
+            text = body
+            total_bytes = len(body.encode('utf-8'))
+        kept = truncate_text(text, allowed)
+        kept_bytes = len(kept.encode('utf-8'))
+        truncated = kept + self._marker(total_bytes - kept_bytes, body_tokens - estimate_text_tokens(kept))
+        self.used += header_tokens + estimate_text_tokens(truncated)
+        self.truncated.append((file, total_bytes - kept_bytes))
+        return truncated
+
+    def _marker(self, omitted_bytes, omitted_tokens):
+        return f"... [truncated {omitted_bytes} bytes (~{omitted_tokens} tokens) to fit the token budget]\n"
+
+    def _omit(self, file, body, tokens):
+        if not isinstance(body, str):
+            body.file.close()
+        self.omitted.append((file, tokens))
+        return None
+
+    def summary(self):
+        """
+        予算により省略・切り詰めたファイルの一覧を、出力用の行のリストで返します。
+        """
+        lines = [f"Token budget: used ~{self.used} of {self.max_tokens} tokens."]
+        if self.truncated:
+            lines.append(f"Truncated {len(self.truncated)} file(s):")
+            for file, omitted_bytes in self.truncated:
+                lines.append(f"  {file} ({omitted_bytes} bytes omitted)")
+        if self.omitted:
+            lines.append(f"Omitted {len(self.omitted)} file(s):")
+            for file, tokens in self.omitted:
+                detail = f"~{tokens} tokens" if tokens is not None else "not read"
+                lines.append(f"  {file} ({detail})")
+        return lines
@@ -0,0 +1,334 @@
+# transform.py
+
+import io
+import os
+import re
+import time
+import logging
+import tokenize
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from codeaggregator.output import Passthrough, ErrorBody
+
+logger = logging.getLogger(__name__)
+
+# 1回のバッチ (プロセスへの1回の依頼) にまとめるファイル数とバイト数の目安
+CHUNK_FILES = 32
+CHUNK_BYTES = 1024 * 1024
+
+PYTHON_SUFFIXES = ('.py', '.pyi', '.pyw')
+C_SUFFIXES = ('.c', '.h', '.cc', '.cpp', '.cxx', '.hh', '.hpp', '.hxx', '.m', '.mm', '.java', '.js', '.mjs', '.cjs',
+              '.jsx', '.ts', '.tsx', '.go', '.rs', '.cs', '.swift', '.kt', '.kts', '.scala', '.dart')
+
+_TRAILING_SPACE = re.compile(r'[ \t]+$', re.M)
+_BLANK_RUNS = re.compile(r'\n{3,}')
+
+# 文字列リテラルは残し、コメントだけを取り除く。行全体がコメントの場合は行ごと取り除く
+_C_TOKENS = re.compile(r'''
+    (?P<line>^[ \t]*(?://[^\n]*|/\*.*?\*/[ \t]*)(?:\n|\Z))
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | "(?:\\.|[^"\\\n])*"
+  | '(?:\\.|[^'\\\n])*'
+  | `(?:\\.|[^`\\])*`
+''', re.M | re.S | re.X)
+
+
+def collapse_whitespace(text):
+    """
+    行末の空白を取り除き、連続する空行を1行にまとめます。
+    """
+    return _BLANK_RUNS.sub('\n\n', _TRAILING_SPACE.sub('', text))
+
+
+def _replace_c_token(match):
+    if match.group('line') is not None:
+        return ''
+    comment = match.group('comment')
+    if comment is not None:
+        # プリプロセッサの行が後ろの行とつながらないよう、複数行のコメントは改行に置き換える
+        return '\n' * comment.count('\n') or ' '
+    return match.group(0)
+
+
+def strip_c_comments(text):
+    """
+    C 系の言語 (C/C++/Java/JavaScript/TypeScript/Go/Rust など) の // と /* */ のコメントを取り除きます。
+
+    文字列リテラル ("..."、'...'、`...`) の中は変更しません。空白は collapse_whitespace と同じく整えます。
+    """
+    return collapse_whitespace(_C_TOKENS.sub(_replace_c_token, text))
+
+
+def strip_python(text):
+    """
+    Python のコメントと空行を tokenize で取り除きます。
+
+    文字列 (docstring を含む) の中は変更せず、先頭の #! 行は残します。
+    tokenize できない内容 (構文の途中で切り詰めたファイルなど) はそのまま返します。
+    """
+    comments = {}
+    string_rows = set()
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(text).readline):
+            if token.type == tokenize.COMMENT:
+                comments[token.start[0]] = token.start[1]
+            elif token.end[0] > token.start[0] and token.type not in (tokenize.NL, tokenize.NEWLINE):
+                # 複数行にわたる文字列の行は、行末の空白や空行も内容の一部
+                string_rows.update(range(token.start[0], token.end[0] + 1))
+    except (tokenize.TokenError, SyntaxError):
+        return text
+
+    lines = []
+    for lineno, line in enumerate(text.splitlines(keepends=True), 1):
+        body = line.rstrip('\r\n')
+        ending = line[len(body):]
+        if lineno in comments and not (lineno == 1 and body.startswith('#!')):
+            body = body[:comments[lineno]]
+            if not body.strip():
+                continue
+        if lineno not in string_rows:
+            body = body.rstrip()
+            if not body:
+                continue
+        lines.append(body + ending)
+    result = ''.join(lines)
+    if text.endswith('\n') and not result.endswith('\n'):
+        result += '\n'
+    return result
+
+
+class Transform:
+    """
+    拡張子ごとに本文へ適用する変換です。
+
+    Args:
+        name (str): 変換の名前 (--transform で指定する名前)。
+        func (callable): 本文を受け取り、変換した本文を返す関数。プロセスプールで実行するため、
+            モジュールの最上位で定義した関数を指定します。
+        suffixes (tuple, optional): 対象の拡張子 (小文字)。None の場合は他の変換の対象でないすべてのファイル。
+    """
+
+    __slots__ = ('name', 'func', 'suffixes')
+
+    def __init__(self, name, func, suffixes=None):
+        self.name = name
+        self.func = func
+        self.suffixes = suffixes
+
+
+# 組み込みの変換 (変換は先に一致したものを1つだけ適用する)。
+# 拡張子を持たない変換 (whitespace) はすべてのファイルを読み込んで変換するため、名前で指定した場合だけ使う
+TRANSFORMS = {
+    'python': Transform('python', strip_python, PYTHON_SUFFIXES),
+    'c': Transform('c', strip_c_comments, C_SUFFIXES),
+    'whitespace': Transform('whitespace', collapse_whitespace),
+}
+
+
+def default_names(transforms=TRANSFORMS):
+    """
+    名前を指定しない場合 (--transform all) に使う変換の名前のリストを返します。拡張子を持たない変換は含めません。
+    """
+    return [name for name, transform in transforms.items() if transform.suffixes is not None]
+
+
+def _pool_context():
+    # 読み込み用のスレッドや常駐プロセスのスレッドが動いている中で fork するとデッドロックし得るため、
+    # fork を使わない開始方法でプロセスを作る
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def _run_batch(tasks):
+    # プロセスプールで実行する: [(関数, 本文), ...] -> [変換した本文, ...]
+    results = []
+    for func, text in tasks:
+        try:
+            results.append(func(text))
+        except Exception:
+            results.append(text)
+    return results
+
+
+def _utf8_size(text):
+    return len(text) if text.isascii() else len(text.encode('utf-8'))
+
+
+class TransformResult:
+    """
+    変換ごとの適用したファイル数と、変換前後のバイト数です。
+    """
+
+    __slots__ = ('files', 'bytes_before', 'bytes_after')
+
+    def __init__(self):
+        self.files = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    @property
+    def saved_bytes(self):
+        return self.bytes_before - self.bytes_after
+
+
+class Transformer:
+    """
+    読み込んだ本文を、書き込む前に拡張子ごとの変換に通します。
+
+    変換はプロセスプールで実行し、複数のファイルをまとめたバッチ (CHUNK_FILES 件または CHUNK_BYTES まで) を
+    1回の依頼として送ります。先読みするバッチは jobs + 1 件までで、出力の順序は変わりません。
+    プロセスは fork ではなく forkserver (使えない環境では spawn) で開始します。
+    読み込みに失敗したファイルや省略したファイル、対象の変換がないファイルはそのまま通します。
+    変換するファイルは、デコードせずに出力する大きなファイル (Passthrough) も読み込んでデコードします。
+
+    Args:
+        names (list, optional): 使う変換の名前のリスト。デフォルトは None（default_names の変換。whitespace は含めない）。
+        jobs (int, optional): 変換に使うプロセス数。1 の場合はプロセスを作らずに変換します。
+            デフォルトは None（CPU 数）。
+        transforms (dict, optional): 名前 -> Transform。独自の変換を使う場合に指定します。デフォルトは TRANSFORMS。
+
+    Raises:
+        KeyError: names に未知の変換の名前が含まれる場合。
+    """
+
+    def __init__(self, names=None, jobs=None, transforms=None):
+        transforms = TRANSFORMS if transforms is None else transforms
+        self.transforms = [transforms[name] for name in (names if names is not None else default_names(transforms))]
+        self.jobs = jobs or os.cpu_count() or 1
+        self.chunk_files = CHUNK_FILES
+        self.chunk_bytes = CHUNK_BYTES
+        self.results = {transform.name: TransformResult() for transform in self.transforms}
+
+    def transform_for(self, file):
+        """
+        file に適用する変換を返します。対象の変換がない場合は None を返します。
+        """
+        suffix = os.path.splitext(file)[1].lower()
+        fallback = None
+        for transform in self.transforms:
+            if transform.suffixes is None:
+                fallback = fallback or transform
+            elif suffix in transform.suffixes:
+                return transform
+        return fallback
+
+    def _task(self, file, body):
+        if body is None or isinstance(body, ErrorBody):
+            return None
+        transform = self.transform_for(file)
+        if transform is None:
+            return None
+        if isinstance(body, Passthrough):
+            # デコードせずに出力する予定だった大きなファイルも、変換のために読み込む
+            with body.file:
+                body = body.file.read(body.size).decode('utf-8') + body.suffix
+        # 本文の末尾には各ファイルの後ろに付ける改行があるため、変換の対象から除いて後で付け直す
+        if body.endswith('\n'):
+            return transform, body[:-1], '\n'
+        return transform, body, ''
+
+    def _record(self, transform, before, after):
+        result = self.results[transform.name]
+        result.files += 1
+        result.bytes_before += _utf8_size(before)
+        result.bytes_after += _utf8_size(after)
+
+    def wrap(self, loader):
+        """
+        loader を包み、読み込んだ本文をこのプロセスで変換して返す関数を返します (Deduper の読み直しなどに使います)。
+        """
+        def load(file):
+            body = loader(file)
+            task = self._task(file, body)
+            if task is None:
+                return body
+            transform, text, suffix = task
+            return _run_batch([(transform.func, text)])[0] + suffix
+        return load
+
+    def iter_transform(self, loaded, stats=None):
+        """
+        (ファイルパス, 本文) のイテラブルを受け取り、変換した本文を同じ順序で返すジェネレータです。
+        """
+        executor = None
+        if self.jobs > 1:
+            executor = ProcessPoolExecutor(max_workers=self.jobs, mp_context=_pool_context())
+        clock = time.perf_counter
+        pending = deque()
+        batch = []
+        tasks = []
+        size = 0
+
+        def submit():
+            payload = [(transform.func, text) for _, transform, text, _ in tasks]
+            if executor is None or not payload:
+                start = clock()
+                outcome = _run_batch(payload)
+                if stats is not None:
+                    stats.add_time('transform', clock() - start)
+            else:
+                outcome = executor.submit(_run_batch, payload)
+            pending.append((batch, tasks, outcome))
+
+        def collect():
+            done, done_tasks, outcome = pending.popleft()
+            if isinstance(outcome, list):
+                texts = outcome
+            else:
+                # 別プロセスでの変換を待った時間を記録する
+                start = clock()
+                texts = outcome.result()
+                if stats is not None:
+                    stats.add_time('transform', clock() - start)
+            for (index, transform, before, suffix), after in zip(done_tasks, texts):
+                self._record(transform, before, after)
+                done[index] = (done[index][0], after + suffix)
+            return done
+
+        try:
+            for file, body in loaded:
+                task = self._task(file, body)
+                if task is None:
+                    if not batch and not pending:
+                        yield file, body
+                        continue
+                    batch.append((file, body))
+                else:
+                    transform, text, suffix = task
+                    tasks.append((len(batch), transform, text, suffix))
+                    batch.append((file, None))
+                    size += len(text)
+                if len(batch) >= self.chunk_files or size >= self.chunk_bytes:
+                    submit()
+                    batch, tasks, size = [], [], 0
+                    if len(pending) > self.jobs:
+                        yield from collect()
+            if batch:
+                submit()
+            while pending:
+                yield from collect()
+        finally:
+            if executor is not None:
+                # 途中で打ち切られた場合、未着手のバッチは取り消す
+                for _, _, outcome in pending:
+                    if not isinstance(outcome, list):
+                        outcome.cancel()
+                executor.shutdown()
+            logger.info('\n'.join(self.summary()))
+
+    def summary(self):
+        """
+        変換ごとに減らしたバイト数を、表示用の行のリストで返します。
+        """
+        lines = ['Transforms:']
+        for name, result in self.results.items():
+            ratio = result.saved_bytes / result.bytes_before * 100 if result.bytes_before else 0.0
+            lines.append(f"  {name:<10} files {result.files}, {result.bytes_before} -> {result.bytes_after} bytes "
+                         f"(saved {result.saved_bytes} bytes, {ratio:.1f}%)")
+        return lines
+
+    def to_dict(self):
+        return {name: {'files': result.files, 'bytes_before': result.bytes_before,
+                       'bytes_after': result.bytes_after, 'saved_bytes': result.saved_bytes}
+                for name, result in self.results.items()}
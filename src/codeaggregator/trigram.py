@@ -0,0 +1,529 @@
+# trigram.py
+
+import io
+import os
+import re
+import sys
+import mmap
+import time
+import struct
+import logging
+import argparse
+import threading
+from codeaggregator.cache import RACY_WINDOW_NS, cache_dir
+from codeaggregator.classify import SNIFF_SIZE, is_binary
+from codeaggregator.output import decode_text, ErrorBody
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python 3.10 以前
+    import sre_parse
+    import sre_constants
+
+logger = logging.getLogger(__name__)
+
+# キャッシュディレクトリ内のトライグラム索引のファイル名
+TRIGRAM_INDEX_NAME = 'trigrams.idx'
+TRIGRAM_MAGIC = b'CAGTRI1\n'
+# 各項目の先頭: (パスのバイト数, サイズ, 更新時刻 (ns), inode, シグネチャのバイト数)
+_ENTRY = struct.Struct('>IQqQI')
+
+# ファイルごとのシグネチャのビット数の範囲と、トライグラム1つあたりのビット数の目安
+MIN_SIGNATURE_BITS = 1 << 10
+MAX_SIGNATURE_BITS = 1 << 20
+BITS_PER_TRIGRAM = 4
+
+# シグネチャのビット数 -> トライグラムの値からビットの位置を決める法 (ビット数以下の最大の素数)
+_MODULI = {1 << 10: 1021, 1 << 11: 2039, 1 << 12: 4093, 1 << 13: 8191, 1 << 14: 16381, 1 << 15: 32749,
+           1 << 16: 65521, 1 << 17: 131071, 1 << 18: 262139, 1 << 19: 524287, 1 << 20: 1048573}
+# 照合のために読み込んだ内容を、出力で読み直さずに使うために保持する合計の上限
+PREFETCH_MAX_BYTES = 64 * 1024 * 1024
+
+# 4バイトの語 (ネイティブのバイト順) から先頭3バイトのトライグラムを取り出すシフト量
+_WORD_SHIFT = 0 if sys.byteorder == 'little' else 8
+
+# 必ず現れる文字の並びの途中でも、連続を切らずに読み飛ばす要素 (幅を持たない位置の指定)
+_ZERO_WIDTH = (sre_constants.AT,)
+
+# IGNORECASE で非 ASCII の文字にも一致する ASCII の英字 (I/i は U+0130/U+0131、K/k は KELVIN SIGN U+212A、
+# S/s は LONG S U+017F)。索引は ASCII だけを小文字にそろえるため、これらを含む並びはトライグラムに使えない
+_NON_ASCII_FOLDS = frozenset('IKSiks')
+_REPEATS = tuple(getattr(sre_constants, name) for name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT')
+                 if hasattr(sre_constants, name))
+
+
+def index_path(directory):
+    """
+    directory のトライグラム索引のパスを返します (directory のキャッシュディレクトリの中)。
+    """
+    return os.path.join(cache_dir(directory), TRIGRAM_INDEX_NAME)
+
+
+def read_candidate(file, size, classifier=None):
+    """
+    照合のために file の内容を読み込みます。
+
+    classifier を指定した場合、大きすぎるファイルは開かずに、バイナリのファイルは先頭 SNIFF_SIZE バイトだけを読んで
+    None を返します (出力でも本文を省略するファイルのため、照合の対象にしません)。
+
+    Raises:
+        OSError: ファイルを読み込めない場合。
+    """
+    if classifier is not None and classifier.is_oversized(size):
+        return None
+    with open(file, 'rb') as f:
+        if classifier is None or classifier.include_binary or size == 0:
+            return f.read()
+        prefix = f.read(SNIFF_SIZE)
+        if is_binary(prefix, complete=size <= SNIFF_SIZE):
+            return None
+        return prefix + f.read()
+
+
+def _positions(trigrams, nbits):
+    modulus = _MODULI[nbits]
+    return [int.from_bytes(gram, sys.byteorder) % modulus for gram in trigrams]
+
+
+def trigrams(data):
+    """
+    バイト列に含まれるトライグラム (3バイトの並び) の集合を返します。英字は小文字にそろえます。
+    """
+    data = data.lower()
+    return {data[i:i + 3] for i in range(len(data) - 2)}
+
+
+def _words(data):
+    # 各位置から始まる4バイトの語の集合を返す (トライグラムは各語の先頭3バイト)。
+    # 4通りの開始位置で memoryview を整数の列として読み、位置ごとの処理を Python のループで行わない
+    data = data.lower() + b'\0'
+    words = set()
+    for start in range(4):
+        end = start + (len(data) - start) // 4 * 4
+        words.update(memoryview(data[start:end]).cast('I'))
+    return words
+
+
+def signature(data):
+    """
+    ファイルの内容から、トライグラムを1ビットずつに割り当てたシグネチャ (ブルームフィルタ) を作成します。
+
+    ビット数はトライグラムの種類の数に合わせて 2 のべき乗で決めるため、大きなファイルでも
+    ほぼすべてのビットが立って絞り込めなくなることはありません。
+
+    Returns:
+        bytes: シグネチャ (ビット i はバイト i // 8 の下位から i % 8 番目)。
+    """
+    words = _words(data)
+    nbits = 1 << max(len(words) * BITS_PER_TRIGRAM - 1, 0).bit_length()
+    nbits = min(max(nbits, MIN_SIGNATURE_BITS), MAX_SIGNATURE_BITS)
+    modulus = _MODULI[nbits]
+    bits = bytearray(nbits // 8)
+    for pos in {(word >> _WORD_SHIFT & 0xFFFFFF) % modulus for word in words}:
+        bits[pos >> 3] |= 1 << (pos & 7)
+    return bytes(bits)
+
+
+def required_trigrams(regex):
+    """
+    正規表現に一致する文字列が必ず含むトライグラムの集合を返します。
+
+    一致に必須のリテラル (選択 `|` や 0 回を許す繰り返しの外側にある、3文字以上の連続した文字) だけを
+    取り出します。取り出せない場合は空の集合を返し、その場合はすべてのファイルを照合します。
+    """
+    try:
+        tree = sre_parse.parse(regex.pattern, regex.flags)
+    except Exception:
+        return set()
+    runs = []
+    _collect_runs(tree, bool(regex.flags & re.IGNORECASE), runs)
+    grams = set()
+    for run in runs:
+        grams |= trigrams(run.encode('utf-8'))
+    return grams
+
+
+def _collect_runs(items, ignore_case, runs):
+    current = []
+
+    def flush():
+        if len(current) >= 3:
+            runs.append(''.join(current))
+        del current[:]
+
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            char = chr(av)
+            if ignore_case and (not char.isascii() or char in _NON_ASCII_FOLDS):
+                # 大文字小文字を区別しない場合、非 ASCII の文字に一致し得る文字で並びを区切る
+                flush()
+            else:
+                current.append(char)
+        elif op in _ZERO_WIDTH:
+            continue
+        elif op is sre_constants.SUBPATTERN:
+            flush()
+            add_flags = av[1] if len(av) == 4 else 0
+            _collect_runs(av[-1], ignore_case or bool(add_flags & sre_constants.SRE_FLAG_IGNORECASE), runs)
+        elif op in _REPEATS:
+            flush()
+            low, high, item = av
+            if low >= 1:
+                _collect_runs(item, ignore_case, runs)
+        else:
+            flush()
+    flush()
+
+
+class TrigramIndex:
+    """
+    ファイルごとのトライグラムのシグネチャを、パスと stat (サイズ, 更新時刻, inode) をキーに保持する永続的な索引です。
+
+    stat が変わっていないファイルは、内容を読まずにシグネチャだけで「一致し得ない」と判定できます。
+    変更されたファイルは読み直したときにシグネチャを作り直すため、更新は変更されたファイルの分だけで済みます。
+    キャッシュと同じく、直前に更新されたファイルは同じ時刻のまま再び変更され得るので保存しません。
+
+    Args:
+        path (str, optional): 索引ファイルのパス。None の場合はメモリ上だけで使います。
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.updated = 0
+        self.dirty = False
+        # 検索対象ディレクトリからの相対パス -> (サイズ, 更新時刻, inode, シグネチャ (bytes または memoryview))
+        self._entries = self._load() if path is not None else {}
+        self._racy_after_ns = time.time_ns() - RACY_WINDOW_NS
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                # 索引全体を複製せず、シグネチャは必要になったページだけを読み込む
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            # 空のファイルは mmap できない
+            data = b''
+        except OSError as e:
+            logger.warning(f"Cannot read trigram index {self.path}: {e}")
+            return {}
+        entries = {}
+        if data[:len(TRIGRAM_MAGIC)] != TRIGRAM_MAGIC:
+            logger.warning(f"Ignoring broken trigram index: {self.path}")
+            return entries
+        view = memoryview(data)
+        pos = len(TRIGRAM_MAGIC)
+        try:
+            while pos < len(data):
+                path_len, size, mtime_ns, ino, nbytes = _ENTRY.unpack_from(data, pos)
+                pos += _ENTRY.size
+                key = os.fsdecode(bytes(view[pos:pos + path_len]))
+                pos += path_len
+                # シグネチャは複製せず、読み込んだ索引の該当部分を参照する
+                bits = view[pos:pos + nbytes]
+                pos += nbytes
+                if len(bits) != nbytes:
+                    raise struct.error('truncated entry')
+                entries[key] = (size, mtime_ns, ino, bits)
+        except struct.error:
+            logger.warning(f"Ignoring broken trigram index: {self.path}")
+            return {}
+        return entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def lookup(self, key, st):
+        """
+        stat が一致する場合はシグネチャを、索引にないか変更されている場合は None を返します。
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[:3] != (st.st_size, st.st_mtime_ns, st.st_ino):
+            return None
+        return entry[3]
+
+    def update(self, key, st, data):
+        """
+        読み込んだ内容からシグネチャを作成して記録し、シグネチャを返します。
+        """
+        bits = signature(data)
+        if st.st_mtime_ns < self._racy_after_ns:
+            self._entries[key] = (st.st_size, st.st_mtime_ns, st.st_ino, bits)
+            self.updated += 1
+            self.dirty = True
+        return bits
+
+    def refresh(self, key, file, classifier=None):
+        """
+        file の項目が古ければ読み直して更新します。classifier が省略するファイルは索引に含めません。
+
+        Returns:
+            bool: 読み直した場合は True。存在しないか読めない場合、省略するファイルの場合と、変更がない場合は False。
+        """
+        try:
+            st = os.stat(file)
+            if self.lookup(key, st) is not None:
+                return False
+            data = read_candidate(file, st.st_size, classifier)
+        except OSError as e:
+            logger.debug(f"Cannot index {file}: {e}")
+            return False
+        if data is None:
+            return False
+        self.update(key, st, data)
+        return True
+
+    def prune(self, keep):
+        """
+        keep に含まれない項目を削除し、削除した数を返します。
+        """
+        removed = [key for key in self._entries if key not in keep]
+        for key in removed:
+            del self._entries[key]
+        if removed:
+            self.dirty = True
+        return len(removed)
+
+    def clear(self):
+        """
+        索引の内容をすべて破棄します。
+        """
+        self._entries.clear()
+        self.dirty = True
+
+    def save(self):
+        """
+        変更があれば索引をディスクへ書き込みます。
+        """
+        if self.path is None or not self.dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(TRIGRAM_MAGIC)
+                for key, (size, mtime_ns, ino, bits) in self._entries.items():
+                    name = os.fsencode(key)
+                    f.write(_ENTRY.pack(len(name), size, mtime_ns, ino, len(bits)))
+                    f.write(name)
+                    f.write(bits)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Error writing trigram index to {self.path}: {e}")
+            return
+        self.dirty = False
+
+
+class ContentFilter:
+    """
+    内容が正規表現に一致するファイルだけを残すフィルタです。
+
+    索引があれば、まず正規表現に必須のトライグラムをシグネチャと照合し、一致し得ないファイルは読み込みません。
+    残った候補だけを読み込んで正規表現で確認します。読み込んだファイルの索引の項目はその場で更新します。
+    classifier が省略するファイル (大きすぎる/バイナリ) は、出力でも本文を省略するため一致しないものとして扱います。
+
+    一致したファイルの内容は合計 PREFETCH_MAX_BYTES まで保持し、wrap した loader はそれを使って読み直しを省きます。
+
+    Args:
+        regex (str or re.Pattern): ファイルの内容 (UTF-8 として解釈) から検索する正規表現。
+        index (TrigramIndex, optional): 候補の絞り込みに使う索引。None の場合はすべてのファイルを読み込みます。
+        classifier (FileClassifier, optional): 大きすぎるファイルとバイナリのファイルを除く場合に指定します。
+    """
+
+    def __init__(self, regex, index=None, classifier=None):
+        self.regex = re.compile(regex) if isinstance(regex, str) else regex
+        self.index = index
+        self.classifier = classifier
+        self.required = required_trigrams(self.regex)
+        self.checked = 0
+        self.narrowed = 0
+        self.reads = 0
+        self.matched = 0
+        self.reused = 0
+        # シグネチャのバイト数 -> 照合するビットの位置
+        self._positions = {}
+        # ファイルパス -> (stat, 読み込んだ内容)。loader は -j 指定時に読み込み用のスレッドから呼ばれる
+        self._prefetched = {}
+        self._prefetched_bytes = 0
+        self._lock = threading.Lock()
+
+    def _may_match(self, bits):
+        positions = self._positions.get(len(bits))
+        if positions is None:
+            positions = self._positions[len(bits)] = _positions(self.required, len(bits) * 8)
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in positions)
+
+    def match(self, file, key):
+        """
+        file の内容が正規表現に一致すれば True を返します。
+
+        存在しないファイルや読み込めないファイルは、出力段階で理由を表示するために True を返します。
+        """
+        self.checked += 1
+        try:
+            st = os.stat(file)
+        except OSError:
+            return True
+        bits = self.index.lookup(key, st) if self.index is not None else None
+        if bits is not None and self.required and not self._may_match(bits):
+            self.narrowed += 1
+            return False
+        try:
+            data = read_candidate(file, st.st_size, self.classifier)
+        except OSError:
+            return True
+        if data is None:
+            return False
+        self.reads += 1
+        if self.index is not None and bits is None:
+            self.index.update(key, st, data)
+        if self.regex.search(data.decode('utf-8', 'replace')) is None:
+            return False
+        self.matched += 1
+        with self._lock:
+            if self._prefetched_bytes + len(data) <= PREFETCH_MAX_BYTES:
+                self._prefetched[file] = (st, data)
+                self._prefetched_bytes += len(data)
+        return True
+
+    def _take(self, file):
+        with self._lock:
+            entry = self._prefetched.pop(file, None)
+            if entry is not None:
+                self._prefetched_bytes -= len(entry[1])
+        return entry
+
+    def wrap(self, loader, excerpter=None, cache=None, on_stat=None):
+        """
+        照合のために読み込んだ内容があれば、それから本文を作り、なければ loader で読み込む関数を返します。
+
+        内容を保持しているのは classifier の判定を通ったファイルだけのため、判定は省きます。
+        本文は load_file (excerpter を指定した場合は先頭/末尾だけ) と同じです。cache を指定した場合は、
+        作成した本文を cache.load で読み込んだ場合と同じくキャッシュに記録します。
+        on_stat は FileClassifier.wrap と同じく、照合の時点の stat 結果を受け取ります。
+        """
+        def load(file):
+            entry = self._take(file)
+            if entry is None:
+                return loader(file)
+            st, data = entry
+            if on_stat is not None:
+                on_stat(file, st)
+            with self._lock:
+                self.reused += 1
+            try:
+                if excerpter:
+                    body = excerpter.excerpt_stream(io.BytesIO(data), len(data))
+                    if body is not None:
+                        logger.info(f"Excerpted: {file}")
+                        return body
+                body = decode_text(data) + "\n"
+            except UnicodeDecodeError as e:
+                return ErrorBody(f"Error reading {file}: {e}\n")
+            if cache is not None:
+                cache.remember(file, st, body)
+            return body
+        return load
+
+    def filter(self, files, root, stats=None):
+        """
+        files (root 以下のファイルパスのイテラブル) のうち、内容が一致するものを順に返すジェネレータです。
+        """
+        base = os.path.join(root, '')
+        for file in files:
+            key = file[len(base):] if file.startswith(base) else os.path.relpath(file, root)
+            if self.match(file, key):
+                yield file
+            elif stats is not None:
+                stats.skip('grep')
+        logger.info(f"Grep: {self.matched} of {self.checked} file(s) matched, {self.reads} read, "
+                    f"{self.narrowed} skipped by the trigram index")
+
+
+def index_main(argv):
+    """
+    `code-aggregator index` のエントリポイントです。
+    """
+    from codeaggregator.aggregator import Aggregator
+    from codeaggregator.cli import expand_patterns
+
+    parser = argparse.ArgumentParser(
+        prog='code-aggregator index',
+        description=f'--grep で使うトライグラム索引 ($XDG_CACHE_HOME/codeaggregator/ 以下の {TRIGRAM_INDEX_NAME}) を作成・更新する'
+    )
+    parser.add_argument(
+        'directory',
+        nargs='?',
+        default='.',
+        help='索引を作成するディレクトリ (デフォルト: カレントディレクトリ)'
+    )
+    parser.add_argument(
+        '-P', '--pattern',
+        help='索引に含めるファイルパターンを指定 (例: *.py|*.txt)'
+    )
+    parser.add_argument(
+        '-I', '--ignore',
+        help='除外するファイル/ディレクトリパターンを指定 (例: node_modules/|__pycache__/)'
+    )
+    parser.add_argument(
+        '-a', '--all',
+        action='store_true',
+        help='隠しファイルやフォルダも含める'
+    )
+    parser.add_argument(
+        '--gitignore',
+        action='store_true',
+        help='.gitignore に従ってファイルを除外する'
+    )
+    parser.add_argument(
+        '--walk-threads',
+        type=int,
+        default=1,
+        metavar='N',
+        help='ディレクトリの走査に使うスレッド数 (デフォルト: 1)'
+    )
+    parser.add_argument(
+        '--rebuild',
+        action='store_true',
+        help='既存の索引を破棄して作り直す'
+    )
+    parser.add_argument(
+        '-i', '--info',
+        action='store_true',
+        help='詳細情報の表示 (INFOレベルのログを有効にします)'
+    )
+    args = parser.parse_args(argv)
+    if args.walk_threads < 1:
+        parser.error('--walk-threads には 1 以上を指定してください')
+    if not os.path.isdir(args.directory):
+        parser.error(f'ディレクトリではありません: {args.directory}')
+
+    logging.basicConfig(level=logging.INFO if args.info else logging.WARNING, format='%(levelname)s: %(message)s')
+
+    aggregator = Aggregator(
+        patterns=expand_patterns(args.pattern) if args.pattern else None,
+        ignore_patterns=expand_patterns(args.ignore) if args.ignore else None,
+        include_hidden=args.all,
+        gitignore=args.gitignore,
+        walk_threads=args.walk_threads
+    )
+
+    start = time.perf_counter()
+    index = TrigramIndex(index_path(args.directory))
+    if args.rebuild:
+        index.clear()
+    base = os.path.join(args.directory, '')
+    seen = set()
+    for file in aggregator.walker(args.directory)():
+        key = file[len(base):] if file.startswith(base) else os.path.relpath(file, args.directory)
+        seen.add(key)
+        index.refresh(key, file, aggregator.classifier)
+    removed = index.prune(seen)
+    index.save()
+    print(f"Indexed {len(index)} file(s): {index.updated} updated, {removed} removed "
+          f"in {time.perf_counter() - start:.3f} s", file=sys.stderr)
+    return 0
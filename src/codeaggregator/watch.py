@@ -0,0 +1,393 @@
+# watch.py
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import logging
+import ctypes
+import ctypes.util
+from codeaggregator.output import (
+    StreamWriter, Passthrough, SECTION_RULE, render_header, load_file, iter_loaded,
+)
+
+logger = logging.getLogger(__name__)
+
+# 最後の変更からこの時間 (秒) 変更がなければ出力を更新する
+DEFAULT_DEBOUNCE = 0.2
+
+# inotify が使えない場合の走査間隔 (秒)
+DEFAULT_POLL_INTERVAL = 1.0
+
+# イベントの種類
+MODIFIED = 'modified'      # 既存ファイルの内容が変わった
+STRUCTURAL = 'structural'  # ファイル/ディレクトリの作成・削除・移動 (ファイルリストの作り直しが必要)
+RESCAN = 'rescan'          # イベントを取りこぼした (すべてを作り直す)
+
+# <sys/inotify.h> の定数
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_EXCL_UNLINK = 0x04000000
+
+_WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+               | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_EXCL_UNLINK)
+_STRUCTURAL_MASK = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+# struct inotify_event の固定部分 (wd, mask, cookie, len)
+_EVENT = struct.Struct('iIII')
+_READ_SIZE = 64 * 1024
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+    except (OSError, AttributeError):
+        return None
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+class InotifyWatcher:
+    """
+    inotify (ctypes 経由) でディレクトリの変更を監視します。
+
+    監視するのは sync に渡したディレクトリ (走査で実際に降りたディレクトリ) だけで、
+    除外されたディレクトリには inotify のウォッチを割り当てません。
+    """
+
+    def __init__(self):
+        self._libc = _load_libc()
+        if self._libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        self._wd_by_path = {}
+        self._path_by_wd = {}
+
+    @property
+    def watched(self):
+        return set(self._wd_by_path)
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def sync(self, dirs):
+        """
+        監視するディレクトリを dirs に合わせます。不要になったウォッチは先に外します。
+        """
+        dirs = set(dirs)
+        for path in [p for p in self._wd_by_path if p not in dirs]:
+            wd = self._wd_by_path.pop(path)
+            self._path_by_wd.pop(wd, None)
+            # 削除されたディレクトリのウォッチはカーネルが外しているので、失敗は無視する
+            self._libc.inotify_rm_watch(self._fd, wd)
+        for path in dirs:
+            if path in self._wd_by_path:
+                continue
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK)
+            if wd < 0:
+                e = ctypes.get_errno()
+                if e in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+                raise OSError(e, f"Cannot watch {path}: {os.strerror(e)}")
+            # 移動されたディレクトリは同じ wd が返るので、古いパスの対応を置き換える
+            old = self._path_by_wd.get(wd)
+            if old is not None:
+                self._wd_by_path.pop(old, None)
+            self._wd_by_path[path] = wd
+            self._path_by_wd[wd] = path
+
+    def wait(self, timeout):
+        """
+        最大 timeout 秒待ち、届いたイベントを (種類, パス) のリストで返します。
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        events = []
+        while True:
+            try:
+                data = os.read(self._fd, _READ_SIZE)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, pos)
+                pos += _EVENT.size
+                name = os.fsdecode(data[pos:pos + length].rstrip(b'\0'))
+                pos += length
+                if mask & IN_Q_OVERFLOW:
+                    events.append((RESCAN, None))
+                    continue
+                if mask & IN_IGNORED:
+                    continue
+                directory = self._path_by_wd.get(wd)
+                if directory is None:
+                    continue
+                path = os.path.join(directory, name) if name else directory
+                events.append((STRUCTURAL if mask & _STRUCTURAL_MASK else MODIFIED, path))
+            if len(data) < _READ_SIZE:
+                break
+        return events
+
+
+class PollingWatcher:
+    """
+    inotify が使えない環境向けに、監視対象のディレクトリを一定間隔で os.scandir し、変更を検出します。
+    """
+
+    def __init__(self, interval=DEFAULT_POLL_INTERVAL):
+        self.interval = interval
+        # ディレクトリのパス -> {エントリのパス: (ディレクトリか, サイズ, 更新時刻, inode)}
+        self._snapshots = {}
+
+    @property
+    def watched(self):
+        return set(self._snapshots)
+
+    def close(self):
+        self._snapshots = {}
+
+    def sync(self, dirs):
+        dirs = set(dirs)
+        for path in [p for p in self._snapshots if p not in dirs]:
+            del self._snapshots[path]
+        for path in dirs:
+            if path not in self._snapshots:
+                self._snapshots[path] = self._scan(path)
+
+    def _scan(self, path):
+        snapshot = {}
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    # ディレクトリの中身の変更はそのディレクトリ自身の走査で検出する
+                    snapshot[entry.path] = (is_dir, 0, 0, st.st_ino) if is_dir else \
+                        (False, st.st_size, st.st_mtime_ns, st.st_ino)
+        except OSError:
+            return None
+        return snapshot
+
+    def wait(self, timeout):
+        time.sleep(min(self.interval, timeout) if timeout is not None else self.interval)
+        events = []
+        for path, old in list(self._snapshots.items()):
+            new = self._scan(path)
+            if new == old:
+                continue
+            self._snapshots[path] = new
+            if new is None or old is None:
+                events.append((STRUCTURAL, path))
+                continue
+            for entry_path in old.keys() - new.keys():
+                events.append((STRUCTURAL, entry_path))
+            for entry_path, signature in new.items():
+                previous = old.get(entry_path)
+                if previous is None or previous[0] != signature[0] or previous[3] != signature[3]:
+                    events.append((STRUCTURAL, entry_path))
+                elif previous != signature:
+                    events.append((MODIFIED, entry_path))
+        return events
+
+
+def create_watcher(poll_interval=DEFAULT_POLL_INTERVAL):
+    """
+    inotify のウォッチャーを作成します。使えない場合はポーリングのウォッチャーを返します。
+    """
+    try:
+        return InotifyWatcher()
+    except OSError as e:
+        logger.info(f"inotify is not available ({e}); falling back to polling.")
+        return PollingWatcher(poll_interval)
+
+
+def _render(file, body):
+    """ファイル1件分の出力 (見出しと本文) をバイト列で返します。"""
+    header = render_header(file).encode('utf-8')
+    if isinstance(body, Passthrough):
+        with body.file:
+            return header + body.file.read(body.size) + body.suffix.encode('utf-8')
+    return header + body.encode('utf-8')
+
+
+class WatchSession:
+    """
+    ファイルごとにレンダリングした出力 (チャンク) を保持し、変更されたファイルだけを
+    レンダリングし直して出力ファイルを書き換えます。
+
+    Args:
+        output (str): 出力先のパス。一時ファイルに書き込んでから置き換えます。
+        walk (callable): on_dir コールバックを受け取り、ファイルパスを返すイテラブルを作る関数。
+        jobs (int, optional): 読み込みに使うスレッド数。デフォルトは 1。
+        loader (callable, optional): ファイルを読み込む関数。デフォルトは load_file。
+    """
+
+    def __init__(self, output, walk, jobs=1, loader=load_file):
+        self.output = output
+        self.walk = walk
+        self.jobs = jobs
+        self.loader = loader
+        self.files = []
+        self.dirs = []
+        self.chunks = {}
+        self._tmp_path = f"{output}.{os.getpid()}.tmp"
+        self._own_paths = {os.path.abspath(output), os.path.abspath(self._tmp_path)}
+
+    def is_own_path(self, path):
+        """出力ファイル自身 (とその一時ファイル) へのイベントかどうかを返します。"""
+        return path is not None and os.path.abspath(path) in self._own_paths
+
+    def build(self):
+        """
+        ファイルリストを作り、すべてのファイルをレンダリングして出力します。
+        """
+        self._relist()
+        self.chunks = {}
+        self._render_files(self.files)
+        self.write()
+        return len(self.files)
+
+    def refresh(self, modified=(), structural=False):
+        """
+        変更を出力へ反映します。
+
+        Args:
+            modified (iterable): 内容が変わったファイルのパス。
+            structural (bool, optional): ファイルリストを作り直すかどうか。
+
+        Returns:
+            int: レンダリングし直したファイル数。
+        """
+        targets = [file for file in modified if file in self.chunks]
+        if structural:
+            self._relist()
+            listed = set(self.files)
+            for file in [f for f in self.chunks if f not in listed]:
+                del self.chunks[file]
+            known = set(targets)
+            targets += [file for file in self.files if file not in self.chunks and file not in known]
+        self._render_files(targets)
+        self.write()
+        return len(targets)
+
+    def _relist(self):
+        dirs = []
+        # 出力先が対象ディレクトリの中にある場合も、出力ファイル自身は含めない
+        self.files = [file for file in self.walk(dirs.append) if not self.is_own_path(file)]
+        self.dirs = dirs
+
+    def _render_files(self, files):
+        for file, body in iter_loaded(files, self.jobs, loader=self.loader):
+            if body is None:
+                logger.warning(f"File does not exist: {file}")
+                self.chunks.pop(file, None)
+                continue
+            logger.info(f"Rendered: {file}")
+            self.chunks[file] = _render(file, body)
+
+    def write(self):
+        """
+        保持しているチャンクを files の順に一時ファイルへ書き込み、出力先と置き換えます。
+        """
+        with open(self._tmp_path, 'wb') as f:
+            writer = StreamWriter(f)
+            writer.write(SECTION_RULE)
+            for file in self.files:
+                chunk = self.chunks.get(file)
+                if chunk is not None:
+                    writer.write_bytes(chunk)
+            writer.write("\n" + SECTION_RULE)
+            writer.flush()
+        os.replace(self._tmp_path, self.output)
+
+
+def _collect(watcher, session, timeout, debounce):
+    """
+    最初のイベントを待ち、その後 debounce 秒イベントが途切れるまでまとめて集めます。
+    """
+    events = watcher.wait(timeout)
+    if not events:
+        return []
+    while True:
+        more = watcher.wait(debounce)
+        if not more:
+            break
+        events.extend(more)
+    return [(kind, path) for kind, path in events if not session.is_own_path(path)]
+
+
+def watch(output, walk, jobs=1, loader=load_file, debounce=DEFAULT_DEBOUNCE,
+          poll_interval=DEFAULT_POLL_INTERVAL, watcher=None, stop=None):
+    """
+    出力を作成した後、変更を監視して出力を更新し続けます。
+
+    走査で降りたディレクトリだけを監視するため、-I などで除外したディレクトリ
+    (node_modules など) はウォッチを消費しません。
+
+    Args:
+        output (str): 出力先のパス。
+        walk (callable): on_dir コールバックを受け取り、ファイルパスを返すイテラブルを作る関数。
+        jobs (int, optional): 読み込みに使うスレッド数。デフォルトは 1。
+        loader (callable, optional): ファイルを読み込む関数。デフォルトは load_file。
+        debounce (float, optional): 最後の変更から出力を更新するまでの待ち時間 (秒)。
+        poll_interval (float, optional): ポーリングする場合の走査間隔 (秒)。
+        watcher (optional): 使用するウォッチャー。デフォルトは create_watcher の結果。
+        stop (threading.Event, optional): セットされると監視を終了します。デフォルトは None (終了しない)。
+    """
+    session = WatchSession(output, walk, jobs, loader)
+    count = session.build()
+    logger.info(f"Wrote {count} files to {output}; watching for changes.")
+
+    if watcher is None:
+        watcher = create_watcher(poll_interval)
+    try:
+        while stop is None or not stop.is_set():
+            try:
+                watcher.sync(session.dirs)
+            except OSError as e:
+                # ウォッチ数の上限 (fs.inotify.max_user_watches) などに達した場合
+                logger.warning(f"{e}; falling back to polling.")
+                watcher.close()
+                watcher = PollingWatcher(poll_interval)
+                watcher.sync(session.dirs)
+
+            events = _collect(watcher, session, 0.5, debounce)
+            if not events:
+                continue
+            kinds = {kind for kind, _ in events}
+            modified = {path for kind, path in events if kind == MODIFIED}
+            if RESCAN in kinds:
+                session.build()
+                logger.info(f"Rebuilt {output} after missed events.")
+                continue
+            structural = STRUCTURAL in kinds or any(
+                os.path.basename(path) == '.gitignore' for path in modified)
+            updated = session.refresh(modified, structural)
+            logger.info(f"Updated {output}: {updated} file(s) re-rendered.")
+    finally:
+        watcher.close()
@@ -1 +1,10 @@
 # ./tests/__init__.py
+
+import os
+import atexit
+import shutil
+import tempfile
+
+# CLI のテストがユーザーのキャッシュディレクトリ (~/.cache/codeaggregator) に書き込まないよう、一時ディレクトリを使う
+os.environ['XDG_CACHE_HOME'] = tempfile.mkdtemp(prefix='codeaggregator-test-cache-')
+atexit.register(shutil.rmtree, os.environ['XDG_CACHE_HOME'], True)
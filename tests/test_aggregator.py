@@ -0,0 +1,117 @@
+# ./tests/test_aggregator.py
+
+import unittest
+import os
+import io
+from codeaggregator.aggregator import Aggregator, FileRecord
+from codeaggregator.cache import MemoryCache
+from codeaggregator.finder import iter_files
+from codeaggregator.classify import FileClassifier
+from codeaggregator.output import output_files, render_header
+
+class TestAggregator(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時ディレクトリを作成
+        self.test_dir = 'test_env_aggregator'
+        for d in ['one/pkg', 'two']:
+            os.makedirs(os.path.join(self.test_dir, d), exist_ok=True)
+        self.write('one/a.py', 'print("a")\n')
+        self.write('one/pkg/b.py', 'print("b")\n')
+        self.write('one/notes.txt', 'notes\n')
+        self.write('two/c.py', 'print("c")\n')
+        with open(self.path('one/image.py'), 'wb') as f:
+            f.write(b'\x89PNG\r\n\x1a\n' + bytes(64))
+        # 直前に更新されたファイルはキャッシュされないため、更新時刻を過去にする
+        for root, dirs, files in os.walk(self.test_dir):
+            for name in files:
+                os.utime(os.path.join(root, name), (1000000000, 1000000000))
+
+    def tearDown(self):
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+
+    def write(self, rel, content):
+        with open(self.path(rel), 'w') as f:
+            f.write(content)
+
+    def path(self, rel):
+        return os.path.join(self.test_dir, rel)
+
+    def test01_render_matches_output_files(self):
+        """
+        render の出力が output_files と一致し、FileRecord の範囲が各ファイルの見出しから始まることを確認します。
+        """
+        aggregator = Aggregator(patterns=['*.py'])
+        buf = io.BytesIO()
+        result = aggregator.render(self.path('one'), buf)
+
+        files = list(iter_files(self.path('one'), patterns=['*.py']))
+        expected = io.BytesIO()
+        output_files(files, expected, loader=FileClassifier().wrap())
+        data = buf.getvalue()
+        self.assertEqual(data, expected.getvalue())
+
+        self.assertEqual([r.path for r in result.records], [os.path.relpath(f, self.path('one')) for f in files])
+        statuses = {r.path: r.status for r in result.records}
+        self.assertEqual(statuses, {'a.py': 'included', 'image.py': 'binary', os.path.join('pkg', 'b.py'): 'included'})
+        for record in result.records:
+            header = render_header(self.path(os.path.join('one', record.path))).encode('utf-8')
+            self.assertTrue(data[record.offset:record.offset + record.length].startswith(header))
+        record = next(r for r in result.records if r.path == 'a.py')
+        self.assertEqual((record.size, record.mtime), (11, 1000000000))
+
+    def test02_reused_across_roots_and_calls(self):
+        """
+        1つの Aggregator を複数のディレクトリに使い回せ、MemoryCache で2回目の読み込みを省くことを確認します。
+        """
+        cache = MemoryCache()
+        aggregator = Aggregator(patterns=['*.py'], cache=cache)
+        matchers = aggregator.matchers
+
+        first = aggregator.render(self.path('one'), io.BytesIO())
+        # バイナリファイルは判定だけで読み込まない
+        self.assertEqual(cache.misses, 2)
+        second = aggregator.render(self.path('two'), io.BytesIO())
+        self.assertEqual([r.path for r in second.records], ['c.py'])
+        again = aggregator.render(self.path('one'), io.BytesIO())
+        self.assertEqual((cache.hits, cache.misses), (2, 0))
+        self.assertEqual([r.path for r in again.records], [r.path for r in first.records])
+        self.assertIs(aggregator.matchers, matchers)
+
+    def test03_iter_records_and_statuses(self):
+        """
+        iter_records がファイルごとに FileRecord を返し、存在しないファイルと予算による省略も記録することを確認します。
+        """
+        list_path = self.path('list.txt')
+        self.write('list.txt', 'one/a.py\none/missing.py\none/notes.txt\n')
+        aggregator = Aggregator(ignore_patterns=['*.txt'])
+        buf = io.BytesIO()
+        records = aggregator.iter_records(self.test_dir, buf, fromfile=list_path)
+
+        first = next(records)
+        self.assertEqual((first.path, first.status), (os.path.join('one', 'a.py'), 'included'))
+        missing = next(records)
+        self.assertEqual((missing.status, missing.size, missing.offset), ('missing', None, None))
+        self.assertEqual(list(records), [])
+        # 最後まで反復すると出力先へ書き出される
+        self.assertIn(b'print("a")', buf.getvalue()[first.offset:first.offset + first.length])
+
+        budgeted = Aggregator(patterns=['*.py'], max_tokens=20).render(self.path('one'), io.BytesIO())
+        self.assertIn('omitted', [r.status for r in budgeted.records])
+
+    def test04_file_record_is_compact(self):
+        """
+        FileRecord が __slots__ を使い、インスタンスごとの辞書を持たないことを確認します。
+        """
+        record = FileRecord('a.py', 1, 0.0, 'included', 0, 10)
+        self.assertFalse(hasattr(record, '__dict__'))
+        with self.assertRaises(AttributeError):
+            record.extra = 1
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+# ./tests/test_archive.py
+
+import unittest
+import io
+import os
+import sys
+import tarfile
+import zipfile
+from unittest.mock import patch
+from codeaggregator.archive import ArchiveSource, is_archive, iter_tar_members
+from codeaggregator.classify import FileClassifier, SkippedBody, BINARY, OVERSIZED, SNIFF_SIZE
+from codeaggregator.output import output_files
+from codeaggregator.tokens import TokenBudget
+from codeaggregator.cli import main
+
+MEMBERS = [
+    ('pkg/main.py', b'print("main")\n'),
+    ('pkg/.hidden.py', b'hidden\n'),
+    ('pkg/node_modules/lib.js', b'lib\n'),
+    ('pkg/data.bin', b'\x00\x01\x02'),
+    ('pkg/crlf.txt', b'a\r\nb\r\n'),
+    ('pkg/z_last.py', b'last\n'),
+]
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時ディレクトリを作成
+        self.test_dir = 'test_env_archive'
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.archives = {}
+        for name, mode in (('src.tar', 'w'), ('src.tar.gz', 'w:gz'), ('src.tar.xz', 'w:xz')):
+            path = os.path.join(self.test_dir, name)
+            with tarfile.open(path, mode) as tar:
+                info = tarfile.TarInfo('./pkg')
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+                for member, data in MEMBERS:
+                    info = tarfile.TarInfo('./' + member)
+                    info.size = len(data)
+                    tar.addfile(info, io.BytesIO(data))
+            self.archives[name] = path
+        path = os.path.join(self.test_dir, 'src.zip')
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('pkg/', b'')
+            for member, data in MEMBERS:
+                zf.writestr(member, data)
+        self.archives['src.zip'] = path
+
+    def tearDown(self):
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+
+    def test01_is_archive(self):
+        """
+        拡張子と、ファイルが存在するかどうかでアーカイブを判定することを確認します。
+        """
+        self.assertTrue(is_archive(self.archives['src.tar.gz']))
+        self.assertTrue(is_archive(self.archives['src.zip']))
+        self.assertFalse(is_archive(self.test_dir))
+        self.assertFalse(is_archive(os.path.join(self.test_dir, 'missing.tar')))
+
+    def test02_filter_and_order(self):
+        """
+        どの形式でも、ディレクトリと同じ規則で絞り込んだメンバーがアーカイブ内の順に返ることを確認します。
+        """
+        for name, path in self.archives.items():
+            with self.subTest(archive=name):
+                source = ArchiveSource(path, FileClassifier())
+                files = list(source.iter_files(ignore_patterns=['node_modules']))
+                base = os.path.join(path, 'pkg', '')
+                self.assertEqual(files, [base + 'main.py', base + 'data.bin', base + 'crlf.txt', base + 'z_last.py'])
+                self.assertEqual(source.load(base + 'main.py'), 'print("main")\n\n')
+                self.assertEqual(source.load(base + 'crlf.txt'), 'a\nb\n\n')
+                body = source.load(base + 'data.bin')
+                self.assertIsInstance(body, SkippedBody)
+                self.assertEqual(body.reason, BINARY)
+                # 一度 load したメンバーの内容は保持しない
+                self.assertIsNone(source.load(base + 'main.py'))
+
+                files = list(ArchiveSource(path).iter_files(patterns=['*.py'], include_hidden=True))
+                self.assertEqual(files, [base + 'main.py', base + '.hidden.py', base + 'z_last.py'])
+
+    def test03_oversized_members_are_not_read(self):
+        """
+        大きすぎるメンバーは内容を読み込まずに省略することを確認します。
+        """
+        path = self.archives['src.tar.gz']
+        reads = []
+
+        def members(path):
+            for name, size, read in iter_tar_members(path):
+                def counted(size=-1, read=read, name=name):
+                    if name not in reads:
+                        reads.append(name)
+                    return read(size)
+                yield name, size, counted
+
+        with patch('codeaggregator.archive.iter_members', members):
+            source = ArchiveSource(path, FileClassifier(max_file_size=5))
+            files = list(source.iter_files())
+        self.assertEqual(reads, ['pkg/node_modules/lib.js', 'pkg/data.bin', 'pkg/z_last.py'])
+        body = source.load(files[0])
+        self.assertEqual(body.reason, OVERSIZED)
+
+    def test04_output_and_cli(self):
+        """
+        出力形式がディレクトリの場合と同じで、CLI からアーカイブを指定できることを確認します。
+        """
+        path = self.archives['src.tar.xz']
+        source = ArchiveSource(path, FileClassifier())
+        buffer = io.StringIO()
+        output_files(source.iter_files(patterns=['*.py']), buffer, loader=source.load)
+        file = os.path.join(path, 'pkg', 'main.py')
+        self.assertIn(f"{'#' * 34}\n{file}\n{'#' * 34}\n\nprint(\"main\")\n\n", buffer.getvalue())
+        self.assertTrue(buffer.getvalue().startswith('=' * 17))
+
+        output = os.path.join(self.test_dir, 'out.txt')
+        with patch.object(sys, 'argv', ['codeaggregator', path, '-P', '*.py', '-o', output, '-j', '4']):
+            main()
+        with open(output, encoding='utf-8') as f:
+            self.assertEqual(f.read(), buffer.getvalue())
+        self.assertFalse(os.path.exists(os.path.join(path, '.codeaggregator')))
+
+    def test05_corrupt_archive(self):
+        """
+        途中で壊れたアーカイブは、それまでのメンバーを出力して error を記録することを確認します。
+        """
+        path = self.archives['src.tar']
+        with open(path, 'rb') as f:
+            data = f.read()
+        broken = os.path.join(self.test_dir, 'broken.tar')
+        with open(broken, 'wb') as f:
+            f.write(data[:3300])
+        source = ArchiveSource(broken)
+        files = list(source.iter_files())
+        self.assertIsNotNone(source.error)
+        self.assertIn(os.path.join(broken, 'pkg', 'main.py'), files)
+
+    def test06_binary_prefix_and_budget(self):
+        """
+        バイナリのメンバーは先頭部分だけを読み、予算を使い切った後のメンバーは読み込まずに保持もしないことを確認します。
+        """
+        path = os.path.join(self.test_dir, 'large.zip')
+        with zipfile.ZipFile(path, 'w') as zf:
+            zf.writestr('image.png', b'\x89PNG\r\n\x1a\n' + b'x' * (SNIFF_SIZE * 4))
+            for i in range(5):
+                zf.writestr(f'm{i}.py', f'value = {i}\n' * 200)
+        sizes = []
+
+        def members(path):
+            from codeaggregator.archive import iter_zip_members
+            for name, size, read in iter_zip_members(path):
+                def counted(size=-1, read=read):
+                    data = read(size)
+                    sizes.append(len(data))
+                    return data
+                yield name, size, counted
+
+        with patch('codeaggregator.archive.iter_members', members):
+            source = ArchiveSource(path, FileClassifier())
+            files = list(source.iter_files(patterns=['*.png']))
+            self.assertEqual(sizes, [SNIFF_SIZE])
+            self.assertEqual(source.load(files[0]).reason, BINARY)
+
+            budget = TokenBudget(300, 'stop')
+            source = ArchiveSource(path, FileClassifier(), budget=budget)
+            buffer = io.StringIO()
+            output_files(source.iter_files(patterns=['*.py']), buffer, loader=source.load, budget=budget)
+        self.assertTrue(budget.stopped)
+        self.assertTrue(budget.omitted)
+        self.assertEqual(source._pending, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+# ./tests/test_cache.py
+
+import unittest
+import os
+import io
+import time
+import sys
+from unittest.mock import patch
+from codeaggregator.cache import AggregateCache, CACHE_DIR_NAME, list_key, cache_dir
+from codeaggregator.aggregator import Aggregator
+from codeaggregator.cli import main
+from codeaggregator.finder import iter_files
+from codeaggregator.output import output_files
+from codeaggregator.classify import FileClassifier, SkippedBody
+
+class TestAggregateCache(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時ディレクトリを作成
+        self.test_dir = 'test_env_cache'
+        os.makedirs(os.path.join(self.test_dir, 'src'), exist_ok=True)
+        self.cache_dir = os.path.join(self.test_dir, CACHE_DIR_NAME)
+
+        for name in ['file1.py', 'file2.py']:
+            self.write(os.path.join('src', name), f'print("{name}")\n')
+        self.age_tree()
+
+    def tearDown(self):
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+
+    def write(self, rel, content):
+        with open(os.path.join(self.test_dir, rel), 'w') as f:
+            f.write(content)
+
+    def age_tree(self, *rels):
+        # 直前に変更されたファイルはキャッシュされないため、更新時刻を過去にずらす
+        past = time.time() - 3600
+        for rel in rels or ('src/file1.py', 'src/file2.py', 'src', '.'):
+            os.utime(os.path.join(self.test_dir, rel), (past, past))
+
+    def run_once(self):
+        cache = AggregateCache(self.cache_dir)
+        key = list_key(self.test_dir)
+        files = cache.iter_files(key, lambda on_dir: iter_files(self.test_dir, on_dir=on_dir))
+        buf = io.BytesIO()
+        output_files(files, buf, cache=cache)
+        cache.save()
+        return cache, buf.getvalue()
+
+    def test01_second_run_uses_cached_chunks(self):
+        """
+        2回目の実行では、変更のないファイルをキャッシュから出力し、内容が一致することを確認します。
+        """
+        first_cache, first = self.run_once()
+        self.assertEqual((first_cache.hits, first_cache.misses), (0, 2))
+        second_cache, second = self.run_once()
+        self.assertEqual((second_cache.hits, second_cache.misses), (2, 0))
+        self.assertEqual(first, second)
+
+    def test02_changed_and_new_files_are_reread(self):
+        """
+        変更されたファイルと新しく追加されたファイルだけが読み直されることを確認します。
+        """
+        self.run_once()
+        self.write(os.path.join('src', 'file1.py'), 'print("changed file")\n')
+        self.write(os.path.join('src', 'file3.py'), 'print("new")\n')
+        self.age_tree('src/file1.py', 'src/file3.py', 'src')
+
+        cache, output = self.run_once()
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        self.assertIn(b'print("changed file")', output)
+        self.assertIn(b'print("new")', output)
+
+    def test03_eviction_and_clear(self):
+        """
+        上限を超えたチャンクが削除され、clear でキャッシュが空になることを確認します。
+        """
+        self.run_once()
+        cache = AggregateCache(self.cache_dir, max_bytes=1)
+        cache.save()
+        self.assertEqual(cache._index['files'], {})
+
+        cache.clear()
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test04_binary_verdicts_are_cached(self):
+        """
+        2回目の実行では、変更のないファイルの先頭部分を読まずに前回のバイナリの判定を使うことを確認します。
+        """
+        with open(os.path.join(self.test_dir, 'src', 'data.bin'), 'wb') as f:
+            f.write(b'abc\x00def')
+        self.age_tree('src/data.bin', 'src/file1.py', 'src/file2.py')
+        files = sorted(iter_files(self.test_dir))
+
+        sniffed = []
+
+        class CountingClassifier(FileClassifier):
+            @staticmethod
+            def _sniff(file, size):
+                sniffed.append(file)
+                return FileClassifier._sniff(file, size)
+
+        classifier = CountingClassifier()
+        for expected in (3, 0):
+            cache = AggregateCache(self.cache_dir)
+            load = classifier.wrap(cache=cache)
+            bodies = [load(file) for file in files]
+            cache.save()
+            self.assertEqual(len(sniffed), expected)
+            self.assertIsInstance(bodies[0], SkippedBody)
+            sniffed.clear()
+
+    def test05_cache_dir_outside_the_tree(self):
+        """
+        CLI のキャッシュは検索対象のディレクトリの外 ($XDG_CACHE_HOME) に作成され、
+        以前のバージョンのキャッシュディレクトリは -a 指定時も出力に含まれないことを確認します。
+        """
+        path = cache_dir(self.test_dir)
+        self.assertTrue(path.startswith(os.path.join(os.environ['XDG_CACHE_HOME'], 'codeaggregator', '')))
+        self.assertEqual(path, cache_dir(os.path.abspath(self.test_dir)))
+        self.assertNotEqual(path, cache_dir(os.path.join(self.test_dir, 'src')))
+
+        os.makedirs(self.cache_dir)
+        self.write(os.path.join(CACHE_DIR_NAME, 'index.json'), '{}')
+        output = os.path.join(self.test_dir, 'src', 'out.txt')
+        try:
+            with patch.object(sys, 'argv', ['codeaggregator', os.path.join(self.test_dir, 'src'), '-o', output,
+                                            '--no-daemon']):
+                main()
+            self.assertTrue(os.path.isdir(cache_dir(os.path.join(self.test_dir, 'src'))))
+            self.assertFalse(os.path.exists(os.path.join(self.test_dir, 'src', CACHE_DIR_NAME)))
+        finally:
+            os.remove(output)
+        files = Aggregator(include_hidden=True).select(self.test_dir)[0]
+        self.assertEqual(sorted(os.path.relpath(f, self.test_dir) for f in files),
+                         [os.path.join('src', 'file1.py'), os.path.join('src', 'file2.py')])
+
+if __name__ == '__main__':
+    unittest.main()
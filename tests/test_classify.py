@@ -0,0 +1,90 @@
+# ./tests/test_classify.py
+
+import unittest
+import os
+from codeaggregator.classify import FileClassifier, SkippedBody, is_binary, SNIFF_SIZE, BINARY, OVERSIZED
+
+class TestClassify(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時ディレクトリを作成
+        self.test_dir = 'test_env_classify'
+        os.makedirs(self.test_dir, exist_ok=True)
+
+        files = {
+            'main.py': b'print("main")',
+            'utf8.txt': 'あいうえお'.encode('utf-8') * 2000,
+            'nul.bin': b'abc\x00def',
+            'image.png': b'\x89PNG\r\n\x1a\n' + b'x' * 100,
+            'latin1.txt': 'caf\xe9'.encode('latin-1'),
+            'large.log': b'line\n' * 1000,
+            'empty.txt': b'',
+        }
+        for rel, content in files.items():
+            with open(os.path.join(self.test_dir, rel), 'wb') as f:
+                f.write(content)
+
+    def tearDown(self):
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+
+    def path(self, name):
+        return os.path.join(self.test_dir, name)
+
+    def test01_is_binary(self):
+        """
+        NUL バイト、既知の形式の先頭、不正な UTF-8 をバイナリと判定し、
+        先頭部分の末尾で途切れた複数バイト文字はテキストと判定することを確認します。
+        """
+        self.assertTrue(is_binary(b'abc\x00'))
+        self.assertTrue(is_binary(b'%PDF-1.7\n'))
+        self.assertTrue(is_binary(b'caf\xe9 au lait'))
+        self.assertTrue(is_binary(b'caf\xe9', complete=True))
+        self.assertFalse(is_binary('あいう'.encode('utf-8')[:-1]))
+        self.assertFalse(is_binary(b'PACKAGE = "x"\n'))
+
+    def test02_classify(self):
+        """
+        サイズの上限とバイナリの判定結果を確認します。
+        """
+        classifier = FileClassifier(max_file_size=4096)
+        self.assertEqual(classifier.classify(self.path('main.py')), (None, 13))
+        self.assertEqual(classifier.classify(self.path('nul.bin'))[0], BINARY)
+        self.assertEqual(classifier.classify(self.path('image.png'))[0], BINARY)
+        self.assertEqual(classifier.classify(self.path('latin1.txt'))[0], BINARY)
+        self.assertEqual(classifier.classify(self.path('large.log')), (OVERSIZED, 5000))
+        self.assertEqual(classifier.classify(self.path('empty.txt')), (None, 0))
+        self.assertEqual(classifier.classify(self.path('missing.txt')), (None, None))
+        # 先頭部分より大きい UTF-8 のファイルは、先頭だけでテキストと判定する
+        self.assertGreater(os.path.getsize(self.path('utf8.txt')), SNIFF_SIZE)
+        self.assertEqual(FileClassifier().classify(self.path('utf8.txt'))[0], None)
+
+    def test03_wrapped_loader(self):
+        """
+        省略したファイルは理由を示す本文になり、それ以外は元の loader で読み込まれることを確認します。
+        """
+        read = []
+
+        def loader(file):
+            read.append(file)
+            return 'content\n'
+
+        load = FileClassifier(max_file_size=4096).wrap(loader)
+        body = load(self.path('nul.bin'))
+        self.assertIsInstance(body, SkippedBody)
+        self.assertEqual(body.reason, BINARY)
+        self.assertEqual(body, '(binary file omitted: 7 bytes)\n')
+        self.assertEqual(load(self.path('large.log')).reason, OVERSIZED)
+        self.assertEqual(load(self.path('main.py')), 'content\n')
+        self.assertEqual(read, [self.path('main.py')])
+
+        # --include-binary 指定時はバイナリも読み込む
+        load = FileClassifier(include_binary=True).wrap(loader)
+        self.assertEqual(load(self.path('nul.bin')), 'content\n')
+
+if __name__ == '__main__':
+    unittest.main()
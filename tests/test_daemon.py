@@ -0,0 +1,138 @@
+# ./tests/test_daemon.py
+
+import unittest
+import io
+import os
+import time
+import threading
+from codeaggregator.daemon import AggregatorServer
+from codeaggregator.client import daemon_request, daemon_available
+from codeaggregator.cache import MemoryCache
+from codeaggregator.output import output_files
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時ディレクトリを作成
+        self.test_dir = os.path.abspath('test_env_daemon')
+        self.src = os.path.join(self.test_dir, 'src')
+        os.makedirs(os.path.join(self.src, 'pkg'), exist_ok=True)
+        self.files = {
+            'a.py': 'print("a")\n',
+            'b.txt': 'こんにちは\n',
+            os.path.join('pkg', 'c.py'): 'print("c")\n',
+        }
+        for rel, content in self.files.items():
+            with open(os.path.join(self.src, rel), 'w', encoding='utf-8') as f:
+                f.write(content)
+        # 直前に更新されたファイルはキャッシュされないため、更新時刻を過去にする
+        self.set_past_mtime(1000000000)
+
+        self.socket = os.path.join(self.test_dir, 'daemon.sock')
+        self.server = AggregatorServer(self.socket)
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+
+    def set_past_mtime(self, seconds):
+        for root, dirs, files in os.walk(self.src):
+            for name in files + dirs + ['']:
+                os.utime(os.path.join(root, name), (seconds, seconds))
+
+    def request(self, *argv):
+        stdout, stderr = io.BytesIO(), io.BytesIO()
+        status = daemon_request(list(argv), self.socket, stdout, stderr, cwd=self.test_dir)
+        return status, stdout.getvalue().decode('utf-8'), stderr.getvalue().decode('utf-8')
+
+    def test01_output_matches_local_run(self):
+        """
+        常駐プロセスの出力が、このプロセスで出力した場合と一致することを確認します。
+        """
+        self.assertTrue(daemon_available(self.socket))
+        status, stdout, _ = self.request('src', '-P', '*.py')
+        self.assertEqual(status, 0)
+        expected = io.StringIO()
+        cwd = os.getcwd()
+        os.chdir(self.test_dir)
+        try:
+            output_files([os.path.join('src', 'a.py'), os.path.join('src', 'pkg', 'c.py')], expected)
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(stdout, expected.getvalue() + "\n")
+        # ディレクトリ内にキャッシュを作成しない
+        self.assertFalse(os.path.exists(os.path.join(self.src, '.codeaggregator-cache')))
+
+    def test02_warm_requests_and_invalidation(self):
+        """
+        2回目はメモリに保持した本文を使い、変更したファイルだけを読み直すことを確認します。
+        """
+        _, first, _ = self.request('src')
+        self.assertEqual(self.server.cache.misses, 3)
+        _, second, _ = self.request('src')
+        self.assertEqual(second, first)
+        self.assertEqual((self.server.cache.hits, self.server.cache.misses), (3, 0))
+
+        with open(os.path.join(self.src, 'a.py'), 'w', encoding='utf-8') as f:
+            f.write('print("changed")\n')
+        with open(os.path.join(self.src, 'pkg', 'd.py'), 'w', encoding='utf-8') as f:
+            f.write('print("d")\n')
+        self.set_past_mtime(1000000100)
+        _, third, _ = self.request('src')
+        self.assertIn('print("changed")', third)
+        self.assertIn(os.path.join('src', 'pkg', 'd.py'), third)
+        self.assertNotIn('print("a")', third)
+
+        # --rebuild-cache はメモリに保持した内容も破棄する
+        _, rebuilt, _ = self.request('src', '--rebuild-cache')
+        self.assertEqual(rebuilt, third)
+        self.assertEqual((self.server.cache.hits, self.server.cache.misses), (0, 4))
+
+    def test03_errors_and_output_file(self):
+        """
+        引数の誤りは終了ステータスと標準エラー出力で返り、-o は依頼元のディレクトリを基準にすることを確認します。
+        """
+        status, stdout, stderr = self.request('src', '--head-lines', '-1')
+        self.assertEqual(status, 2)
+        self.assertEqual(stdout, '')
+        self.assertIn('--head-lines', stderr)
+
+        status, stdout, _ = self.request('src', '-o', 'out.txt')
+        self.assertEqual((status, stdout), (0, ''))
+        with open(os.path.join(self.test_dir, 'out.txt'), encoding='utf-8') as f:
+            self.assertIn('こんにちは', f.read())
+
+    def test04_no_server_or_local_only(self):
+        """
+        常駐プロセスが起動していない場合と、標準入力を使う引数の場合は None を返すことを確認します。
+        """
+        self.assertEqual(self.request('src', '--fromfile'), (None, '', ''))
+        missing = os.path.join(self.test_dir, 'missing.sock')
+        self.assertFalse(daemon_available(missing))
+        self.assertIsNone(daemon_request(['src'], missing, io.BytesIO(), io.BytesIO()))
+
+    def test05_memory_cache_is_lru_bounded(self):
+        """
+        メモリに保持する本文の合計が上限を超えると、古いものから削除されることを確認します。
+        """
+        cache = MemoryCache(max_bytes=30)
+        cache._racy_after_ns = time.time_ns()
+        for rel in ('a.py', 'b.txt', os.path.join('pkg', 'c.py')):
+            cache.load(os.path.join(self.src, rel))
+        self.assertLessEqual(cache._total, 30)
+        self.assertNotIn(os.path.join(self.src, 'a.py'), cache._chunks)
+        self.assertIn(os.path.join(self.src, 'pkg', 'c.py'), cache._chunks)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# ./tests/test_dedupe.py
+
+import unittest
+import os
+import io
+from unittest import mock
+from codeaggregator.output import output_files, PASSTHROUGH_MIN_SIZE
+from codeaggregator.dedupe import Deduper
+from codeaggregator.tokens import TokenBudget
+import codeaggregator.dedupe as dedupe_module
+
+class TestDedupe(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時ディレクトリを作成
+        self.test_dir = 'test_env_dedupe'
+        for d in ['a', 'b', 'c']:
+            os.makedirs(os.path.join(self.test_dir, d), exist_ok=True)
+
+        self.write('a/__init__.py', '# package\n')
+        self.write('b/__init__.py', '# package\n')
+        self.write('c/__init__.py', '# other\n')
+        big = 'vendored = True\n' * (PASSTHROUGH_MIN_SIZE // 16 + 1)
+        self.write('a/vendor.py', big)
+        self.write('b/vendor.py', big)
+        self.write('c/unique.py', 'x' * 5 + '\n')
+        os.link(os.path.join(self.test_dir, 'c/unique.py'), os.path.join(self.test_dir, 'c/hardlink.py'))
+
+    def tearDown(self):
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+
+    def write(self, rel, content):
+        with open(os.path.join(self.test_dir, rel), 'w') as f:
+            f.write(content)
+
+    def path(self, rel):
+        return os.path.join(self.test_dir, rel)
+
+    def test01_duplicates_replaced_by_reference(self):
+        """
+        同じ内容のファイル (大きなパススルー対象を含む) が参照行に置き換えられることを確認します。
+        """
+        files = [self.path(rel) for rel in ['a/__init__.py', 'b/__init__.py', 'c/__init__.py',
+                                            'a/vendor.py', 'b/vendor.py']]
+        dedupe = Deduper()
+        buf = io.BytesIO()
+        output_files(files, buf, dedupe=dedupe)
+        output = buf.getvalue().decode('utf-8')
+
+        self.assertEqual(dedupe.duplicates, 2)
+        self.assertIn(f"(duplicate of {self.path('a/__init__.py')})", output)
+        self.assertIn(f"(duplicate of {self.path('a/vendor.py')})", output)
+        self.assertEqual(output.count('vendored = True'), PASSTHROUGH_MIN_SIZE // 16 + 1)
+        self.assertIn('# other', output)
+
+    def test02_unique_files_are_not_hashed(self):
+        """
+        サイズと先頭が重ならないファイルはハッシュを計算しないことを確認します。
+        """
+        files = [self.path(rel) for rel in ['a/__init__.py', 'c/__init__.py', 'c/unique.py']]
+        with mock.patch.object(dedupe_module, '_digest', wraps=dedupe_module._digest) as digest:
+            output_files(files, io.BytesIO(), dedupe=Deduper())
+        digest.assert_not_called()
+
+    def test03_hard_links_by_inode(self):
+        """
+        ハードリンクはハッシュを計算せずに (st_dev, st_ino) で重複と判定されることを確認します。
+        """
+        dedupe = Deduper()
+        with mock.patch.object(dedupe_module, '_digest', wraps=dedupe_module._digest) as digest:
+            self.assertIsNone(dedupe.check(self.path('c/unique.py'), 'xxxxx\n\n'))
+            self.assertEqual(dedupe.check(self.path('c/hardlink.py'), 'xxxxx\n\n'), self.path('c/unique.py'))
+        digest.assert_not_called()
+
+    def test04_omitted_file_is_not_referenced(self):
+        """
+        予算により省略または切り詰めたファイルが、後の重複の参照先にならないことを確認します。
+        """
+        files = [self.path(rel) for rel in ['b/vendor.py', 'a/vendor.py', 'a/__init__.py', 'b/__init__.py']]
+        for mode in ['skip', 'truncate']:
+            with self.subTest(mode=mode):
+                dedupe = Deduper()
+                budget = TokenBudget(200, mode)
+                buf = io.BytesIO()
+                output_files(files, buf, budget=budget, dedupe=dedupe)
+                output = buf.getvalue().decode('utf-8')
+
+                self.assertNotIn(f"(duplicate of {self.path('b/vendor.py')})", output)
+                self.assertNotIn(self.path('a/vendor.py'), output)
+                if mode == 'skip':
+                    # 出力した __init__.py は引き続き参照先になる
+                    self.assertEqual(dedupe.duplicates, 1)
+                    self.assertIn(f"(duplicate of {self.path('a/__init__.py')})", output)
+                else:
+                    self.assertEqual([file for file, _ in budget.truncated], [self.path('b/vendor.py')])
+                    self.assertEqual(dedupe.duplicates, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+# ./tests/test_excerpt.py
+
+import unittest
+import io
+import os
+from codeaggregator.excerpt import Excerpter, BLOCK_SIZE
+
+class CountingReader(io.BytesIO):
+    """読み込んだバイト数を数えるファイルオブジェクトです。"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+class TestExcerpt(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時ディレクトリを作成
+        self.test_dir = 'test_env_excerpt'
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.lines = os.path.join(self.test_dir, 'lines.txt')
+        with open(self.lines, 'w') as f:
+            f.write(''.join(f'line{i}\n' for i in range(1, 1001)))
+        self.short = os.path.join(self.test_dir, 'short.txt')
+        with open(self.short, 'w') as f:
+            f.write('a\nb\n')
+
+    def tearDown(self):
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+
+    def test01_head_and_tail(self):
+        """
+        先頭/末尾の行と、省略したバイト数を示す行が出力されることを確認します。
+        """
+        size = os.path.getsize(self.lines)
+        body = Excerpter(head_lines=2).wrap()(self.lines)
+        self.assertEqual(body, f"line1\nline2\n... [{size - 12} bytes omitted] ...\n\n")
+        body = Excerpter(tail_lines=2).wrap()(self.lines)
+        self.assertEqual(body, f"... [{size - 17} bytes omitted] ...\nline999\nline1000\n\n")
+        body = Excerpter(head_lines=1, tail_lines=1).wrap()(self.lines)
+        self.assertEqual(body, f"line1\n... [{size - 15} bytes omitted] ...\nline1000\n\n")
+
+    def test02_whole_file_uses_loader(self):
+        """
+        残す範囲がファイル全体になる場合は元の loader で読み込むことを確認します。
+        """
+        load = Excerpter(head_lines=1, tail_lines=1).wrap(lambda file: 'original\n')
+        self.assertEqual(load(self.short), 'original\n')
+        load = Excerpter(max_bytes=100).wrap(lambda file: 'original\n')
+        self.assertEqual(load(self.short), 'original\n')
+
+    def test03_max_bytes(self):
+        """
+        バイト数の上限で行の境界に合わせて切り詰め、複数バイト文字を分割しないことを確認します。
+        """
+        body = Excerpter(max_bytes=14).wrap()(self.lines)
+        self.assertTrue(body.startswith("line1\nline2\n... ["))
+        path = os.path.join(self.test_dir, 'multibyte.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('あいうえお' * 10)
+        body = Excerpter(max_bytes=8).wrap()(path)
+        self.assertTrue(body.startswith("あい\n... [144 bytes omitted]"))
+
+    def test04_reads_are_bounded(self):
+        """
+        先頭/末尾の探索で読み込む量がファイルサイズに依存しないことを確認します。
+        """
+        data = b''.join(b'%d\n' % i for i in range(2000000))
+        f = CountingReader(data)
+        head_end, tail_start = Excerpter(head_lines=10, tail_lines=10).plan(f, len(data))
+        self.assertEqual(data[:head_end].count(b'\n'), 10)
+        self.assertEqual(data[tail_start:].count(b'\n'), 10)
+        self.assertLessEqual(f.bytes_read, 2 * BLOCK_SIZE + 1)
+        self.assertLess(f.bytes_read, len(data) // 50)
+
+if __name__ == '__main__':
+    unittest.main()
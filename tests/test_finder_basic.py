@@ -47,5 +47,14 @@ class TestFinderBasic(unittest.TestCase):
         ]
         self.assertCountEqual(sorted(files), sorted(expected))
 
+    def test02_found_files_are_logged(self):
+        """
+        見つかったファイルの相対パスが、標準出力ではなく INFO レベルのログ (-i) に出力されることを確認します。
+        """
+        with self.assertLogs('codeaggregator.finder', level='INFO') as logs:
+            files = find_files(self.test_dir, patterns=['*.py'])
+        self.assertEqual(files, [os.path.join(self.test_dir, 'src', 'file1.py')])
+        self.assertIn(f"INFO:codeaggregator.finder:Found: {os.path.join('src', 'file1.py')}", logs.output)
+
 if __name__ == '__main__':
     unittest.main()
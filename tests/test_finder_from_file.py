@@ -2,9 +2,12 @@
 
 import unittest
 import os
-from codeaggregator.finder import find_files
+from codeaggregator.finder import find_files, iter_fromfile
 from unittest import mock
 import io
+import types
+import threading
+import contextlib
 
 class TestFinderFromFile(unittest.TestCase):
     def setUp(self):
@@ -109,3 +112,45 @@ class TestFinderFromFile(unittest.TestCase):
             os.path.join(self.test_dir, 'docs', '.hidden_dir', 'README.md'),
         ]
         self.assertCountEqual(sorted(files), sorted(expected))
+
+    def test04_fromfile_null_separated(self):
+        """
+        -0 (NUL 区切り) のファイルリストで、改行や空白を含むファイル名をそのまま扱えることを確認します。
+        """
+        stdin = types.SimpleNamespace(buffer=io.BytesIO(b"src/file1.py\0 odd\nname.py\0docs/README.md\0\0"))
+        stdout = io.StringIO()
+        with mock.patch('sys.stdin', stdin), contextlib.redirect_stdout(stdout):
+            files = find_files(self.test_dir, patterns=['*.py'], fromfile='.', null=True)
+        self.assertEqual(files, [
+            os.path.join(self.test_dir, 'src', 'file1.py'),
+            os.path.join(self.test_dir, ' odd\nname.py'),
+        ])
+        # ファイルリストを標準出力へ書き出さない
+        self.assertEqual(stdout.getvalue(), '')
+
+    def test05_fromfile_streams_before_input_ends(self):
+        """
+        パイプの書き込み側が閉じる前から、読み取れたパスを返し始めることを確認します。
+        """
+        read_fd, write_fd = os.pipe()
+        released = threading.Event()
+        closed = threading.Event()
+
+        def producer():
+            with open(write_fd, 'wb', buffering=0) as f:
+                f.write(b"src/file1.py\n")
+                released.wait(5)
+                f.write(b"docs/README.md\n")
+            closed.set()
+
+        thread = threading.Thread(target=producer)
+        thread.start()
+        with open(read_fd, 'rb') as reader, mock.patch('sys.stdin', types.SimpleNamespace(buffer=reader)):
+            files = iter_fromfile(self.test_dir, '.')
+            first = next(files)
+            self.assertFalse(closed.is_set())
+            released.set()
+            rest = list(files)
+        thread.join()
+        self.assertEqual(first, os.path.join(self.test_dir, 'src', 'file1.py'))
+        self.assertEqual(rest, [os.path.join(self.test_dir, 'docs', 'README.md')])
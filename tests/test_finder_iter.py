@@ -0,0 +1,107 @@
+# ./tests/test_finder_iter.py
+
+import unittest
+import os
+import types
+from codeaggregator.finder import iter_files
+from codeaggregator.stats import RunStats
+
+def legacy_walk(directory):
+    """
+    従来の os.walk ベースの走査順を再現します (比較用)。
+    """
+    result = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for file in files:
+            if file.startswith('.'):
+                continue
+            result.append(os.path.join(directory, os.path.relpath(os.path.join(root, file), directory)))
+    return result
+
+class TestFinderIter(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時ディレクトリを作成
+        self.test_dir = 'test_env_iter'
+        os.makedirs(os.path.join(self.test_dir, 'src', 'pkg', 'sub'), exist_ok=True)
+        os.makedirs(os.path.join(self.test_dir, 'docs'), exist_ok=True)
+        os.makedirs(os.path.join(self.test_dir, '.cache'), exist_ok=True)
+
+        for rel in ['top.py', 'src/a.py', 'src/b.txt', 'src/pkg/c.py', 'src/pkg/sub/d.py',
+                    'docs/README.md', '.cache/e.py', 'src/.hidden.py']:
+            with open(os.path.join(self.test_dir, rel), 'w') as f:
+                f.write(rel)
+
+    def tearDown(self):
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+
+    def test01_iter_files_is_lazy(self):
+        """
+        iter_files がジェネレータを返し、最初のファイルを逐次取り出せることを確認します。
+        """
+        files = iter_files(self.test_dir)
+        self.assertIsInstance(files, types.GeneratorType)
+        self.assertTrue(next(files).startswith(self.test_dir))
+
+    def test02_same_order_as_os_walk(self):
+        """
+        走査順とパスの形式が従来の os.walk ベースの実装と一致することを確認します。
+        """
+        self.assertEqual(list(iter_files(self.test_dir)), legacy_walk(self.test_dir))
+
+    def test03_patterns_and_pruning(self):
+        """
+        インクルードパターンとディレクトリの除外が適用されることを確認します。
+        """
+        files = list(iter_files(self.test_dir, patterns=['*.py'], ignore_patterns=['pkg/']))
+        expected = [
+            os.path.join(self.test_dir, 'top.py'),
+            os.path.join(self.test_dir, 'src', 'a.py'),
+        ]
+        self.assertCountEqual(files, expected)
+
+    def test04_parallel_walk_same_order(self):
+        """
+        複数スレッドで走査しても、順序・除外・統計が1スレッドの場合と一致することを確認します。
+        """
+        for i in range(20):
+            os.makedirs(os.path.join(self.test_dir, 'wide', f'd{i}', 'node_modules'), exist_ok=True)
+            for rel in (f'd{i}/x.py', f'd{i}/y.txt', f'd{i}/node_modules/z.py'):
+                with open(os.path.join(self.test_dir, 'wide', rel), 'w') as f:
+                    f.write(rel)
+        with open(os.path.join(self.test_dir, 'wide', '.gitignore'), 'w') as f:
+            f.write('d3/\n*.txt\n')
+
+        for options in ({}, {'patterns': ['*.py'], 'ignore_patterns': ['node_modules/']}, {'gitignore': True}):
+            with self.subTest(options=options):
+                serial_stats, parallel_stats = RunStats(), RunStats()
+                serial = list(iter_files(self.test_dir, stats=serial_stats, **options))
+                parallel = list(iter_files(self.test_dir, stats=parallel_stats, threads=4, **options))
+                self.assertEqual(parallel, serial)
+                self.assertEqual(parallel_stats.dirs_visited, serial_stats.dirs_visited)
+                self.assertEqual(parallel_stats.dirs_pruned, serial_stats.dirs_pruned)
+                self.assertEqual(parallel_stats.skipped, serial_stats.skipped)
+
+    def test05_parallel_walk_errors_and_early_close(self):
+        """
+        走査スレッドで発生した例外が呼び出し元へ送出され、途中で閉じても走査スレッドが終了することを確認します。
+        """
+        def on_dir(path):
+            if path.endswith('sub'):
+                raise RuntimeError('boom')
+
+        with self.assertRaises(RuntimeError):
+            list(iter_files(self.test_dir, on_dir=on_dir, threads=3))
+
+        files = iter_files(self.test_dir, threads=3)
+        self.assertTrue(next(files).startswith(self.test_dir))
+        files.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# ./tests/test_formats.py
+
+import unittest
+import os
+import io
+import json
+from codeaggregator.output import output_files, PASSTHROUGH_MIN_SIZE, SECTION_RULE, FILE_RULE
+from codeaggregator.formats import JsonlFormat, IndexedFormat, IndexedOutput, IndexedFormatError
+from codeaggregator.classify import FileClassifier
+from codeaggregator.cache import AggregateCache
+
+class TestFormats(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時ディレクトリを作成
+        self.test_dir = 'test_env_formats'
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.contents = {
+            'banner.txt': f"{SECTION_RULE}\n{FILE_RULE}\nfake.py\n{FILE_RULE}\n",
+            'plain.py': 'print("こんにちは")\n',
+            'no_newline.py': 'x = 1',
+            'big.py': 'value = 1\n' * (PASSTHROUGH_MIN_SIZE // 10 + 1),
+        }
+        for name, content in self.contents.items():
+            with open(self.path(name), 'w', encoding='utf-8') as f:
+                f.write(content)
+        with open(self.path('image.bin'), 'wb') as f:
+            f.write(b'\x00\x01\x02')
+        self.files = [self.path(name) for name in list(self.contents) + ['image.bin']]
+
+    def tearDown(self):
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+
+    def path(self, name):
+        return os.path.join(self.test_dir, name)
+
+    def test01_jsonl_one_record_per_file(self):
+        """
+        jsonl 形式で1ファイル1行になり、区切り線を含む内容や大きなファイルもそのまま取り出せることを確認します。
+        """
+        buf = io.BytesIO()
+        output_files(self.files, buf, loader=FileClassifier().wrap(), fmt=JsonlFormat())
+        lines = buf.getvalue().decode('utf-8').splitlines()
+        records = [json.loads(line) for line in lines]
+
+        self.assertEqual([r['path'] for r in records], self.files)
+        for record in records[:-1]:
+            self.assertEqual(record['status'], 'included')
+            self.assertEqual(record['content'], self.contents[os.path.basename(record['path'])])
+        self.assertEqual(records[-1]['status'], 'binary')
+        self.assertIn('binary file omitted', records[-1]['message'])
+
+    def test02_indexed_offset_table(self):
+        """
+        indexed 形式のオフセット表から、各ファイルの内容を直接取り出せることを確認します。
+        """
+        output = self.path('out.idx')
+        output_files(self.files, output, loader=FileClassifier().wrap(), fmt=IndexedFormat())
+
+        with IndexedOutput(output) as indexed:
+            self.assertEqual(len(indexed), len(self.files))
+            for name, content in self.contents.items():
+                self.assertEqual(indexed.read(self.path(name), verify=True), content.encode('utf-8'))
+            self.assertEqual(indexed.entry(self.path('image.bin'))['status'], 'binary')
+            self.assertNotIn(self.path('missing.py'), indexed)
+
+    def test03_indexed_from_cached_chunks(self):
+        """
+        キャッシュしたチャンク (末尾の改行を含むパススルー) からも、元のファイルと同じ内容が記録されることを確認します。
+        """
+        files = [self.path(name) for name in self.contents]
+        for name in self.contents:
+            os.utime(self.path(name), (1000000000, 1000000000))
+        cache = AggregateCache(self.path('.cache'))
+        output_files(files, io.BytesIO(), cache=cache)
+        output = self.path('cached.idx')
+        output_files(files, output, cache=cache, fmt=IndexedFormat())
+        # 大きなファイルはキャッシュせずにパススルーする
+        self.assertEqual(cache.hits, len(files) - 1)
+
+        with IndexedOutput(output) as indexed:
+            for name, content in self.contents.items():
+                self.assertEqual(indexed.read(self.path(name), verify=True), content.encode('utf-8'))
+
+    def test04_rejects_other_output(self):
+        """
+        indexed 形式でないファイルは IndexedFormatError になることを確認します。
+        """
+        output = self.path('out.txt')
+        output_files(self.files, output)
+        with self.assertRaises(IndexedFormatError):
+            IndexedOutput(output)
+
+if __name__ == '__main__':
+    unittest.main()
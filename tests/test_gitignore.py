@@ -0,0 +1,112 @@
+# ./tests/test_gitignore.py
+
+import unittest
+import os
+from codeaggregator.finder import find_files
+from codeaggregator.gitignore import IgnoreRules, GitIgnore, is_ignored
+
+class TestIgnoreRules(unittest.TestCase):
+    def check(self, lines, rel, is_dir=False, prefix=''):
+        return is_ignored((IgnoreRules(lines, prefix),), rel, is_dir)
+
+    def test01_basic_semantics(self):
+        """
+        名前のみのパターン、固定位置のパターン、ディレクトリのみのパターンを確認します。
+        """
+        self.assertTrue(self.check(['*.log'], 'a/b/debug.log'))
+        self.assertTrue(self.check(['/build'], 'build', True))
+        self.assertFalse(self.check(['/build'], 'src/build', True))
+        self.assertTrue(self.check(['dist/'], 'src/dist', True))
+        self.assertFalse(self.check(['dist/'], 'src/dist', False))
+        self.assertTrue(self.check(['doc/*.txt'], 'doc/notes.txt'))
+        self.assertFalse(self.check(['doc/*.txt'], 'doc/server/arch.txt'))
+        self.assertTrue(self.check(['# comment', '', 'foo\\ '], 'foo '))
+
+    def test02_double_star(self):
+        """
+        '**' の先頭・途中・末尾の各形式を確認します。
+        """
+        self.assertTrue(self.check(['**/foo'], 'a/b/foo'))
+        self.assertTrue(self.check(['**/foo'], 'foo'))
+        self.assertTrue(self.check(['a/**/b'], 'a/b'))
+        self.assertTrue(self.check(['a/**/b'], 'a/x/y/b'))
+        self.assertTrue(self.check(['abc/**'], 'abc/x/y.py'))
+        self.assertFalse(self.check(['abc/**'], 'abc', True))
+
+    def test03_negation_last_match_wins(self):
+        """
+        否定パターンと「最後に一致したルールが優先」の規則を確認します。
+        """
+        lines = ['*.log', '!keep.log', 'keep.log.old']
+        self.assertTrue(self.check(lines, 'x.log'))
+        self.assertFalse(self.check(lines, 'keep.log'))
+        self.assertTrue(self.check(['!keep.log', '*.log'], 'keep.log'))
+
+    def test04_prefix_of_nested_file(self):
+        """
+        サブディレクトリの .gitignore のパターンがそのディレクトリからの相対で照合されることを確認します。
+        """
+        self.assertTrue(self.check(['/gen'], 'src/gen', True, prefix='src/'))
+        self.assertFalse(self.check(['/gen'], 'src/lib/gen', True, prefix='src/'))
+
+class TestFinderGitignore(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時ディレクトリを作成
+        self.test_dir = 'test_env_gitignore'
+        for d in ['.git/info', 'src/gen', 'src/lib', 'node_modules/pkg', 'logs']:
+            os.makedirs(os.path.join(self.test_dir, d), exist_ok=True)
+
+        files = {
+            '.gitignore': 'node_modules/\n*.log\n!important.log\n/logs/\n',
+            '.git/info/exclude': 'secret.txt\n',
+            'src/.gitignore': '/gen\n*.tmp\n',
+            'src/main.py': 'main',
+            'src/a.tmp': 'tmp',
+            'src/gen/out.py': 'generated',
+            'src/lib/util.py': 'util',
+            'src/lib/debug.log': 'log',
+            'src/lib/important.log': 'important',
+            'node_modules/pkg/index.js': 'js',
+            'logs/app.txt': 'log',
+            'secret.txt': 'secret',
+            'README.md': 'readme',
+        }
+        for rel, content in files.items():
+            with open(os.path.join(self.test_dir, rel), 'w') as f:
+                f.write(content)
+
+    def tearDown(self):
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+
+    def test01_walk_with_gitignore(self):
+        """
+        --gitignore 指定時に、ネストした .gitignore と .git/info/exclude が適用されることを確認します。
+        """
+        files = find_files(directory=self.test_dir, gitignore=True)
+        expected = [
+            os.path.join(self.test_dir, 'README.md'),
+            os.path.join(self.test_dir, 'src', 'main.py'),
+            os.path.join(self.test_dir, 'src', 'lib', 'util.py'),
+            os.path.join(self.test_dir, 'src', 'lib', 'important.log'),
+        ]
+        self.assertCountEqual(files, expected)
+
+    def test02_match_path_for_file_lists(self):
+        """
+        走査を伴わないパスの判定でも、除外された親ディレクトリ配下が除外されることを確認します。
+        """
+        ignore = GitIgnore(self.test_dir)
+        self.assertTrue(ignore.match_path('node_modules/pkg/index.js'))
+        self.assertTrue(ignore.match_path('src/gen/out.py'))
+        self.assertTrue(ignore.match_path('secret.txt'))
+        self.assertFalse(ignore.match_path('src/lib/important.log'))
+        self.assertFalse(ignore.match_path('src/main.py'))
+
+if __name__ == '__main__':
+    unittest.main()
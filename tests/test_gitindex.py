@@ -0,0 +1,96 @@
+# ./tests/test_gitindex.py
+
+import unittest
+import os
+import shutil
+import subprocess
+from codeaggregator.finder import filter_paths
+from codeaggregator.gitindex import read_index, parse_index, GitIndexError
+
+def git(cwd, *args):
+    subprocess.run(['git', *args], cwd=cwd, check=True, capture_output=True)
+
+@unittest.skipUnless(shutil.which('git'), 'git が必要です')
+class TestGitIndex(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時リポジトリを作成
+        self.test_dir = 'test_env_gitindex'
+        for d in ['src/pkg', 'node_modules/dep', 'docs/.hidden']:
+            os.makedirs(os.path.join(self.test_dir, d), exist_ok=True)
+
+        files = {
+            'README.md': 'readme',
+            'src/main.py': 'main',
+            'src/pkg/util.py': 'util\n' * 10,
+            'node_modules/dep/index.js': 'js',
+            'docs/.hidden/note.txt': 'hidden',
+            'untracked.py': 'untracked',
+        }
+        for rel, content in files.items():
+            with open(os.path.join(self.test_dir, rel), 'w') as f:
+                f.write(content)
+        git(self.test_dir, 'init', '-q')
+        git(self.test_dir, 'add', 'README.md', 'src', 'node_modules', 'docs')
+
+    def tearDown(self):
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+
+    def expected_paths(self):
+        return [
+            'README.md',
+            'docs/.hidden/note.txt',
+            'node_modules/dep/index.js',
+            'src/main.py',
+            'src/pkg/util.py',
+        ]
+
+    def test01_read_index_versions(self):
+        """
+        バージョン 2〜4 のインデックスから、同じパスとサイズが読み込めることを確認します。
+        """
+        for version in ('2', '3', '4'):
+            git(self.test_dir, 'update-index', '--index-version', version)
+            entries = read_index(self.test_dir)
+            self.assertEqual([entry.path for entry in entries], self.expected_paths(), version)
+            sizes = {entry.path: entry.size for entry in entries}
+            self.assertEqual(sizes['src/pkg/util.py'], 50)
+
+    def test02_subdirectory_prefix(self):
+        """
+        サブディレクトリを指定した場合は、その配下のエントリだけが相対パスで返ることを確認します。
+        """
+        entries = read_index(os.path.join(self.test_dir, 'src'))
+        self.assertEqual([entry.path for entry in entries], [p[4:] for p in self.expected_paths() if p.startswith('src/')])
+
+    def test03_filter_paths(self):
+        """
+        走査時と同じ規則で -P/-I と隠しファイルの除外が適用されることを確認します。
+        """
+        paths = [entry.path for entry in read_index(self.test_dir)]
+        files = list(filter_paths(self.test_dir, paths, patterns=['*.py'], ignore_patterns=['node_modules']))
+        self.assertEqual(files, [
+            os.path.join(self.test_dir, 'src', 'main.py'),
+            os.path.join(self.test_dir, 'src', 'pkg', 'util.py'),
+        ])
+        files = list(filter_paths(self.test_dir, paths, ignore_patterns=['src/pkg/*'], include_hidden=True))
+        self.assertIn(os.path.join(self.test_dir, 'docs', '.hidden', 'note.txt'), files)
+        self.assertIn(os.path.join(self.test_dir, 'node_modules', 'dep', 'index.js'), files)
+        self.assertNotIn(os.path.join(self.test_dir, 'src', 'pkg', 'util.py'), files)
+
+    def test04_invalid_index(self):
+        """
+        インデックスでないデータや未対応のバージョンは GitIndexError になることを確認します。
+        """
+        with self.assertRaises(GitIndexError):
+            list(parse_index(b'not an index'))
+        with self.assertRaises(GitIndexError):
+            list(parse_index(b'DIRC\x00\x00\x00\x09\x00\x00\x00\x00'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+# ./tests/test_grep.py
+
+import unittest
+import os
+import io
+import re
+import zipfile
+import shutil
+import contextlib
+from codeaggregator.aggregator import Aggregator
+from codeaggregator.finder import iter_files
+from codeaggregator.cache import cache_dir
+from codeaggregator.classify import FileClassifier
+from codeaggregator.output import output_files
+from codeaggregator.trigram import ContentFilter, TrigramIndex, required_trigrams, index_main, index_path
+
+class TestGrep(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時ディレクトリを作成
+        self.test_dir = 'test_env_grep'
+        os.makedirs(os.path.join(self.test_dir, 'pkg'), exist_ok=True)
+        self.write('client.py', 'class PaymentClient:\n    pass\n')
+        self.write('pkg/server.py', 'from client import PaymentClient\n')
+        self.write('pkg/util.py', 'def helper():\n    return 1\n')
+        self.write('README.txt', 'payment client docs\n')
+
+    def tearDown(self):
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+        # 索引はユーザーのキャッシュディレクトリに作成される
+        shutil.rmtree(cache_dir(self.test_dir), ignore_errors=True)
+
+    def write(self, rel, content, mtime=1000000000):
+        path = os.path.join(self.test_dir, rel)
+        with open(path, 'w') as f:
+            f.write(content)
+        # 直前に更新されたファイルは索引に保存されないため、更新時刻を過去にする
+        os.utime(path, (mtime, mtime))
+
+    def matched(self, regex, index=None):
+        content_filter = ContentFilter(regex, index)
+        files = list(content_filter.filter(iter_files(self.test_dir), self.test_dir))
+        return sorted(os.path.relpath(f, self.test_dir) for f in files), content_filter
+
+    def test01_required_trigrams(self):
+        """
+        正規表現から一致に必須のトライグラムだけを取り出すことを確認します。
+        """
+        self.assertEqual(required_trigrams(re.compile(r'def\s+run')), {b'def', b'run'})
+        self.assertEqual(required_trigrams(re.compile('(?i)Payment')),
+                         {b'pay', b'aym', b'yme', b'men', b'ent'})
+        # 選択や 0 回を許す繰り返しの中のリテラルは必須ではない
+        self.assertEqual(required_trigrams(re.compile('foo|bar')), set())
+        self.assertEqual(required_trigrams(re.compile('(?:abc)?xyz')), {b'xyz'})
+        self.assertEqual(required_trigrams(re.compile('a.c')), set())
+
+    def test02_index_narrows_candidates(self):
+        """
+        索引がある場合は一致し得ないファイルを読み込まず、索引なしと同じ結果になることを確認します。
+        """
+        expected = sorted(['client.py', os.path.join('pkg', 'server.py')])
+        self.assertEqual(self.matched('PaymentClient')[0], expected)
+
+        index = TrigramIndex(index_path(self.test_dir))
+        first, content_filter = self.matched('PaymentClient', index)
+        self.assertEqual(first, expected)
+        self.assertEqual(content_filter.reads, 4)
+        index.save()
+
+        index = TrigramIndex(index_path(self.test_dir))
+        self.assertEqual(len(index), 4)
+        second, content_filter = self.matched('PaymentClient', index)
+        self.assertEqual(second, expected)
+        self.assertEqual(content_filter.narrowed, 2)
+        self.assertEqual(content_filter.reads, 2)
+
+        # 正規表現として一致しない候補は確認で除外される
+        third, _ = self.matched(r'class\s+PaymentClient\b', index)
+        self.assertEqual(third, ['client.py'])
+
+    def test03_changed_files_are_reindexed(self):
+        """
+        stat が変わったファイルは索引の古い項目を使わずに読み直すことを確認します。
+        """
+        index = TrigramIndex(index_path(self.test_dir))
+        self.matched('PaymentClient', index)
+        self.write('pkg/util.py', 'client = PaymentClient()\n', mtime=1000000100)
+
+        files, content_filter = self.matched('PaymentClient', index)
+        self.assertIn(os.path.join('pkg', 'util.py'), files)
+        self.assertEqual(index.updated, 5)
+
+    def test04_aggregator_and_index_subcommand(self):
+        """
+        Aggregator の grep と、索引を作成・更新する index サブコマンドを確認します。
+        """
+        with contextlib.redirect_stderr(io.StringIO()) as err:
+            self.assertEqual(index_main([self.test_dir, '-P', '*.py']), 0)
+        self.assertIn('Indexed 3 file(s): 3 updated, 0 removed', err.getvalue())
+
+        os.remove(os.path.join(self.test_dir, 'pkg', 'util.py'))
+        with contextlib.redirect_stderr(io.StringIO()) as err:
+            index_main([self.test_dir, '-P', '*.py'])
+        self.assertIn('Indexed 2 file(s): 0 updated, 1 removed', err.getvalue())
+
+        index = TrigramIndex(index_path(self.test_dir))
+        result = Aggregator(grep='PaymentClient').render(self.test_dir, io.BytesIO(), index=index)
+        expected = sorted(['client.py', os.path.join('pkg', 'server.py')])
+        self.assertEqual(sorted(r.path for r in result.records), expected)
+
+        # アーカイブには指定できない
+        archive = os.path.join(self.test_dir, 'dist.zip')
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('a.py', 'PaymentClient\n')
+        with self.assertRaises(ValueError):
+            Aggregator(grep='PaymentClient').select(archive)
+
+    def test05_classifier_and_reuse(self):
+        """
+        大きすぎるファイルとバイナリのファイルは照合せず、一致したファイルは出力で読み直さないことを確認します。
+        """
+        with open(os.path.join(self.test_dir, 'data.bin'), 'wb') as f:
+            f.write(b'PaymentClient\x00' * 10)
+        self.write('large.py', 'PaymentClient()\n' * 100)
+        classifier = FileClassifier(max_file_size=1000)
+        content_filter = ContentFilter('PaymentClient', classifier=classifier)
+        files = list(content_filter.filter(iter_files(self.test_dir), self.test_dir))
+        self.assertEqual(sorted(os.path.relpath(f, self.test_dir) for f in files),
+                         sorted(['client.py', os.path.join('pkg', 'server.py')]))
+        self.assertEqual(content_filter.reads, 4)
+
+        aggregator = Aggregator(grep='PaymentClient', max_file_size=1000)
+        buf = io.BytesIO()
+        aggregator.render(self.test_dir, buf)
+        expected = io.BytesIO()
+        output_files(sorted(files), expected, loader=classifier.wrap())
+        self.assertEqual(buf.getvalue(), expected.getvalue())
+
+        reads = []
+        content_filter = aggregator.content_filter()
+        matched = list(content_filter.filter(iter_files(self.test_dir), self.test_dir))
+        load = content_filter.wrap(lambda file: reads.append(file))
+        self.assertEqual([load(file) for file in matched],
+                         ['class PaymentClient:\n    pass\n\n', 'from client import PaymentClient\n\n'])
+        self.assertEqual((reads, content_filter.reused), ([], 2))
+
+    def test06_ignore_case_non_ascii_folds(self):
+        """
+        大文字小文字を区別しない検索で、k/s/i が一致する非 ASCII の文字 (KELVIN SIGN など) を含むファイルを
+        索引が除外しないことを確認します。
+        """
+        self.write('kelvin.txt', 'hello \u212aeyword\n')
+        self.write('long_s.txt', 'a \u017fecret\n')
+        self.assertEqual(required_trigrams(re.compile('(?i)keyword')), {b'eyw', b'ywo', b'wor', b'ord'})
+        self.assertEqual(required_trigrams(re.compile('(?i)secret')), {b'ecr', b'cre', b'ret'})
+
+        index = TrigramIndex(index_path(self.test_dir))
+        self.matched('x', index)
+        index.save()
+        for regex, expected in (('(?i)keyword', ['kelvin.txt']), ('(?i)secret', ['long_s.txt'])):
+            with self.subTest(regex=regex):
+                self.assertEqual(self.matched(regex)[0], expected)
+                index = TrigramIndex(index_path(self.test_dir))
+                self.assertEqual(self.matched(regex, index)[0], expected)
+
+if __name__ == '__main__':
+    unittest.main()
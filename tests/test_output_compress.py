@@ -0,0 +1,91 @@
+# ./tests/test_output_compress.py
+
+import unittest
+import os
+import bz2
+import gzip
+import lzma
+from unittest import mock
+from codeaggregator import output
+from codeaggregator.output import output_files, compression_of, CompressedWriter, PASSTHROUGH_MIN_SIZE
+
+
+class TestOutputCompress(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時ディレクトリを作成
+        self.test_dir = 'test_env_output_compress'
+        os.makedirs(os.path.join(self.test_dir, 'src'), exist_ok=True)
+
+        with open(os.path.join(self.test_dir, 'src', 'small.py'), 'w', encoding='utf-8') as f:
+            f.write('print("こんにちは")\n')
+        # パススルー (mmap のコピー) で出力される大きさのファイル
+        with open(os.path.join(self.test_dir, 'src', 'large.txt'), 'w', encoding='utf-8') as f:
+            f.write('line of text\n' * (PASSTHROUGH_MIN_SIZE // 13 * 4))
+
+        self.files = [
+            os.path.join(self.test_dir, 'src', 'small.py'),
+            os.path.join(self.test_dir, 'src', 'large.txt'),
+        ]
+        plain = os.path.join(self.test_dir, 'plain.txt')
+        output_files(self.files, plain)
+        with open(plain, 'rb') as f:
+            self.expected = f.read()
+
+    def tearDown(self):
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+
+    def test01_compression_of(self):
+        """
+        出力先の拡張子から圧縮形式を判定することを確認します。
+        """
+        self.assertEqual(compression_of('out.txt.gz'), 'gzip')
+        self.assertEqual(compression_of('out.XZ'), 'xz')
+        self.assertEqual(compression_of('out.txt.bz2'), 'bz2')
+        self.assertIsNone(compression_of('out.txt'))
+
+    def test02_compressed_output_matches_plain(self):
+        """
+        各形式で圧縮した出力を展開すると、圧縮しない出力とバイト単位で一致することを確認します。
+        """
+        for suffix, module in (('.gz', gzip), ('.xz', lzma), ('.bz2', bz2)):
+            with self.subTest(suffix=suffix):
+                path = os.path.join(self.test_dir, 'out.txt' + suffix)
+                output_files(self.files, path, compress_level=1)
+                with open(path, 'rb') as f:
+                    compressed = f.read()
+                self.assertLess(len(compressed), len(self.expected) // 5)
+                self.assertEqual(module.decompress(compressed), self.expected)
+
+    def test03_gzip_output_is_reproducible(self):
+        """
+        同じ内容の gzip 出力は、ファイル名や時刻によらず同じバイト列になることを確認します。
+        """
+        first = os.path.join(self.test_dir, 'a.txt.gz')
+        second = os.path.join(self.test_dir, 'b.txt.gz')
+        output_files(self.files, first)
+        output_files(self.files, second)
+        with open(first, 'rb') as f1, open(second, 'rb') as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+    def test04_compression_error_is_raised(self):
+        """
+        圧縮スレッドでのエラーが、書き込み側で送出されることを確認します。
+        """
+        path = os.path.join(self.test_dir, 'out.txt.gz')
+        with mock.patch.object(output, 'COMPRESS_QUEUE_SIZE', 1):
+            writer = CompressedWriter(path, 'gzip')
+        writer._file.write = mock.Mock(side_effect=OSError('disk full'))
+        with self.assertRaises(OSError):
+            for _ in range(10):
+                writer.write(b'data')
+            writer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+# ./tests/test_output_jobs.py
+
+import unittest
+import os
+import io
+from codeaggregator.output import output_files, iter_loaded
+
+class TestOutputJobs(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時ディレクトリを作成
+        self.test_dir = 'test_env_output_jobs'
+        os.makedirs(self.test_dir, exist_ok=True)
+
+        self.files = []
+        for i in range(50):
+            path = os.path.join(self.test_dir, f'file{i:02d}.py')
+            with open(path, 'w') as f:
+                f.write(f'print({i})\n' * (i + 1))
+            self.files.append(path)
+        # 存在しないファイルも混ぜる
+        self.files.insert(10, os.path.join(self.test_dir, 'missing.py'))
+
+    def tearDown(self):
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+
+    def test01_parallel_output_keeps_order(self):
+        """
+        --jobs を指定しても逐次読み込みと同じ順序・内容で出力されることを確認します。
+        """
+        serial = io.BytesIO()
+        output_files(self.files, serial, jobs=1)
+        parallel = io.BytesIO()
+        output_files(iter(self.files), parallel, jobs=8)
+        self.assertEqual(parallel.getvalue(), serial.getvalue())
+
+    def test02_read_ahead_is_bounded(self):
+        """
+        先読みが window 件を超えて入力を消費しないことを確認します。
+        """
+        consumed = []
+
+        def source():
+            for file in self.files:
+                consumed.append(file)
+                yield file
+
+        loaded = iter_loaded(source(), jobs=2, window=5)
+        first_file, _ = next(loaded)
+        self.assertEqual(first_file, self.files[0])
+        self.assertLessEqual(len(consumed), 5)
+        loaded.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# ./tests/test_output_passthrough.py
+
+import unittest
+import os
+import io
+from unittest import mock
+from codeaggregator.output import output_files, load_file, Passthrough, PASSTHROUGH_MIN_SIZE, VALIDATE_CHUNK_SIZE
+from tests.test_output_stream import legacy_output
+
+class TestOutputPassthrough(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時ディレクトリを作成
+        self.test_dir = 'test_env_output_passthrough'
+        os.makedirs(self.test_dir, exist_ok=True)
+
+        line = 'print("日本語のコメントを含む行")\n'
+        self.large = os.path.join(self.test_dir, 'large.py')
+        with open(self.large, 'w', encoding='utf-8', newline='') as f:
+            f.write(line * (PASSTHROUGH_MIN_SIZE // len(line) + 10))
+        self.crlf = os.path.join(self.test_dir, 'crlf.txt')
+        with open(self.crlf, 'w', encoding='utf-8', newline='') as f:
+            f.write('line\r\n' * PASSTHROUGH_MIN_SIZE)
+        self.invalid = os.path.join(self.test_dir, 'invalid.bin')
+        with open(self.invalid, 'wb') as f:
+            f.write(b'a' * PASSTHROUGH_MIN_SIZE + b'\xff\xfe')
+        self.small = os.path.join(self.test_dir, 'small.py')
+        with open(self.small, 'w', encoding='utf-8') as f:
+            f.write('x = 1\n')
+
+        self.files = [self.small, self.large, self.crlf, self.invalid, self.small]
+
+    def tearDown(self):
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+
+    def test01_only_valid_utf8_uses_passthrough(self):
+        """
+        改行変換やデコードエラーが起きるファイルはパススルーされないことを確認します。
+        """
+        body = load_file(self.large)
+        self.assertIsInstance(body, Passthrough)
+        body.file.close()
+        self.assertIsInstance(load_file(self.crlf), str)
+        self.assertTrue(load_file(self.invalid).startswith(f"Error reading {self.invalid}:"))
+        self.assertIsInstance(load_file(self.small), str)
+
+        # 検証のチャンクの境界をまたぐ複数バイト文字は正しく、後ろのチャンクの '\r' は変換が起きる
+        split = os.path.join(self.test_dir, 'split.txt')
+        with open(split, 'wb') as f:
+            f.write(b'a' * (VALIDATE_CHUNK_SIZE - 1) + 'あ'.encode('utf-8') + b'b' * PASSTHROUGH_MIN_SIZE)
+        body = load_file(split)
+        self.assertIsInstance(body, Passthrough)
+        body.file.close()
+        late_cr = os.path.join(self.test_dir, 'late_cr.txt')
+        with open(late_cr, 'wb') as f:
+            f.write(b'a\n' * PASSTHROUGH_MIN_SIZE + b'b\r\n')
+        self.assertEqual(load_file(late_cr), 'a\n' * PASSTHROUGH_MIN_SIZE + 'b\n\n')
+
+    def test02_sendfile_to_real_file(self):
+        """
+        ファイルへの出力 (sendfile) が従来のフォーマットと一致することを確認します。
+        """
+        out_path = os.path.join(self.test_dir, 'out.txt')
+        output_files(self.files, out_path)
+        with open(out_path, 'rb') as f:
+            self.assertEqual(f.read(), legacy_output(self.files).encode('utf-8'))
+
+    def test03_mmap_to_file_like(self):
+        """
+        ファイルディスクリプタを持たない出力先でも従来のフォーマットと一致することを確認します。
+        """
+        buf = io.BytesIO()
+        output_files(self.files, buf, jobs=2)
+        self.assertEqual(buf.getvalue(), legacy_output(self.files).encode('utf-8'))
+
+    @mock.patch('sys.stdout', new_callable=io.StringIO)
+    def test04_text_stdout(self, mock_stdout):
+        """
+        バイナリ層を持たない標準出力でも内容が一致することを確認します。
+        """
+        output_files(self.files)
+        self.assertEqual(mock_stdout.getvalue(), legacy_output(self.files) + "\n")
+
+if __name__ == '__main__':
+    unittest.main()
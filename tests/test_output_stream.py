@@ -0,0 +1,99 @@
+# ./tests/test_output_stream.py
+
+import unittest
+import os
+import io
+from unittest import mock
+from codeaggregator.output import output_files, StreamWriter
+
+
+def legacy_output(files):
+    """
+    従来の output_files と同じ手順で出力文字列を組み立てます (比較用)。
+    """
+    output = ["=" * 17]
+    for file in files:
+        if not os.path.exists(file):
+            continue
+        output.append(f"##################################\n{file}\n##################################\n")
+        try:
+            with open(file, 'r', encoding='utf-8') as f:
+                content = f.read()
+            output.append(content + "\n")
+        except Exception as e:
+            output.append(f"Error reading {file}: {e}\n")
+    output.append("=" * 17)
+    return "\n".join(output)
+
+
+class TestOutputStream(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時ディレクトリを作成
+        self.test_dir = 'test_env_output_stream'
+        os.makedirs(os.path.join(self.test_dir, 'src'), exist_ok=True)
+
+        with open(os.path.join(self.test_dir, 'src', 'file1.py'), 'w', encoding='utf-8') as f:
+            f.write('print("こんにちは")\n')
+        with open(os.path.join(self.test_dir, 'src', 'file2.js'), 'w', encoding='utf-8') as f:
+            f.write('console.log("Hello, World!");')
+        with open(os.path.join(self.test_dir, 'src', 'binary.bin'), 'wb') as f:
+            f.write(b'\xff\xfe\x00\x01')
+
+        self.files = [
+            os.path.join(self.test_dir, 'src', 'file1.py'),
+            os.path.join(self.test_dir, 'src', 'missing.py'),
+            os.path.join(self.test_dir, 'src', 'binary.bin'),
+            os.path.join(self.test_dir, 'src', 'file2.js'),
+        ]
+
+    def tearDown(self):
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+
+    def test01_output_to_file_matches_legacy_format(self):
+        """
+        ファイルへの出力が従来のフォーマットとバイト単位で一致することを確認します。
+        """
+        out_path = os.path.join(self.test_dir, 'out.txt')
+        output_files(self.files, out_path)
+        with open(out_path, 'rb') as f:
+            actual = f.read()
+        self.assertEqual(actual, legacy_output(self.files).encode('utf-8'))
+
+    def test02_output_to_binary_stream(self):
+        """
+        バイナリのファイルライクオブジェクトへ直接書き込めることを確認します。
+        """
+        buf = io.BytesIO()
+        output_files(iter(self.files), buf)
+        self.assertEqual(buf.getvalue(), legacy_output(self.files).encode('utf-8'))
+
+    @mock.patch('sys.stdout', new_callable=io.StringIO)
+    def test03_output_to_stdout(self, mock_stdout):
+        """
+        標準出力への出力が print() と同じく末尾に改行を持つことを確認します。
+        """
+        output_files(self.files)
+        self.assertEqual(mock_stdout.getvalue(), legacy_output(self.files) + "\n")
+
+    def test04_writer_buffers_small_writes(self):
+        """
+        小さな書き込みがバッファにまとめられ、flush 時に書き出されることを確認します。
+        """
+        buf = io.BytesIO()
+        writer = StreamWriter(buf, buffer_size=16)
+        writer.write("abc")
+        writer.write("def")
+        self.assertEqual(buf.getvalue(), b"")
+        writer.write("x" * 32)
+        writer.flush()
+        self.assertEqual(buf.getvalue(), b"abcdef" + b"x" * 32)
+        self.assertEqual(writer.bytes_written, 38)
+
+if __name__ == '__main__':
+    unittest.main()
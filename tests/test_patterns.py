@@ -0,0 +1,51 @@
+# ./tests/test_patterns.py
+
+import unittest
+import fnmatch
+from codeaggregator.patterns import PatternSet
+
+class TestPatternSet(unittest.TestCase):
+    def setUp(self):
+        self.names = [
+            'file1.py', 'src/file1.py', 'src/file2.js', 'docs/README.md', 'README',
+            '.hidden', 'src/.hidden_dir/x.py', 'node_modules', 'lib/archive.tar.gz',
+            'src/file4.dpp', 'src/file6.cpp', 'a.py/b', 'Makefile', 'build/out.min.js',
+        ]
+
+    def assertSameAsFnmatch(self, patterns):
+        matcher = PatternSet(patterns)
+        for name in self.names:
+            expected = any(fnmatch.fnmatch(name, pat) for pat in patterns)
+            self.assertEqual(matcher.match(name), expected, f"{patterns!r} vs {name!r}")
+
+    def test01_matches_like_fnmatch(self):
+        """
+        リテラル・拡張子・末尾一致・正規表現のいずれの経路でも fnmatch と同じ結果になることを確認します。
+        """
+        self.assertSameAsFnmatch(['*.py'])
+        self.assertSameAsFnmatch(['*.py', '*.txt', '*.md'])
+        self.assertSameAsFnmatch(['*.[dwc]pp'])
+        self.assertSameAsFnmatch(['.*'])
+        self.assertSameAsFnmatch(['README', 'Makefile'])
+        self.assertSameAsFnmatch(['*.tar.gz', '*.min.js'])
+        self.assertSameAsFnmatch(['src/*', 'file?.py', '*'])
+
+    def test02_normalize_and_dedupe(self):
+        """
+        '|' の展開、末尾 '/' の除去、重複の除去が行われることを確認します。
+        """
+        matcher = PatternSet(['node_modules/|dist/', '*.py', '*.py|dist'])
+        self.assertEqual(matcher.patterns, ['node_modules', 'dist', '*.py'])
+        self.assertTrue(matcher.match('node_modules'))
+        self.assertTrue(matcher.match('dist'))
+
+    def test03_empty_pattern_set(self):
+        """
+        パターンが空の場合は偽として扱われ、何にも一致しないことを確認します。
+        """
+        matcher = PatternSet(None)
+        self.assertFalse(matcher)
+        self.assertFalse(matcher.match('file1.py'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+# ./tests/test_shard.py
+
+import unittest
+import os
+import io
+import json
+import contextlib
+from unittest import mock
+from codeaggregator.cli import parse_args
+from codeaggregator.output import PASSTHROUGH_MIN_SIZE
+from codeaggregator.shard import write_shards, parse_shard_size, plan_shards, shard_path, manifest_path
+import codeaggregator.shard as shard_module
+
+class TestShard(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時ディレクトリを作成
+        self.test_dir = 'test_env_shard'
+        os.makedirs(os.path.join(self.test_dir, 'src'), exist_ok=True)
+        self.output = os.path.join(self.test_dir, 'out.txt')
+
+        self.files = []
+        for i, lines in enumerate([5, 40, 5, 300, 10, 20]):
+            path = os.path.join(self.test_dir, 'src', f'file{i}.py')
+            with open(path, 'w') as f:
+                f.write(''.join(f'line {n} of file {i}\n' for n in range(lines)))
+            self.files.append(path)
+
+    def tearDown(self):
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+
+    def read_entry(self, record):
+        with open(shard_path(self.output, record['shard']), 'rb') as f:
+            f.seek(record['offset'])
+            return f.read(record['length'])
+
+    def test01_parse_shard_size(self):
+        """
+        バイト数とトークン数の指定を解析できることを確認します。
+        """
+        self.assertEqual(parse_shard_size('500k'), (500000, 'bytes'))
+        self.assertEqual(parse_shard_size('120kt'), (120000, 'tokens'))
+        self.assertEqual(parse_shard_size('2M'), (2000000, 'bytes'))
+        with self.assertRaises(ValueError):
+            parse_shard_size('abc')
+
+    def test02_shard_size_keeps_files_whole(self):
+        """
+        --shard-size で各シャードが上限以内になり、大きなファイルだけが行単位で分割されることを確認します。
+        """
+        manifest = write_shards(self.files, self.output, shard_size=2000)
+        self.assertGreater(len(manifest['shards']), 1)
+        for shard in manifest['shards']:
+            self.assertLessEqual(os.path.getsize(shard['path']), 2000)
+            with open(shard['path'], 'rb') as f:
+                content = f.read()
+            self.assertTrue(content.startswith(b'=' * 17) and content.endswith(b'=' * 17))
+
+        parts = [record for record in manifest['files'] if 'part' in record]
+        self.assertTrue(parts and all(record['path'] == self.files[3] for record in parts))
+        whole = [record['path'] for record in manifest['files'] if 'part' not in record]
+        self.assertEqual(whole, [file for file in self.files if file != self.files[3]])
+
+        # マニフェストのオフセットから各ファイルの見出しを直接読める
+        for record in manifest['files']:
+            self.assertIn(record['path'].encode(), self.read_entry(record))
+        with open(manifest_path(self.output)) as f:
+            self.assertEqual(json.load(f), manifest)
+
+    def test03_shards_balanced_by_size(self):
+        """
+        --shards N で stat のサイズをもとに均等に振り分けられ、各シャード内の順序が保たれることを確認します。
+        """
+        plan = plan_shards(self.files, 2)
+        self.assertEqual(sorted(sum(plan, [])), sorted(self.files))
+        self.assertIn(self.files[3], plan[0])
+        for shard in plan:
+            self.assertEqual(shard, [file for file in self.files if file in shard])
+
+        manifest = write_shards(self.files, self.output, shards=3)
+        self.assertEqual(len(manifest['shards']), 3)
+        self.assertCountEqual([record['path'] for record in manifest['files']], self.files)
+        for record in manifest['files']:
+            self.assertTrue(self.read_entry(record).startswith(b'\n' + b'#' * 34 + b'\n' + record['path'].encode()))
+
+    def test04_counts_must_be_positive(self):
+        """
+        --shards、-j、--walk-threads に 1 未満を指定すると、引数の誤りとして終了することを確認します。
+        """
+        for argv in (['--shards=-1'], ['--shards', '0'], ['-j', '0'], ['--walk-threads=-2']):
+            with self.subTest(argv=argv):
+                with contextlib.redirect_stderr(io.StringIO()) as err, self.assertRaises(SystemExit):
+                    parse_args([self.test_dir, '-o', self.output] + argv)
+                self.assertIn('1 以上を指定してください', err.getvalue())
+
+    def test05_many_parts_keep_one_shard_open(self):
+        """
+        1000 部分以上に分割するパススルー対象のファイルでも、各シャードが上限以内で、
+        開いているシャードが常に1つだけであることを確認します。
+        """
+        path = os.path.join(self.test_dir, 'src', 'big.py')
+        line = 'x' * 99 + '\n'
+        lines = max(1100, PASSTHROUGH_MIN_SIZE // len(line) + 1)
+        with open(path, 'w') as f:
+            f.write(line * lines)
+
+        opened = []
+        peak = []
+
+        class CountingSink(shard_module._ShardSink):
+            def __init__(self, path):
+                super().__init__(path)
+                opened.append(self)
+                peak.append(len(opened))
+
+            def close(self):
+                super().close()
+                opened.remove(self)
+
+        with mock.patch.object(shard_module, '_ShardSink', CountingSink):
+            manifest = write_shards([path], self.output, shard_size=300)
+
+        self.assertEqual(max(peak), 1)
+        self.assertEqual(opened, [])
+        self.assertEqual(len(manifest['shards']), lines)
+        for shard in manifest['shards']:
+            self.assertLessEqual(os.path.getsize(shard['path']), 300)
+        records = manifest['files']
+        self.assertEqual([record['part'] for record in records], list(range(1, lines + 1)))
+        self.assertIn(f'{path} (part {lines}/{lines})'.encode(), self.read_entry(records[-1]))
+        body = b''.join(self.read_entry(record).split(b'#' * 34 + b'\n\n', 1)[1] for record in records)
+        self.assertEqual(body, (line * lines + '\n').encode())
+
+if __name__ == '__main__':
+    unittest.main()
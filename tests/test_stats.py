@@ -0,0 +1,76 @@
+# ./tests/test_stats.py
+
+import unittest
+import io
+import os
+from codeaggregator.finder import iter_files
+from codeaggregator.output import output_files
+from codeaggregator.stats import RunStats, profile_run
+
+class TestRunStats(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時ディレクトリを作成
+        self.test_dir = 'test_env_stats'
+        os.makedirs(os.path.join(self.test_dir, 'src'), exist_ok=True)
+        os.makedirs(os.path.join(self.test_dir, 'node_modules'), exist_ok=True)
+
+        files = {
+            'src/main.py': b'print("main")',
+            'src/util.py': b'x = 1\n' * 100,
+            'src/notes.txt': b'notes',
+            'src/.env': b'SECRET=1',
+            'src/broken.py': b'\xff\xfe\x00',
+            'node_modules/index.js': b'js',
+        }
+        for rel, content in files.items():
+            with open(os.path.join(self.test_dir, rel), 'wb') as f:
+                f.write(content)
+
+    def tearDown(self):
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+
+    def test01_counts_by_phase_and_reason(self):
+        """
+        走査したディレクトリ数、理由ごとのスキップ数、読み書きしたバイト数が記録されることを確認します。
+        """
+        stats = RunStats(slowest=2)
+        files = iter_files(self.test_dir, patterns=['*.py'], ignore_patterns=['node_modules'], stats=stats)
+        files = list(stats.iter_timed(files)) + [os.path.join(self.test_dir, 'src', 'missing.py')]
+        out = io.BytesIO()
+        output_files(files, out, stats=stats)
+        stats.stop()
+
+        self.assertEqual(stats.dirs_visited, 2)
+        self.assertEqual(stats.dirs_pruned, 1)
+        self.assertEqual(stats.files_found, 3)
+        self.assertEqual(stats.skipped['hidden'], 1)
+        self.assertEqual(stats.skipped['include'], 1)
+        self.assertEqual(stats.skipped['missing'], 1)
+        self.assertEqual(stats.skipped['unreadable'], 1)
+        self.assertEqual(stats.files_read, 2)
+        self.assertEqual(stats.bytes_read, len('print("main")\n') + len('x = 1\n' * 100 + '\n'))
+        self.assertEqual(stats.bytes_written, len(out.getvalue()))
+        self.assertEqual(len(stats.slowest), 2)
+
+        data = stats.to_dict()
+        self.assertEqual(set(data['phases']), {'walk', 'read', 'write'})
+        self.assertIn('Skipped: hidden 1, include 1, missing 1, unreadable 1', stats.report())
+
+    def test02_profile_run_writes_output(self):
+        """
+        tracemalloc で計測した結果がファイルに保存されることを確認します。
+        """
+        path = os.path.join(self.test_dir, 'memory.txt')
+        with profile_run('tracemalloc', path):
+            list(iter_files(self.test_dir))
+        with open(path, encoding='utf-8') as f:
+            self.assertTrue(f.readline().startswith('tracemalloc peak:'))
+
+if __name__ == '__main__':
+    unittest.main()
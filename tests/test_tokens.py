@@ -0,0 +1,95 @@
+# ./tests/test_tokens.py
+
+import unittest
+import os
+import io
+from codeaggregator.output import output_files
+from codeaggregator.tokens import TokenBudget, estimate_tokens, truncate_text, order_files
+
+class TestTokenEstimate(unittest.TestCase):
+    def test01_estimate_tokens(self):
+        """
+        単語・記号・非ASCII文字がそれぞれ数えられ、空の入力は 0 になることを確認します。
+        """
+        self.assertEqual(estimate_tokens(b''), 0)
+        self.assertEqual(estimate_tokens(b'hello world'), 2)
+        self.assertGreater(estimate_tokens(b'print("hello")'), estimate_tokens(b'print hello'))
+        self.assertGreater(estimate_tokens('こんにちは'.encode('utf-8')), 0)
+        # チャンクに分けても、ほぼ同じ見積もりになる
+        data = b'def f(x):\n    return x + 1\n' * 100
+        self.assertAlmostEqual(estimate_tokens(data), 2 * estimate_tokens(data[:len(data) // 2]), delta=2)
+
+    def test02_truncate_text_on_line_boundary(self):
+        """
+        切り詰めが行の境界で行われ、上限に収まることを確認します。
+        """
+        text = ''.join(f'line number {i}\n' for i in range(100))
+        kept = truncate_text(text, 50)
+        self.assertTrue(kept.endswith('\n'))
+        self.assertTrue(text.startswith(kept))
+        self.assertLessEqual(estimate_tokens(kept.encode('utf-8')), 50)
+
+class TestTokenBudget(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時ディレクトリを作成
+        self.test_dir = 'test_env_tokens'
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.files = []
+        for name, lines in [('a_big.py', 200), ('b_small.py', 2), ('c_medium.py', 20)]:
+            path = os.path.join(self.test_dir, name)
+            with open(path, 'w') as f:
+                f.write(''.join(f'value_{i} = compute({i})\n' for i in range(lines)))
+            self.files.append(path)
+
+    def tearDown(self):
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+
+    def run_budget(self, mode, files=None, max_tokens=300):
+        budget = TokenBudget(max_tokens, mode)
+        buf = io.BytesIO()
+        output_files(files or self.files, buf, budget=budget)
+        return budget, buf.getvalue()
+
+    def test01_skip_mode(self):
+        """
+        skip では収まらないファイルだけを省略し、後続の小さいファイルは出力することを確認します。
+        """
+        budget, output = self.run_budget('skip')
+        self.assertEqual([file for file, _ in budget.omitted], [self.files[0]])
+        self.assertIn(self.files[1].encode(), output)
+        self.assertIn(self.files[2].encode(), output)
+        self.assertLessEqual(estimate_tokens(output), 300)
+
+    def test02_stop_mode(self):
+        """
+        stop では最初に収まらなかったファイル以降をすべて省略することを確認します。
+        """
+        budget, output = self.run_budget('stop')
+        self.assertEqual([file for file, _ in budget.omitted], self.files)
+        self.assertTrue(output.startswith(b'=' * 17) and output.endswith(b'=' * 17))
+
+    def test03_truncate_mode(self):
+        """
+        truncate では収まる行までを出力し、省略した旨の行を付けることを確認します。
+        """
+        budget, output = self.run_budget('truncate')
+        self.assertEqual([file for file, _ in budget.truncated], [self.files[0]])
+        self.assertIn(b'[truncated ', output)
+        self.assertLessEqual(estimate_tokens(output), 300)
+        self.assertTrue(any('Truncated 1 file(s):' == line for line in budget.summary()))
+
+    def test04_smallest_priority(self):
+        """
+        smallest の優先順位ではサイズの小さい順に並ぶことを確認します。
+        """
+        ordered = order_files(self.files, 'smallest')
+        self.assertEqual(ordered, [self.files[1], self.files[2], self.files[0]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+# ./tests/test_transform.py
+
+import unittest
+import os
+import io
+import ast
+from codeaggregator.output import output_files, PASSTHROUGH_MIN_SIZE
+from codeaggregator.classify import FileClassifier
+from codeaggregator.aggregator import Aggregator
+from codeaggregator.transform import Transformer, strip_python, strip_c_comments, collapse_whitespace
+
+PYTHON_SOURCE = '''#!/usr/bin/env python
+# Copyright (c) Example
+# SPDX-License-Identifier: MIT
+
+import os  # 標準ライブラリ
+
+
+def f(x):
+    """ドキュメント
+
+    # コメントではない"""
+    return x  # 戻り値
+'''
+
+C_SOURCE = '''/*
+ * Copyright (c) Example
+ */
+#include <stdio.h> // 入出力
+#define SIZE 4 /* 複数行の
+コメント */
+int main(void) {
+    // 本文
+    const char *url = "http://example.com/* not a comment */";
+
+
+    return 0; /* 終了 */
+}
+'''
+
+class TestTransform(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時ディレクトリを作成
+        self.test_dir = 'test_env_transform'
+        os.makedirs(self.test_dir, exist_ok=True)
+
+    def tearDown(self):
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.test_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def test01_strip_python(self):
+        """
+        Python のコメントと空行を取り除き、文字列と #! 行は残し、構文木が変わらないことを確認します。
+        """
+        result = strip_python(PYTHON_SOURCE)
+        self.assertEqual(result, '#!/usr/bin/env python\nimport os\ndef f(x):\n'
+                                 '    """ドキュメント\n\n    # コメントではない"""\n    return x\n')
+        self.assertEqual(ast.dump(ast.parse(result)), ast.dump(ast.parse(PYTHON_SOURCE)))
+        # tokenize できない内容はそのまま返す
+        broken = 'def f(:\n    """閉じていない\n'
+        self.assertEqual(strip_python(broken), broken)
+
+    def test02_strip_c_comments(self):
+        """
+        C 系のコメントを取り除き、文字列リテラルの中は変更しないことを確認します。
+        """
+        result = strip_c_comments(C_SOURCE)
+        self.assertNotIn('Copyright', result)
+        self.assertNotIn('入出力', result)
+        self.assertNotIn('本文', result)
+        self.assertIn('"http://example.com/* not a comment */";\n', result)
+        # 複数行のコメントの後ろの行は #define の行とつながらない
+        self.assertIn('#define SIZE 4\n', result)
+        self.assertTrue(result.startswith('#include <stdio.h>\n'))
+        self.assertNotIn('\n\n\n', result)
+        self.assertEqual(collapse_whitespace('a  \n\n\n\nb\t\n'), 'a\n\nb\n')
+
+    def test03_process_pool_keeps_order(self):
+        """
+        プロセスプールで変換しても、バッチをまたいで出力の順序と内容が1プロセスの場合と同じになることを確認します。
+        """
+        files = []
+        for i in range(7):
+            files.append(self.write(f'm{i}.py', f'x = {i}  # {i}\n\n\n'))
+            files.append(self.write(f'm{i}.c', f'int x{i}; // {i}\n'))
+        files.append(self.write('big.py', '# comment\nvalue = 1\n' * (PASSTHROUGH_MIN_SIZE // 20 + 1)))
+        files.append(os.path.join(self.test_dir, 'missing.py'))
+        files.append(self.write('notes.txt', 'a   \n\n\n\nb\n'))
+
+        outputs = []
+        for jobs in (1, 2):
+            transformer = Transformer(['python', 'c', 'whitespace'], jobs=jobs)
+            transformer.chunk_files = 3
+            buf = io.BytesIO()
+            output_files(files, buf, loader=FileClassifier().wrap(), transformer=transformer)
+            outputs.append(buf.getvalue())
+            self.assertEqual(transformer.results['python'].files, 8)
+            self.assertEqual(transformer.results['c'].files, 7)
+            self.assertEqual(transformer.results['whitespace'].files, 1)
+            self.assertGreater(transformer.results['python'].saved_bytes, 0)
+
+        self.assertEqual(outputs[0], outputs[1])
+        text = outputs[0].decode('utf-8')
+        positions = [text.index(f"\n{file}\n") for file in files if not file.endswith('missing.py')]
+        self.assertEqual(positions, sorted(positions))
+        self.assertIn('x = 3\n', text)
+        self.assertNotIn('# comment', text)
+        self.assertIn('a\n\nb\n', text)
+
+    def test04_aggregator_transforms(self):
+        """
+        Aggregator の transforms で選んだ変換だけを適用し、変換後の本文で重複を判定することを確認します。
+        """
+        self.write('a.py', 'x = 1  # a\n')
+        self.write('b.py', 'x = 1  # a\n')
+        self.write('c.js', 'let y = 2; // c\n')
+        aggregator = Aggregator(transforms=['python'], transform_jobs=1, dedupe=True)
+        buf = io.BytesIO()
+        result = aggregator.render(self.test_dir, buf)
+
+        text = buf.getvalue().decode('utf-8')
+        self.assertIn('x = 1\n', text)
+        self.assertIn('let y = 2; // c\n', text)
+        self.assertEqual(result.dedupe.duplicates, 1)
+        self.assertEqual(result.transformer.to_dict()['python']['saved_bytes'], len('  # a') * 2)
+
+    def test05_whitespace_only_when_named(self):
+        """
+        名前を指定しない場合は whitespace を使わず、対象の変換がない大きなファイルはパススルーのまま出力することを確認します。
+        """
+        self.assertEqual([t.name for t in Transformer().transforms], ['python', 'c'])
+        big = self.write('notes.txt', 'a   \n' * (PASSTHROUGH_MIN_SIZE // 4 + 1))
+        body = FileClassifier().wrap()(big)
+        self.assertIsNone(Transformer()._task(big, body))
+        body.file.close()
+        self.assertEqual(Transformer(['whitespace']).transform_for(big).name, 'whitespace')
+
+if __name__ == '__main__':
+    unittest.main()
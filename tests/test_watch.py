@@ -0,0 +1,136 @@
+# ./tests/test_watch.py
+
+import unittest
+import os
+import time
+import threading
+from codeaggregator.finder import iter_files
+from codeaggregator.output import output_files
+from codeaggregator.watch import (
+    WatchSession, PollingWatcher, InotifyWatcher, watch, MODIFIED, STRUCTURAL,
+)
+
+def inotify_available():
+    try:
+        InotifyWatcher().close()
+    except OSError:
+        return False
+    return True
+
+class TestWatch(unittest.TestCase):
+    def setUp(self):
+        # テスト用の一時ディレクトリを作成
+        self.test_dir = 'test_env_watch'
+        self.src_dir = os.path.join(self.test_dir, 'src')
+        self.output = os.path.join(self.test_dir, 'out.txt')
+        os.makedirs(os.path.join(self.src_dir, 'pkg'), exist_ok=True)
+        os.makedirs(os.path.join(self.src_dir, 'node_modules', 'dep'), exist_ok=True)
+        self.write('pkg/a.py', 'print("a")')
+        self.write('pkg/b.py', 'print("b")')
+        self.write('node_modules/dep/index.js', 'js')
+
+    def tearDown(self):
+        # テスト用の一時ディレクトリを削除
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for dir in dirs:
+                os.rmdir(os.path.join(root, dir))
+        os.rmdir(self.test_dir)
+
+    def write(self, rel, content):
+        with open(os.path.join(self.src_dir, rel), 'w') as f:
+            f.write(content)
+
+    def walk(self, on_dir=None):
+        return iter_files(self.src_dir, ignore_patterns=['node_modules'], on_dir=on_dir)
+
+    def expected(self):
+        expected_path = os.path.join(self.test_dir, 'expected.txt')
+        output_files(self.walk(), expected_path)
+        with open(expected_path, 'rb') as f:
+            data = f.read()
+        os.remove(expected_path)
+        return data
+
+    def actual(self):
+        with open(self.output, 'rb') as f:
+            return f.read()
+
+    def test01_refresh_matches_full_output(self):
+        """
+        変更・作成・削除を反映した出力が、作り直した場合の出力と一致することを確認します。
+        """
+        session = WatchSession(self.output, self.walk)
+        session.build()
+        self.assertEqual(self.actual(), self.expected())
+        self.assertNotIn(os.path.join(self.src_dir, 'node_modules'), session.dirs)
+
+        a_path = os.path.join(self.src_dir, 'pkg', 'a.py')
+        self.write('pkg/a.py', 'print("changed")\n')
+        self.assertEqual(session.refresh([a_path]), 1)
+        self.assertEqual(self.actual(), self.expected())
+
+        self.write('pkg/c.py', 'print("c")')
+        os.remove(os.path.join(self.src_dir, 'pkg', 'b.py'))
+        self.assertEqual(session.refresh(structural=True), 1)
+        self.assertEqual(self.actual(), self.expected())
+
+    def test02_polling_watcher_events(self):
+        """
+        ポーリングのウォッチャーが変更と作成を検出することを確認します。
+        """
+        watcher = PollingWatcher(interval=0.01)
+        pkg = os.path.join(self.src_dir, 'pkg')
+        watcher.sync([pkg])
+        self.write('pkg/a.py', 'print("a longer body")')
+        self.write('pkg/new.py', 'new')
+        events = watcher.wait(0.01)
+        self.assertIn((MODIFIED, os.path.join(pkg, 'a.py')), events)
+        self.assertIn((STRUCTURAL, os.path.join(pkg, 'new.py')), events)
+        self.assertEqual(watcher.wait(0.01), [])
+
+    @unittest.skipUnless(inotify_available(), 'inotify が必要です')
+    def test03_inotify_watcher_events(self):
+        """
+        inotify のウォッチャーが監視対象のディレクトリの変更だけを報告することを確認します。
+        """
+        watcher = InotifyWatcher()
+        try:
+            pkg = os.path.join(self.src_dir, 'pkg')
+            watcher.sync([self.src_dir, pkg])
+            self.assertEqual(watcher.watched, {self.src_dir, pkg})
+            self.write('node_modules/dep/index.js', 'changed')
+            self.write('pkg/a.py', 'changed')
+            events = watcher.wait(1.0)
+            self.assertIn((MODIFIED, os.path.join(pkg, 'a.py')), events)
+            self.assertFalse(any('node_modules' in path for _, path in events))
+        finally:
+            watcher.close()
+
+    def test04_watch_loop(self):
+        """
+        watch がファイルの変更を検出して出力を更新し、stop で終了することを確認します。
+        """
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=watch, args=(self.output, self.walk),
+            kwargs={'debounce': 0.05, 'poll_interval': 0.05, 'stop': stop},
+        )
+        thread.start()
+        try:
+            deadline = time.time() + 5
+            while not os.path.exists(self.output) and time.time() < deadline:
+                time.sleep(0.02)
+            self.write('pkg/b.py', 'print("b was edited")')
+            expected = self.expected()
+            while self.actual() != expected and time.time() < deadline:
+                time.sleep(0.02)
+            self.assertEqual(self.actual(), expected)
+        finally:
+            stop.set()
+            thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+if __name__ == '__main__':
+    unittest.main()